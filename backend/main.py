@@ -1,18 +1,45 @@
 # main.py
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field
-from typing import List, Optional
-from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Tuple
+from datetime import date as date_type, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from bson import ObjectId
+from pymongo import CursorType, ReturnDocument, UpdateOne
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+import asyncio
+import bisect
+import calendar
+import codecs
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import mmap
 import os
+import random
+import re
+import resource
+import selectors
+import shutil
+import signal
+import socket
+import sys
+import time
 import subprocess
 import tempfile
+import threading
+import uuid
 from dotenv import load_dotenv
 import google.generativeai as genai
 
@@ -45,6 +72,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After", "X-Next-Cursor"],
 )
 
 # MongoDB connection
@@ -68,6 +96,12 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 # Pydantic models - simplified ObjectId handling
 PyObjectId = str
 
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timezone-aware datetimes (e.g. parsed from "...Z") as the naive UTC that is stored"""
+    if value is not None and value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 def convert_objectids_to_strings(document):
     """Convert all ObjectId fields in a document to strings for Pydantic compatibility"""
     if document is None:
@@ -153,12 +187,16 @@ class ChallengeBase(BaseModel):
     time_limit: Optional[int] = 60
     tags: Optional[List[str]] = []
     test_cases: Optional[List[dict]] = []
+    checker: Optional[dict] = None  # {"type": exact|tokens|float|script, "tolerance"?, "script"?}; default exact
+    cpu_limit: Optional[float] = None  # CPU seconds per test case; JUDGE_CPU_LIMIT if unset
+    is_contest: Optional[bool] = False  # Contest submissions are judged ahead of practice
     points: int
 
 class Challenge(ChallengeBase):
     id: str = Field(alias="_id")
     created_at: datetime = Field(default_factory=datetime.utcnow)
     created_by: Optional[str] = None
+    stats: Optional[dict] = None
 
     model_config = {
         "populate_by_name": True,
@@ -186,6 +224,13 @@ class Submission(SubmissionBase):
     }
 
 # Event models
+class RecurrenceRule(BaseModel):
+    freq: str  # daily, weekly, monthly, yearly
+    interval: int = 1  # Every N days/weeks/months/years
+    by_weekday: Optional[List[int]] = None  # Weekly only: 0 = Monday ... 6 = Sunday
+    until: Optional[str] = None  # Last possible date (YYYY-MM-DD), inclusive
+    count: Optional[int] = None  # Or a fixed number of occurrences
+
 class EventBase(BaseModel):
     title: str
     description: Optional[str] = ""
@@ -195,10 +240,20 @@ class EventBase(BaseModel):
     priority: str = "medium"  # low, medium, high, urgent
     all_day: bool = False
     reminder_minutes: int = 15
+    end: Optional[datetime] = None  # Optional end of the event
+    recurrence: Optional[RecurrenceRule] = None  # Repeat rule; the series is stored once
+    timezone: Optional[str] = None  # IANA zone date/time are in; None means UTC
 
 class Event(EventBase):
     id: str = Field(alias="_id")
     user_id: str
+    start: Optional[datetime] = None  # Derived from date + time, used for range queries
+    start_invalid: bool = False  # Legacy date/time strings that couldn't be parsed
+    series_end: Optional[datetime] = None  # Start of the last occurrence, None if open-ended
+    exdates: Optional[List[str]] = None  # Cancelled occurrence dates
+    overrides: Optional[dict] = None  # Occurrence date -> changed fields
+    series_id: Optional[str] = None  # Set on expanded occurrences
+    occurrence_date: Optional[str] = None  # Set on expanded occurrences
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = None
 
@@ -217,6 +272,17 @@ class EventUpdate(BaseModel):
     priority: Optional[str] = None
     all_day: Optional[bool] = None
     reminder_minutes: Optional[int] = None
+    end: Optional[datetime] = None
+    recurrence: Optional[RecurrenceRule] = None
+    timezone: Optional[str] = None
+
+class EventOccurrenceException(BaseModel):
+    date: str  # Occurrence date (YYYY-MM-DD)
+    cancelled: bool = False  # Skip this occurrence entirely
+    title: Optional[str] = None
+    description: Optional[str] = None
+    time: Optional[str] = None
+    priority: Optional[str] = None
 
 # Admin Event models (global events visible to all users)
 class AdminEventBase(BaseModel):
@@ -229,10 +295,13 @@ class AdminEventBase(BaseModel):
     all_day: bool = False
     target_users: Optional[List[str]] = []  # Empty list means all users, or specific user IDs
     is_public: bool = True  # Whether event is visible to all users
+    end: Optional[datetime] = None  # Optional end of the event
 
 class AdminEvent(AdminEventBase):
     id: str = Field(alias="_id")
     created_by: str  # Admin user ID
+    start: Optional[datetime] = None  # Derived from date + time, used for range queries
+    start_invalid: bool = False  # Legacy date/time strings that couldn't be parsed
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = None
 
@@ -252,6 +321,7 @@ class AdminEventUpdate(BaseModel):
     all_day: Optional[bool] = None
     target_users: Optional[List[str]] = None
     is_public: Optional[bool] = None
+    end: Optional[datetime] = None
 
 # Helper functions
 def verify_password(plain_password, hashed_password):
@@ -690,13 +760,27 @@ async def admin_list_all_challenges(
 async def admin_update_challenge(
     challenge_id: str,
     challenge_update: ChallengeBase,
-    admin_user: User = Depends(get_admin_user)
+    admin_user: User = Depends(get_admin_user),
+    rejudge: bool = False
 ):
-    """Admin endpoint to update any challenge"""
+    """Admin endpoint to update any challenge. With rejudge=true, new test cases also
+    queue a rejudge of the existing submissions (see /admin/jobs)."""
     if not ObjectId.is_valid(challenge_id):
         raise HTTPException(status_code=400, detail="Invalid challenge ID")
     
     update_data = challenge_update.dict()
+    validate_checker(update_data["checker"])
+    validate_cpu_limit(update_data["cpu_limit"])
+    validate_test_cases(update_data["test_cases"])
+    # Clients that don't send judging settings or test cases (like the admin form) must not reset them
+    sent_fields = challenge_update.dict(exclude_unset=True)
+    for field in ["checker", "cpu_limit", "is_contest"]:
+        if field not in sent_fields:
+            del update_data[field]
+    if "test_cases" in sent_fields:
+        update_data["test_cases"] = await externalize_test_cases(update_data["test_cases"])
+    else:
+        del update_data["test_cases"]
     result = await db.challenges.update_one(
         {"_id": ObjectId(challenge_id)},
         {"$set": update_data}
@@ -704,6 +788,8 @@ async def admin_update_challenge(
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Challenge not found")
+    if rejudge and "test_cases" in sent_fields:
+        await create_admin_job("rejudge", {"challenge_id": ObjectId(challenge_id)}, admin_user)
     
     updated_challenge = await db.challenges.find_one({"_id": ObjectId(challenge_id)})
     return updated_challenge
@@ -713,19 +799,24 @@ async def admin_delete_challenge(
     challenge_id: str,
     admin_user: User = Depends(get_admin_user)
 ):
-    """Admin endpoint to delete any challenge"""
+    """Admin endpoint to delete any challenge. Its submissions, and the points and
+    completed_challenges entries of its solvers, are cleaned up by an admin job."""
     if not ObjectId.is_valid(challenge_id):
         raise HTTPException(status_code=400, detail="Invalid challenge ID")
     
-    result = await db.challenges.delete_one({"_id": ObjectId(challenge_id)})
+    challenge = await db.challenges.find_one_and_delete({"_id": ObjectId(challenge_id)}, {"_id": 1})
     
-    if result.deleted_count == 0:
+    if not challenge:
         raise HTTPException(status_code=404, detail="Challenge not found")
     
-    # Also delete related submissions
-    await db.submissions.delete_many({"challenge_id": ObjectId(challenge_id)})
+    # Related submissions and awarded points go in batches in the background
+    job = await create_admin_job(
+        "delete_challenge",
+        {"challenge_id": challenge["_id"]},
+        admin_user
+    )
     
-    return {"message": "Challenge and related submissions deleted successfully"}
+    return {"message": "Challenge deleted; related submissions are being removed", "job_id": str(job["_id"])}
 
 @app.get("/admin/submissions/", response_model=List[Submission])
 async def admin_list_all_submissions(
@@ -780,8 +871,13 @@ async def admin_create_challenge(
     admin_user: User = Depends(get_admin_user)
 ):
     """Admin endpoint to create a new challenge"""
+    validate_checker(challenge_data.checker)
+    validate_cpu_limit(challenge_data.cpu_limit)
+    validate_test_cases(challenge_data.test_cases)
     try:
         challenge_dict = challenge_data.dict()
+        challenge_dict["test_cases"] = await externalize_test_cases(challenge_dict["test_cases"])
+        challenge_dict["test_data_externalized"] = True
         challenge_dict["created_at"] = datetime.utcnow()
         challenge_dict["created_by"] = ObjectId(admin_user.id) if admin_user.id else None
         
@@ -800,12 +896,291 @@ async def admin_create_challenge(
         print(f"Challenge creation error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Could not create challenge: {str(e)}")
 
+# Challenge statistics
+# Counters and a runtime t-digest are kept on the challenge document itself under
+# "stats" and updated incrementally by create_submission, so listing challenges
+# never has to look at submissions.
+CHALLENGE_STATS_COMPRESSION = 50
+CHALLENGE_STATS_MAX_RETRIES = 3
+CHALLENGE_LIST_PROJECTION = {"stats.runtime_digest": 0, "test_cases": 0}
+
+class TDigest:
+    """Mergeable t-digest sketch for streaming quantile estimates.
+
+    Centroids are stored as [mean, weight] pairs sorted by mean so the sketch can be
+    persisted as a plain list and merged with other digests.
+    """
+
+    def __init__(self, centroids: Optional[List[list]] = None, compression: int = CHALLENGE_STATS_COMPRESSION):
+        self.compression = compression
+        self.centroids = sorted([float(mean), float(weight)] for mean, weight in (centroids or []))
+
+    @property
+    def count(self) -> float:
+        return sum(weight for _, weight in self.centroids)
+
+    def add(self, value: float, weight: float = 1.0):
+        self.centroids.append([float(value), float(weight)])
+        self._compress()
+
+    def merge(self, other: "TDigest"):
+        self.centroids.extend([mean, weight] for mean, weight in other.centroids)
+        self._compress()
+
+    def _compress(self):
+        centroids = sorted(self.centroids)
+        total = sum(weight for _, weight in centroids)
+        if not centroids:
+            return
+
+        merged = [list(centroids[0])]
+        cumulative = 0.0
+        for mean, weight in centroids[1:]:
+            last = merged[-1]
+            # Centroids near the median may grow large, the tails stay precise
+            q = (cumulative + last[1] + weight / 2) / total
+            if last[1] + weight <= 4 * total * q * (1 - q) / self.compression:
+                last[0] += (mean - last[0]) * weight / (last[1] + weight)
+                last[1] += weight
+            else:
+                cumulative += last[1]
+                merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        target = q * self.count
+        cumulative = 0.0
+        for i, (mean, weight) in enumerate(self.centroids):
+            if cumulative + weight / 2 >= target:
+                if i == 0:
+                    return mean
+                # Interpolate between the centers of neighbouring centroids
+                prev_mean, prev_weight = self.centroids[i - 1]
+                prev_center = cumulative - prev_weight / 2
+                center = cumulative + weight / 2
+                return prev_mean + (mean - prev_mean) * (target - prev_center) / (center - prev_center)
+            cumulative += weight
+        return self.centroids[-1][0]
+
+def summarize_challenge_stats(stats: Optional[dict]) -> dict:
+    """Public view of a challenge's stored statistics"""
+    stats = stats or {}
+    attempts = stats.get("attempts", 0)
+    accepted = stats.get("accepted", 0)
+    return {
+        "attempts": attempts,
+        "accepted": accepted,
+        "unique_solvers": stats.get("unique_solvers", 0),
+        "acceptance_rate": round(accepted / attempts * 100, 1) if attempts else 0,
+        "median_runtime": stats.get("median_runtime"),
+        "p90_runtime": stats.get("p90_runtime")
+    }
+
+async def update_challenge_stats(challenge: dict, accepted: bool, first_solve: bool, runtime: float):
+    """Incrementally fold one submission into the challenge's statistics"""
+    counters = {
+        "stats.attempts": 1,
+        "stats.accepted": 1 if accepted else 0,
+        "stats.unique_solvers": 1 if first_solve else 0
+    }
+    try:
+        if not accepted:
+            await db.challenges.update_one({"_id": challenge["_id"]}, {"$inc": counters})
+            return
+
+        # Runtime percentiles only consider accepted solutions. The digest is a
+        # read-modify-write, guarded by a version check and retried on conflict.
+        stats = challenge.get("stats") or {}
+        for _ in range(CHALLENGE_STATS_MAX_RETRIES):
+            version = stats.get("digest_version")
+            digest = TDigest(stats.get("runtime_digest"))
+            digest.add(runtime)
+            result = await db.challenges.update_one(
+                {"_id": challenge["_id"], "stats.digest_version": version},
+                {
+                    "$inc": counters,
+                    "$set": {
+                        "stats.runtime_digest": digest.centroids,
+                        "stats.digest_version": (version or 0) + 1,
+                        "stats.median_runtime": round(digest.quantile(0.5), 4),
+                        "stats.p90_runtime": round(digest.quantile(0.9), 4)
+                    }
+                }
+            )
+            if result.matched_count:
+                return
+            refreshed = await db.challenges.find_one({"_id": challenge["_id"]}, {"stats": 1})
+            if not refreshed:
+                return
+            stats = refreshed.get("stats") or {}
+
+        # Give up on the sample under heavy contention but keep the counters exact
+        await db.challenges.update_one({"_id": challenge["_id"]}, {"$inc": counters})
+    except Exception as e:
+        print(f"Challenge stats error: {str(e)}")
+
+# Test data storage
+# Test case inputs and expected outputs above TEST_CASE_INLINE_LIMIT bytes live outside
+# the challenge document, in a content-addressed store keyed by sha256. The challenge
+# keeps {"input_ref", "input_size"} (and the same for expected_output) instead. Blobs
+# are files under TEST_DATA_DIR; with TEST_DATA_GRIDFS on they are also written to
+# GridFS and the directory becomes a per-host cache filled on demand. Judging maps the
+# files into memory and streams them into the child, so RAM use doesn't grow with size.
+TEST_DATA_DIR = os.getenv("TEST_DATA_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data")
+TEST_DATA_GRIDFS = os.getenv("TEST_DATA_GRIDFS", "false").lower() == "true"
+TEST_CASE_INLINE_LIMIT = int(os.getenv("TEST_CASE_INLINE_LIMIT", str(16 * 1024)))
+TEST_CASE_PREVIEW_SIZE = 1024
+TEST_CASE_FIELDS = ["input", "expected_output"]
+
+class TestDataStore:
+    """Content-addressed blob store on local disk, optionally backed by GridFS"""
+
+    def __init__(self, root: str, use_gridfs: bool):
+        self.root = root
+        self.use_gridfs = use_gridfs
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def bucket(self) -> AsyncIOMotorGridFSBucket:
+        return AsyncIOMotorGridFSBucket(db, bucket_name="test_data")
+
+    def _write_local(self, digest: str, data: bytes):
+        path = self.path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so readers never see a partial blob
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as blob:
+            blob.write(data)
+        os.replace(temp_path, path)
+
+    async def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        await asyncio.to_thread(self._write_local, digest, data)
+        if self.use_gridfs and not await db.test_data.files.find_one({"filename": digest}, {"_id": 1}):
+            await self.bucket().upload_from_stream(digest, data)
+        return digest
+
+    async def ensure_local(self, digest: str) -> str:
+        """Local path of a blob, fetching it from GridFS into the cache if needed"""
+        path = self.path(digest)
+        if not await asyncio.to_thread(os.path.exists, path):
+            if not self.use_gridfs:
+                raise FileNotFoundError(f"Test data {digest} is missing")
+            stream = await self.bucket().open_download_stream_by_name(digest)
+            await asyncio.to_thread(self._write_local, digest, await stream.read())
+        return path
+
+    def open(self, digest: str):
+        """Read-only memory map of a local blob (bytes for empty blobs, which can't be mapped)"""
+        with open(self.path(digest), "rb") as blob:
+            if os.fstat(blob.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(blob.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def preview(self, digest: str) -> str:
+        with open(self.path(digest), "rb") as blob:
+            head = blob.read(TEST_CASE_PREVIEW_SIZE + 1)
+        text = head[:TEST_CASE_PREVIEW_SIZE].decode("utf-8", errors="replace")
+        return text + "\n... (truncated)" if len(head) > TEST_CASE_PREVIEW_SIZE else text
+
+test_data_store = TestDataStore(TEST_DATA_DIR, TEST_DATA_GRIDFS)
+
+async def externalize_test_cases(test_cases: Optional[List[dict]]) -> List[dict]:
+    """Move large test case fields into the test data store, leaving references"""
+    externalized = []
+    for test_case in test_cases or []:
+        test_case = dict(test_case)
+        for field in TEST_CASE_FIELDS:
+            value = test_case.get(field)
+            if isinstance(value, str) and len(value) > TEST_CASE_INLINE_LIMIT:
+                data = value.encode()
+                test_case[f"{field}_ref"] = await test_data_store.put(data)
+                test_case[f"{field}_size"] = len(data)
+                del test_case[field]
+        externalized.append(test_case)
+    return externalized
+
+async def fetch_test_data(test_cases: List[dict]):
+    """Make sure the stored blobs of these test cases are on local disk"""
+    for test_case in test_cases:
+        for field in TEST_CASE_FIELDS:
+            digest = test_case.get(f"{field}_ref")
+            if digest:
+                try:
+                    await test_data_store.ensure_local(digest)
+                except Exception as e:
+                    # Judging reports the missing blob against its test case
+                    print(f"Error fetching test data {digest}: {str(e)}")
+
+def open_test_case_field(test_case: dict, field: str):
+    """(data, digest) for judging: a memory map for stored blobs, the text otherwise.
+    Release it with close_test_case_data."""
+    digest = test_case.get(f"{field}_ref")
+    if digest:
+        return test_data_store.open(digest), digest
+    return test_case.get(field), None
+
+def close_test_case_data(*fields):
+    for data in fields:
+        if isinstance(data, mmap.mmap):
+            try:
+                data.close()
+            except BufferError:
+                pass  # Something still holds a view of it; unmapped once that is collected
+
+async def preview_test_cases(test_cases: Optional[List[dict]]) -> List[dict]:
+    """Test cases for display, with stored blobs shown as a truncated preview"""
+    previews = []
+    for test_case in test_cases or []:
+        test_case = dict(test_case)
+        for field in TEST_CASE_FIELDS:
+            digest = test_case.get(f"{field}_ref")
+            if digest:
+                try:
+                    await test_data_store.ensure_local(digest)
+                    test_case[field] = await asyncio.to_thread(test_data_store.preview, digest)
+                except Exception:
+                    test_case[field] = f"({test_case.get(f'{field}_size', 0)} bytes)"
+        previews.append(test_case)
+    return previews
+
+@app.on_event("startup")
+async def migrate_inline_test_data():
+    """Externalize large inline test cases on challenges saved before the store existed"""
+    try:
+        migrated = 0
+        cursor = db.challenges.find({"test_data_externalized": {"$exists": False}}, {"test_cases": 1})
+        async for challenge in cursor:
+            test_cases = await externalize_test_cases(challenge.get("test_cases"))
+            update = {"test_data_externalized": True}
+            if test_cases != (challenge.get("test_cases") or []):
+                update["test_cases"] = test_cases
+                migrated += 1
+            await db.challenges.update_one({"_id": challenge["_id"]}, {"$set": update})
+        if migrated:
+            print(f"Moved large test cases of {migrated} challenges to the test data store")
+    except Exception as e:
+        print(f"Error migrating test data: {str(e)}")
+
 # Challenge Endpoints
 @app.post("/challenges/", response_model=Challenge)
 async def create_challenge(
     challenge: ChallengeBase, current_user: User = Depends(get_current_active_user)
 ):
+    validate_checker(challenge.checker)
+    validate_cpu_limit(challenge.cpu_limit)
+    validate_test_cases(challenge.test_cases)
     challenge_dict = challenge.dict()
+    challenge_dict["test_cases"] = await externalize_test_cases(challenge_dict["test_cases"])
+    challenge_dict["test_data_externalized"] = True
     challenge_dict["created_at"] = datetime.utcnow()
     challenge_dict["created_by"] = current_user.id
     
@@ -826,10 +1201,13 @@ async def list_challenges(
     if difficulty:
         query["difficulty"] = difficulty
         
-    challenges = await db.challenges.find(query).skip(skip).limit(limit).to_list(limit)
+    # Stats live on the challenge document, so they come back with the page itself
+    challenges = await db.challenges.find(query, CHALLENGE_LIST_PROJECTION).skip(skip).limit(limit).to_list(limit)
     
     # Convert all ObjectId fields to strings for Pydantic compatibility
     processed_challenges = convert_objectids_to_strings(challenges)
+    for challenge in processed_challenges:
+        challenge["stats"] = summarize_challenge_stats(challenge.get("stats"))
     
     return processed_challenges
 
@@ -844,14 +1222,846 @@ async def get_challenge(challenge_id: str):
     
     # Convert all ObjectId fields to strings for Pydantic compatibility
     processed_challenge = convert_objectids_to_strings(challenge)
+    processed_challenge["stats"] = summarize_challenge_stats(processed_challenge.get("stats"))
+    processed_challenge["test_cases"] = await preview_test_cases(processed_challenge.get("test_cases"))
     
     return processed_challenge
 
+# Submission deduplication
+# Before judging, a submission claims its keys in db.submission_claims: the client's
+# Idempotency-Key (kept IDEMPOTENCY_KEY_TTL_HOURS) and a hash of (user, challenge,
+# language, code) (kept SUBMISSION_DEDUP_SECONDS). A request that finds a key already
+# claimed waits for that submission and returns it instead of judging again, so
+# retries and double clicks cost one judge run.
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+SUBMISSION_DEDUP_SECONDS = int(os.getenv("SUBMISSION_DEDUP_SECONDS", "60"))
+SUBMISSION_CLAIM_WAIT_SECONDS = 60
+SUBMISSION_CLAIM_POLL_SECONDS = 0.25
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+def submission_claims(user_id, challenge_id, submission: SubmissionBase, idempotency_key: Optional[str]) -> List[dict]:
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+    now = datetime.utcnow()
+    code_hash = hashlib.sha256(f"{submission.language}\0{submission.code}".encode()).hexdigest()
+    fingerprint = f"{challenge_id}:{code_hash}"
+    claims = []
+    if idempotency_key:
+        claims.append({"_id": f"key:{user_id}:{idempotency_key}", "expires_at": now + timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS)})
+    claims.append({"_id": f"code:{user_id}:{fingerprint}", "expires_at": now + timedelta(seconds=SUBMISSION_DEDUP_SECONDS)})
+    owner = uuid.uuid4().hex
+    for claim in claims:
+        claim.update(owner=owner, fingerprint=fingerprint, submission_id=None, created_at=now)
+    return claims
+
+async def take_submission_claims(claims: List[dict]) -> Optional[dict]:
+    """Insert every claim; on a conflict, roll back ours and return the claim in the way"""
+    taken = []
+    for claim in claims:
+        while True:
+            try:
+                await db.submission_claims.insert_one(dict(claim))
+                break
+            except DuplicateKeyError:
+                # TTL deletion is lazy, so an expired claim may still be there; take it over
+                expired = await db.submission_claims.find_one_and_replace(
+                    {"_id": claim["_id"], "expires_at": {"$lte": datetime.utcnow()}},
+                    dict(claim)
+                )
+                if expired:
+                    break
+                held = await db.submission_claims.find_one({"_id": claim["_id"]})
+                if held:
+                    await release_submission_claims(taken)
+                    return held
+                # Released in the meantime; try again
+        taken.append(claim)
+    return None
+
+async def release_submission_claims(claims: List[dict]):
+    """Drop our claims after a failed attempt, letting the next one judge afresh"""
+    if claims:
+        await db.submission_claims.delete_many({
+            "_id": {"$in": [claim["_id"] for claim in claims]},
+            "owner": claims[0]["owner"]
+        })
+
+async def complete_submission_claims(claims: List[dict], submission_id: ObjectId):
+    await db.submission_claims.update_many(
+        {"_id": {"$in": [claim["_id"] for claim in claims]}, "owner": claims[0]["owner"]},
+        {"$set": {"submission_id": submission_id}}
+    )
+
+async def claim_submission(claims: List[dict], wait_for_verdict: bool) -> Optional[dict]:
+    """Claim the keys of a new submission.
+
+    Returns None when this request holds every claim and should judge. Otherwise
+    returns the submission that holds them, once judged if wait_for_verdict is set.
+    """
+    deadline = time.monotonic() + SUBMISSION_CLAIM_WAIT_SECONDS
+    while True:
+        held = await take_submission_claims(claims)
+        if held is None:
+            return None
+        if held["fingerprint"] != claims[0]["fingerprint"]:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different submission")
+        if held.get("submission_id"):
+            existing = await db.submissions.find_one({"_id": held["submission_id"]})
+            if existing and (existing["status"] != "Pending" or not wait_for_verdict):
+                return existing
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=409, detail="An identical submission is still being judged")
+        await asyncio.sleep(SUBMISSION_CLAIM_POLL_SECONDS)
+
+@app.on_event("startup")
+async def create_submission_claim_indexes():
+    try:
+        await db.submission_claims.create_index("expires_at", expireAfterSeconds=0)
+    except Exception as e:
+        print(f"Error creating submission claim indexes: {str(e)}")
+
+# Judge jobs
+# Submissions are stored as "Pending" first and judged either in this process
+# (JUDGE_MODE=local, the default) or by judge workers (JUDGE_MODE=remote, started with
+# `python main.py judge`). Remote jobs live in db.judge_jobs. A worker leases one with
+# a single find_one_and_update and extends the lease while judging. If the worker dies,
+# its lease expires and another worker picks the job up, up to JUDGE_MAX_ATTEMPTS times.
+# Finalizing only applies to a still-pending submission, so a late duplicate verdict is
+# dropped. Workers read test data through GridFS, so remote mode needs TEST_DATA_GRIDFS.
+JUDGE_MODE = os.getenv("JUDGE_MODE", "local")
+JUDGE_LEASE_SECONDS = int(os.getenv("JUDGE_LEASE_SECONDS", "30"))
+JUDGE_POLL_SECONDS = float(os.getenv("JUDGE_POLL_SECONDS", "0.5"))
+JUDGE_REMOTE_QUEUE_LIMIT = int(os.getenv("JUDGE_REMOTE_QUEUE_LIMIT", "1000"))
+JUDGE_MAX_ATTEMPTS = 3
+JUDGE_JOB_TTL_HOURS = 24
+
+NO_TEST_CASES_ERROR = "This challenge has no test cases configured"
+
+def submission_lane(challenge: dict) -> str:
+    return "contest" if challenge.get("is_contest") else "practice"
+
+async def run_judge(submission: dict, challenge: dict, user: Optional[str] = None,
+                    lane: Optional[str] = None, publish: bool = True) -> dict:
+    """Judge a submission on this process's judge pool; returns judge_submission's verdict.
+    The job is queued as the submitting user in the challenge's lane unless told otherwise,
+    and publishes per-case progress unless publish is off."""
+    test_cases = challenge.get("test_cases")
+    if not test_cases:
+        # With nothing to compare against, any program that runs would pass
+        raise ValueError(NO_TEST_CASES_ERROR)
+    # Large test data is fetched first so the judge thread only has to map it
+    shown_cases = await preview_test_cases(test_cases)
+    await fetch_test_data(test_cases)
+    loop = asyncio.get_running_loop()
+
+    def on_case(test_result: dict):
+        # Called on the judge thread
+        event = {"type": "case", "total": len(test_cases), "result": test_result}
+        asyncio.run_coroutine_threadsafe(publish_submission_event(submission["_id"], event), loop)
+
+    return await judge_pool.run(
+        judge_submission, submission["language"], submission["code"], test_cases, shown_cases,
+        challenge.get("checker"), challenge.get("cpu_limit") or JUDGE_CPU_LIMIT, on_case if publish else None,
+        user=user or str(submission["user_id"]),
+        lane=lane or submission_lane(challenge),
+        cost=len(test_cases)
+    )
+
+async def finalize_submission(submission: dict, challenge: dict, verdict: dict) -> Optional[dict]:
+    """Record the verdict of a pending submission, award first-solve points and feed
+    analytics and challenge stats. Returns None if it was already finalized."""
+    all_tests_passed = verdict["all_tests_passed"]
+    finalized = await db.submissions.find_one_and_update(
+        {"_id": submission["_id"], "status": "Pending"},
+        {"$set": {
+            "status": "Completed" if all_tests_passed else "Failed",
+            "execution_time": verdict["execution_time"],
+            "test_results": verdict["test_results"],
+            "judged_at": datetime.utcnow()
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+    if not finalized:
+        return None
+
+    # Award points on the first solve only. The check and the award are one update,
+    # so concurrent solves can't both pass the check.
+    first_solve = False
+    if all_tests_passed:
+        award = await db.users.update_one(
+            {"_id": submission["user_id"], "completed_challenges": {"$nin": [challenge["_id"], str(challenge["_id"])]}},
+            {
+                "$inc": {"points": challenge["points"]},
+                "$addToSet": {"completed_challenges": challenge["_id"]}
+            }
+        )
+        first_solve = award.modified_count == 1
+    if first_solve:
+        finalized["points_earned"] = challenge["points"]
+        await db.submissions.update_one({"_id": submission["_id"]}, {"$set": {"points_earned": challenge["points"]}})
+
+    # Feed the analytics event stream
+    await record_submission_event(finalized)
+
+    # Update per-challenge difficulty signals
+    await update_challenge_stats(challenge, all_tests_passed, first_solve, verdict["execution_time"])
+    await publish_submission_event(submission["_id"], {"type": "verdict", "submission": finalized})
+    return finalized
+
+async def fail_submission(submission_id: ObjectId, error: str):
+    failed = await db.submissions.find_one_and_update(
+        {"_id": submission_id, "status": "Pending"},
+        {"$set": {"status": "Failed", "error": error, "judged_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if failed:
+        await publish_submission_event(submission_id, {"type": "verdict", "submission": failed})
+
+# Local judging for clients that don't wait for the verdict; kept so tasks aren't collected
+background_judgings = set()
+
+async def judge_in_background(submission: dict, challenge: dict):
+    try:
+        # Admitted when it was submitted, but the queue can fill up while test data is
+        # fetched; an accepted submission waits its turn instead of failing
+        while True:
+            try:
+                verdict = await run_judge(submission, challenge)
+                break
+            except JudgeBusyError as busy:
+                await asyncio.sleep(busy.retry_after)
+        await finalize_submission(submission, challenge, verdict)
+    except Exception as e:
+        print(f"Background judging error: {str(e)}")
+        await fail_submission(submission["_id"], "Judging failed")
+
+async def enqueue_judge_job(submission: dict, challenge: dict):
+    user_id = submission["user_id"]
+    if await db.judge_jobs.count_documents({"status": "queued"}) >= JUDGE_REMOTE_QUEUE_LIMIT or \
+            await db.judge_jobs.count_documents({"status": "queued", "user_id": user_id}) >= JUDGE_USER_QUEUE_LIMIT:
+        raise JudgeBusyError(JUDGE_REMOTE_QUEUE_LIMIT, JUDGE_LEASE_SECONDS)
+    lane = submission_lane(challenge)
+    await db.judge_jobs.insert_one({
+        "submission_id": submission["_id"],
+        "challenge_id": challenge["_id"],
+        "user_id": user_id,
+        "lane": lane,
+        "priority": JUDGE_LANES.index(lane),
+        "status": "queued",
+        "attempts": 0,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "created_at": datetime.utcnow()
+    })
+
+async def lease_judge_job(worker_id: str) -> Optional[dict]:
+    """Take the next queued job, or one whose worker stopped renewing its lease"""
+    now = datetime.utcnow()
+    return await db.judge_jobs.find_one_and_update(
+        {"$or": [{"status": "queued"}, {"status": "running", "lease_expires_at": {"$lt": now}}]},
+        {
+            "$set": {"status": "running", "lease_owner": worker_id, "lease_expires_at": now + timedelta(seconds=JUDGE_LEASE_SECONDS)},
+            "$inc": {"attempts": 1}
+        },
+        sort=[("priority", 1), ("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def keep_judge_lease(job: dict, worker_id: str):
+    """Heartbeat: renew the lease until cancelled, or until another worker has taken it"""
+    while True:
+        await asyncio.sleep(JUDGE_LEASE_SECONDS / 3)
+        renewed = await db.judge_jobs.update_one(
+            {"_id": job["_id"], "lease_owner": worker_id, "status": "running"},
+            {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=JUDGE_LEASE_SECONDS)}}
+        )
+        if not renewed.matched_count:
+            print(f"Judge worker {worker_id} lost the lease on job {job['_id']}")
+            return
+
+async def finish_judge_job(job: dict, worker_id: str, status: str):
+    await db.judge_jobs.update_one(
+        {"_id": job["_id"], "lease_owner": worker_id},
+        {"$set": {"status": status, "finished_at": datetime.utcnow()}}
+    )
+
+async def process_judge_job(job: dict, worker_id: str):
+    submission = await db.submissions.find_one({"_id": job["submission_id"]})
+    challenge = await db.challenges.find_one({"_id": job["challenge_id"]})
+    if not submission or submission.get("status") != "Pending":
+        await finish_judge_job(job, worker_id, "done")
+        return
+    error = None
+    if not challenge:
+        error = "Challenge not found"
+    elif not challenge.get("test_cases"):
+        error = NO_TEST_CASES_ERROR
+    elif job["attempts"] > JUDGE_MAX_ATTEMPTS:
+        error = "Judging failed repeatedly"
+    if error:
+        await fail_submission(submission["_id"], error)
+        await finish_judge_job(job, worker_id, "failed")
+        return
+
+    heartbeat = asyncio.create_task(keep_judge_lease(job, worker_id))
+    try:
+        verdict = await run_judge(submission, challenge)
+    except Exception as e:
+        print(f"Judge worker {worker_id} failed on job {job['_id']}: {str(e)}")
+        # Back in the queue for another attempt
+        await db.judge_jobs.update_one(
+            {"_id": job["_id"], "lease_owner": worker_id},
+            {"$set": {"status": "queued", "lease_owner": None, "lease_expires_at": None}}
+        )
+        return
+    finally:
+        heartbeat.cancel()
+    await finalize_submission(submission, challenge, verdict)
+    await finish_judge_job(job, worker_id, "done")
+
+async def judge_worker_slot(worker_id: str):
+    while True:
+        try:
+            job = await lease_judge_job(worker_id)
+            if job:
+                await process_judge_job(job, worker_id)
+            else:
+                await asyncio.sleep(JUDGE_POLL_SECONDS)
+        except Exception as e:
+            print(f"Judge worker {worker_id} error: {str(e)}")
+            await asyncio.sleep(JUDGE_POLL_SECONDS)
+
+def require_shared_test_data():
+    if not TEST_DATA_GRIDFS:
+        raise RuntimeError(
+            "Remote judging needs TEST_DATA_GRIDFS=true: without it test data is only "
+            "written to the API host's disk, where judge workers can't read it"
+        )
+
+async def create_judge_job_indexes():
+    await db.judge_jobs.create_index([("status", 1), ("priority", 1), ("created_at", 1)])
+    await db.judge_jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+    await db.judge_jobs.create_index([("status", 1), ("user_id", 1)])
+    await db.judge_jobs.create_index("finished_at", expireAfterSeconds=JUDGE_JOB_TTL_HOURS * 3600)
+
+async def run_judge_worker():
+    """Entry point of `python main.py judge`: judge JUDGE_WORKERS jobs at a time, and run
+    admin jobs, forever"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    require_shared_test_data()
+    require_sandbox_process_limit()
+    await create_judge_job_indexes()
+    await create_submission_events_collection()
+    print(f"Judge worker {worker_id} started with {JUDGE_WORKERS} slots")
+    await asyncio.gather(run_admin_jobs(worker_id), *(judge_worker_slot(worker_id) for _ in range(JUDGE_WORKERS)))
+
+@app.on_event("startup")
+async def prepare_judge_jobs():
+    if JUDGE_MODE == "remote":
+        require_shared_test_data()
+    try:
+        await create_judge_job_indexes()
+    except Exception as e:
+        print(f"Error creating judge job indexes: {str(e)}")
+
+# Submission progress
+# GET /submissions/{id}/events streams a pending submission's judging as NDJSON:
+# {"type": "case", "total", "result"} per finished test case, then {"type": "verdict",
+# "submission"}. Streams read from this process's SubmissionEventHub. Local judges
+# publish to it directly. Remote judge workers append to the capped collection
+# db.submission_events instead, and every API process tails that into its hub.
+SUBMISSION_EVENTS_MB = int(os.getenv("SUBMISSION_EVENTS_MB", "64"))
+SUBMISSION_STREAM_TIMEOUT = 600
+SUBMISSION_STREAM_PING_SECONDS = 15
+SUBMISSION_BACKLOG_LIMIT = 1000
+
+class SubmissionEventHub:
+    """Fans submission events out to streams, replaying earlier ones to late joiners"""
+
+    def __init__(self):
+        self.subscribers = {}  # submission id -> set of queues
+        self.backlog = {}  # submission id -> events so far, until the verdict
+
+    def subscribe(self, submission_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        for event in self.backlog.get(submission_id, []):
+            queue.put_nowait(event)
+        self.subscribers.setdefault(submission_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, submission_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(submission_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[submission_id]
+
+    def publish(self, submission_id: str, event: dict):
+        if event["type"] == "verdict":
+            self.backlog.pop(submission_id, None)
+        else:
+            backlog = self.backlog.setdefault(submission_id, [])
+            if len(backlog) < SUBMISSION_BACKLOG_LIMIT:
+                backlog.append(event)
+        for queue in self.subscribers.get(submission_id, ()):
+            queue.put_nowait(event)
+
+    def discard(self, submission_id: str):
+        """Drop the backlog of a submission that will never get a verdict"""
+        self.backlog.pop(submission_id, None)
+
+submission_event_hub = SubmissionEventHub()
+
+async def publish_submission_event(submission_id: ObjectId, event: dict):
+    event = jsonable_encoder(convert_objectids_to_strings(event))
+    if JUDGE_MODE == "remote":
+        await db.submission_events.insert_one({"submission_id": str(submission_id), "event": event})
+    else:
+        submission_event_hub.publish(str(submission_id), event)
+
+async def create_submission_events_collection():
+    # Must exist before the first insert, which would create it uncapped (and untailable)
+    try:
+        await db.create_collection("submission_events", capped=True, size=SUBMISSION_EVENTS_MB * 1024 * 1024)
+    except CollectionInvalid:
+        pass  # Already there
+
+async def tail_capped_collection(collection, handle):
+    """Call handle(document) for every document appended to a capped collection from now on"""
+    last = await collection.find_one({}, sort=[("$natural", -1)])
+    last_id = last["_id"] if last else ObjectId.from_datetime(datetime.utcnow())
+    while True:
+        try:
+            cursor = collection.find({"_id": {"$gt": last_id}}, cursor_type=CursorType.TAILABLE_AWAIT)
+            async for document in cursor:
+                last_id = document["_id"]
+                handle(document)
+        except Exception as e:
+            print(f"Tail error on {collection.name}: {str(e)}")
+        # The cursor ends when the collection is empty or was dropped; start a new one
+        await asyncio.sleep(1)
+
+async def tail_submission_events():
+    """Feed the hub from db.submission_events (remote judging)"""
+    await create_submission_events_collection()
+    await tail_capped_collection(
+        db.submission_events,
+        lambda document: submission_event_hub.publish(document["submission_id"], document["event"])
+    )
+
+@app.on_event("startup")
+async def start_submission_event_tail():
+    if JUDGE_MODE == "remote":
+        app.state.submission_event_task = asyncio.create_task(tail_submission_events())
+
+# Admin jobs
+# Admin operations over many documents (rejudging a challenge's submissions, cleaning up
+# after a deleted challenge) run as jobs in db.admin_jobs instead of inside the request;
+# GET /admin/jobs/{id} reports progress.
+# Processes running the job loop (API processes with JUDGE_MODE=local, judge workers with
+# JUDGE_MODE=remote) lease queued jobs the way judge workers lease judge jobs. A job goes
+# through its documents in _id order, ADMIN_JOB_BATCH_SIZE at a time, and saves the last
+# _id done after each batch, so a job whose process died resumes after its last batch.
+ADMIN_JOB_BATCH_SIZE = int(os.getenv("ADMIN_JOB_BATCH_SIZE", "100"))
+ADMIN_JOB_LEASE_SECONDS = 60
+ADMIN_JOB_POLL_SECONDS = 5
+ADMIN_JOB_MAX_ATTEMPTS = 3
+ADMIN_JOB_TTL_DAYS = 30
+# Rejudge runs queue in the lowest judge lane as one flow per job, this many at a time,
+# so live submissions keep most of the judge pool
+REJUDGE_CONCURRENCY = int(os.getenv("REJUDGE_CONCURRENCY", "2"))
+
+class AdminJobLeaseLost(Exception):
+    """Raised when another process has taken over a job"""
+
+async def create_admin_job(job_type: str, params: dict, admin_user: User) -> dict:
+    """Queue a job, or return the one already queued or running with the same params"""
+    existing = await db.admin_jobs.find_one({"type": job_type, **params, "status": {"$in": ["queued", "running"]}})
+    if existing:
+        return existing
+    job = {
+        "type": job_type,
+        **params,
+        "status": "queued",
+        "progress": {"total": None, "processed": 0},
+        "checkpoint": None,
+        "attempts": 0,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "error": None,
+        "created_by": ObjectId(admin_user.id),
+        "created_at": datetime.utcnow()
+    }
+    result = await db.admin_jobs.insert_one(job)
+    job["_id"] = result.inserted_id
+    return job
+
+async def lease_admin_job(worker_id: str) -> Optional[dict]:
+    """Take the oldest queued job, or one whose process stopped renewing its lease"""
+    now = datetime.utcnow()
+    return await db.admin_jobs.find_one_and_update(
+        {"$or": [{"status": "queued"}, {"status": "running", "lease_expires_at": {"$lt": now}}]},
+        {
+            "$set": {"status": "running", "lease_owner": worker_id, "lease_expires_at": now + timedelta(seconds=ADMIN_JOB_LEASE_SECONDS)},
+            "$min": {"started_at": now},
+            "$inc": {"attempts": 1}
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def keep_admin_job_lease(job: dict, worker_id: str):
+    """Heartbeat: renew the lease until cancelled, or until another process has taken it"""
+    while True:
+        await asyncio.sleep(ADMIN_JOB_LEASE_SECONDS / 3)
+        renewed = await db.admin_jobs.update_one(
+            {"_id": job["_id"], "lease_owner": worker_id, "status": "running"},
+            {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=ADMIN_JOB_LEASE_SECONDS)}}
+        )
+        if not renewed.matched_count:
+            return
+
+async def save_admin_job_progress(job: dict, worker_id: str, checkpoint: ObjectId, counts: dict):
+    """Record a finished batch: the last _id done and what to add to the progress counters"""
+    saved = await db.admin_jobs.update_one(
+        {"_id": job["_id"], "lease_owner": worker_id, "status": "running"},
+        {
+            "$set": {"checkpoint": checkpoint, "updated_at": datetime.utcnow()},
+            "$inc": {f"progress.{name}": count for name, count in counts.items()}
+        }
+    )
+    if not saved.matched_count:
+        raise AdminJobLeaseLost()
+    job["checkpoint"] = checkpoint
+
+async def set_admin_job_total(job: dict, total: int):
+    await db.admin_jobs.update_one({"_id": job["_id"]}, {"$set": {"progress.total": total}})
+    job["progress"]["total"] = total
+
+async def finish_admin_job(job: dict, worker_id: str, status: str, error: Optional[str] = None):
+    await db.admin_jobs.update_one(
+        {"_id": job["_id"], "lease_owner": worker_id},
+        {"$set": {"status": status, "error": error, "finished_at": datetime.utcnow()}}
+    )
+
+def user_id_forms(user_ids) -> list:
+    """user_ids as stored on submissions: older ones carry the user's id as a string"""
+    forms = []
+    for user_id in user_ids:
+        forms.append(user_id)
+        if isinstance(user_id, ObjectId):
+            forms.append(str(user_id))
+        elif ObjectId.is_valid(user_id):
+            forms.append(ObjectId(user_id))
+    return forms
+
+async def reconcile_challenge_solvers(challenge: dict):
+    """After a rejudge, bring each submitter's points and completed_challenges in line with
+    their verdicts, ADMIN_JOB_BATCH_SIZE users at a time.
+
+    Users are only ever moved by deltas guarded on completed_challenges, the way
+    finalize_submission awards a first solve, so a solve landing meanwhile isn't
+    overwritten or counted twice. Whoever has no accepted submission left loses what
+    their submissions actually earned; a new solver gets the challenge's points on their
+    first accepted submission; a solver whose credited submission now fails keeps the
+    points, moved to their first accepted one. Every step can be repeated, so a job
+    that died here simply runs it again."""
+    challenge_ids = [challenge["_id"], str(challenge["_id"])]
+    user_ids = sorted({str(user_id) for user_id in await db.submissions.distinct("user_id", {"challenge_id": challenge["_id"]})})
+    for start in range(0, len(user_ids), ADMIN_JOB_BATCH_SIZE):
+        batch = [user_id for user_id in user_ids[start:start + ADMIN_JOB_BATCH_SIZE] if ObjectId.is_valid(user_id)]
+        submissions = await db.submissions.find(
+            {"challenge_id": challenge["_id"], "user_id": {"$in": user_id_forms(batch)}},
+            {"user_id": 1, "status": 1, "points_earned": 1}
+        ).sort([("submitted_at", 1), ("_id", 1)]).to_list(None)
+        by_user = {}
+        for submission in submissions:
+            by_user.setdefault(str(submission["user_id"]), []).append(submission)
+        users = await db.users.find({"_id": {"$in": [ObjectId(user_id) for user_id in batch]}}, {"completed_challenges": 1}).to_list(None)
+        holders = {str(user["_id"]) for user in users if set(user.get("completed_challenges") or []) & set(challenge_ids)}
+
+        user_updates = []
+        submission_updates = []
+        for user_id, user_submissions in by_user.items():
+            accepted = [submission for submission in user_submissions if submission["status"] == "Completed"]
+            credited = [submission for submission in user_submissions if (submission.get("points_earned") or 0) > 0]
+            stray = [submission for submission in credited if submission["status"] != "Completed"]
+            if not accepted:
+                if user_id in holders:
+                    user_updates.append(UpdateOne(
+                        {"_id": ObjectId(user_id), "completed_challenges": {"$in": challenge_ids}},
+                        {
+                            "$pull": {"completed_challenges": {"$in": challenge_ids}},
+                            "$inc": {"points": -sum(submission["points_earned"] for submission in credited)}
+                        }
+                    ))
+                submission_updates += [UpdateOne({"_id": submission["_id"]}, {"$set": {"points_earned": 0}}) for submission in credited]
+                continue
+            if user_id not in holders:
+                user_updates.append(UpdateOne(
+                    {"_id": ObjectId(user_id), "completed_challenges": {"$nin": challenge_ids}},
+                    {"$inc": {"points": challenge["points"]}, "$addToSet": {"completed_challenges": challenge["_id"]}}
+                ))
+                points = challenge["points"]
+            elif stray:
+                points = sum(submission["points_earned"] for submission in credited)
+            elif not credited:
+                # Solved before submissions recorded what they earned
+                points = challenge["points"]
+            else:
+                continue
+            submission_updates.append(UpdateOne({"_id": accepted[0]["_id"]}, {"$set": {"points_earned": points}}))
+            submission_updates += [
+                UpdateOne({"_id": submission["_id"]}, {"$set": {"points_earned": 0}})
+                for submission in credited if submission["_id"] != accepted[0]["_id"]
+            ]
+
+        # Users first: a revoke must read points_earned before it is cleared
+        if user_updates:
+            await db.users.bulk_write(user_updates, ordered=False)
+        if submission_updates:
+            await db.submissions.bulk_write(submission_updates)
+
+async def rebuild_challenge_stats(challenge: dict):
+    """Recount a challenge's stats from its judged submissions, for after a rejudge has
+    changed verdicts that update_challenge_stats folded in long ago"""
+    query = {"challenge_id": challenge["_id"]}
+    attempts = await db.submissions.count_documents({**query, "status": {"$in": ["Completed", "Failed"]}})
+    solvers = set()
+    accepted = 0
+    digest = TDigest()
+    runtimes = []
+    async for submission in db.submissions.find({**query, "status": "Completed"}, {"user_id": 1, "execution_time": 1}):
+        accepted += 1
+        solvers.add(str(submission["user_id"]))
+        runtimes.append([submission.get("execution_time") or 0, 1])
+        if len(runtimes) >= ADMIN_JOB_BATCH_SIZE:
+            digest.merge(TDigest(runtimes))
+            runtimes = []
+    digest.merge(TDigest(runtimes))
+
+    stats = {
+        "stats.attempts": attempts,
+        "stats.accepted": accepted,
+        "stats.unique_solvers": len(solvers),
+        "stats.runtime_digest": digest.centroids,
+        "stats.median_runtime": round(digest.quantile(0.5), 4) if accepted else None,
+        "stats.p90_runtime": round(digest.quantile(0.9), 4) if accepted else None
+    }
+    # Bumping the version sends an update_challenge_stats that read the old digest back
+    # to retry on this one
+    await db.challenges.update_one({"_id": challenge["_id"]}, {"$set": stats, "$inc": {"stats.digest_version": 1}})
+
+async def rejudge_submission(submission: dict, challenge: dict, job: dict, throttle: asyncio.Semaphore) -> Optional[dict]:
+    """Verdict for one submission, or None if it couldn't be judged"""
+    async with throttle:
+        while True:
+            try:
+                return await run_judge(submission, challenge, user=f"admin-job:{job['_id']}", lane="rejudge", publish=False)
+            except JudgeBusyError as busy:
+                # The pool is full of live submissions, which go first
+                await asyncio.sleep(busy.retry_after)
+            except Exception as e:
+                print(f"Rejudge error on submission {submission['_id']}: {str(e)}")
+                return None
+
+async def rejudge_challenge_job(job: dict, worker_id: str):
+    """Judge a challenge's finished submissions again, then settle its solvers' points and
+    rebuild its stats"""
+    challenge = await db.challenges.find_one({"_id": job["challenge_id"]})
+    if not challenge:
+        raise ValueError("Challenge not found")
+    # Later submissions were judged against the current test cases already
+    query = {
+        "challenge_id": challenge["_id"],
+        "status": {"$in": ["Completed", "Failed"]},
+        "submitted_at": {"$lte": job["created_at"]}
+    }
+    if job["progress"]["total"] is None:
+        await set_admin_job_total(job, await db.submissions.count_documents(query))
+
+    throttle = asyncio.Semaphore(REJUDGE_CONCURRENCY)
+    while True:
+        batch_query = dict(query)
+        if job["checkpoint"]:
+            batch_query["_id"] = {"$gt": job["checkpoint"]}
+        batch = await db.submissions.find(
+            batch_query,
+            {"language": 1, "code": 1, "user_id": 1, "challenge_id": 1, "status": 1, "execution_time": 1, "submitted_at": 1}
+        ).sort("_id", 1).limit(ADMIN_JOB_BATCH_SIZE).to_list(ADMIN_JOB_BATCH_SIZE)
+        if not batch:
+            break
+
+        verdicts = await asyncio.gather(*(rejudge_submission(submission, challenge, job, throttle) for submission in batch))
+        updates = []
+        corrections = []
+        errors = 0
+        for submission, verdict in zip(batch, verdicts):
+            if verdict is None:
+                errors += 1
+                continue
+            fields = {
+                "status": "Completed" if verdict["all_tests_passed"] else "Failed",
+                "execution_time": verdict["execution_time"],
+                "test_results": verdict["test_results"],
+                "rejudged_at": datetime.utcnow()
+            }
+            if fields["status"] != submission["status"]:
+                corrections += [
+                    submission_analytics_event(submission, weight=-1),
+                    submission_analytics_event({**submission, **fields})
+                ]
+            updates.append(UpdateOne({"_id": submission["_id"]}, {"$set": fields, "$unset": {"error": ""}}))
+        if updates:
+            await db.submissions.bulk_write(updates, ordered=False)
+        if corrections:
+            try:
+                await db.analytics_events.insert_many(corrections)
+            except Exception as e:
+                print(f"Analytics event error: {str(e)}")
+        await save_admin_job_progress(
+            job, worker_id, batch[-1]["_id"], {"processed": len(batch), "changed": len(corrections) // 2, "errors": errors}
+        )
+
+    await reconcile_challenge_solvers(challenge)
+    await rebuild_challenge_stats(challenge)
+
+async def delete_challenge_job(job: dict, worker_id: str):
+    """Take a deleted challenge out of its solvers' completed_challenges and points, then
+    delete its submissions. Each solver loses exactly what their submissions on it
+    earned, as one delta guarded on completed_challenges still holding it, so their
+    other solves keep the points they were awarded at, a solve landing meanwhile isn't
+    overwritten, and a repeated batch changes nothing."""
+    challenge_ids = [job["challenge_id"], str(job["challenge_id"])]  # Older entries are strings
+    solver_query = {"completed_challenges": {"$in": challenge_ids}}
+    submission_query = {"challenge_id": job["challenge_id"]}
+    if job["progress"]["total"] is None:
+        await set_admin_job_total(job, await db.users.count_documents(solver_query) + await db.submissions.count_documents(submission_query))
+
+    while True:
+        solvers = await db.users.find(solver_query, {"_id": 1}).sort("_id", 1).limit(ADMIN_JOB_BATCH_SIZE).to_list(ADMIN_JOB_BATCH_SIZE)
+        if not solvers:
+            break
+        earned = {}
+        async for total in db.submissions.aggregate([
+            {"$match": {**submission_query, "user_id": {"$in": user_id_forms([solver["_id"] for solver in solvers])}}},
+            {"$group": {"_id": "$user_id", "points": {"$sum": "$points_earned"}}}
+        ]):
+            earned[str(total["_id"])] = earned.get(str(total["_id"]), 0) + total["points"]
+        updated = await db.users.bulk_write([
+            UpdateOne(
+                {"_id": solver["_id"], **solver_query},
+                {"$pull": {"completed_challenges": {"$in": challenge_ids}}, "$inc": {"points": -earned.get(str(solver["_id"]), 0)}}
+            )
+            for solver in solvers
+        ], ordered=False)
+        await save_admin_job_progress(job, worker_id, solvers[-1]["_id"], {"processed": len(solvers), "users": updated.modified_count})
+
+    # Bounded deletes, so no single write holds the collection for long
+    while True:
+        batch = await db.submissions.find(submission_query, {"_id": 1}).sort("_id", 1).limit(ADMIN_JOB_BATCH_SIZE).to_list(ADMIN_JOB_BATCH_SIZE)
+        if not batch:
+            break
+        deleted = await db.submissions.delete_many({"_id": {"$in": [submission["_id"] for submission in batch]}})
+        await save_admin_job_progress(job, worker_id, batch[-1]["_id"], {"processed": len(batch), "submissions": deleted.deleted_count})
+
+ADMIN_JOB_HANDLERS = {
+    "rejudge": rejudge_challenge_job,
+    "delete_challenge": delete_challenge_job
+}
+
+async def process_admin_job(job: dict, worker_id: str):
+    handler = ADMIN_JOB_HANDLERS.get(job["type"])
+    if handler is None or job["attempts"] > ADMIN_JOB_MAX_ATTEMPTS:
+        await finish_admin_job(job, worker_id, "failed", job.get("error") or "Unknown job type")
+        return
+
+    heartbeat = asyncio.create_task(keep_admin_job_lease(job, worker_id))
+    try:
+        await handler(job, worker_id)
+    except AdminJobLeaseLost:
+        print(f"Admin job {job['_id']} was taken over by another process")
+        return
+    except Exception as e:
+        print(f"Admin job {job['_id']} failed: {str(e)}")
+        # Back in the queue; the next attempt resumes from the checkpoint
+        await db.admin_jobs.update_one(
+            {"_id": job["_id"], "lease_owner": worker_id},
+            {"$set": {"status": "queued", "lease_owner": None, "lease_expires_at": None, "error": str(e)}}
+        )
+        return
+    finally:
+        heartbeat.cancel()
+    await finish_admin_job(job, worker_id, "done")
+
+async def run_admin_jobs(worker_id: str):
+    """Job loop: run admin jobs one at a time, forever"""
+    while True:
+        try:
+            job = await lease_admin_job(worker_id)
+            if job:
+                await process_admin_job(job, worker_id)
+            else:
+                await asyncio.sleep(ADMIN_JOB_POLL_SECONDS)
+        except Exception as e:
+            print(f"Admin job loop error: {str(e)}")
+            await asyncio.sleep(ADMIN_JOB_POLL_SECONDS)
+
+async def create_admin_job_indexes():
+    await db.admin_jobs.create_index([("status", 1), ("created_at", 1)])
+    await db.admin_jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+    await db.admin_jobs.create_index("finished_at", expireAfterSeconds=ADMIN_JOB_TTL_DAYS * 86400)
+    # Batch scans of a challenge's submissions and the per-user points lookup
+    await db.submissions.create_index([("challenge_id", 1), ("_id", 1)])
+    await db.submissions.create_index([("user_id", 1), ("status", 1)])
+
+@app.on_event("startup")
+async def start_admin_jobs():
+    try:
+        await create_admin_job_indexes()
+    except Exception as e:
+        print(f"Error creating admin job indexes: {str(e)}")
+    # With remote judging the judge workers run admin jobs, next to the judge pool
+    if JUDGE_MODE != "remote":
+        app.state.admin_job_task = asyncio.create_task(run_admin_jobs(f"{socket.gethostname()}:{os.getpid()}"))
+
+@app.post("/admin/challenges/{challenge_id}/rejudge")
+async def admin_rejudge_challenge(challenge_id: str, admin_user: User = Depends(get_admin_user)):
+    """Queue a job judging the challenge's submissions again, e.g. after fixing its test cases"""
+    if not ObjectId.is_valid(challenge_id):
+        raise HTTPException(status_code=400, detail="Invalid challenge ID")
+    if not await db.challenges.find_one({"_id": ObjectId(challenge_id)}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Challenge not found")
+    job = await create_admin_job("rejudge", {"challenge_id": ObjectId(challenge_id)}, admin_user)
+    return convert_objectids_to_strings(job)
+
+@app.get("/admin/jobs")
+async def admin_list_jobs(admin_user: User = Depends(get_admin_user), limit: int = 50):
+    """Recent admin jobs, newest first"""
+    jobs = await db.admin_jobs.find().sort("created_at", -1).limit(limit).to_list(limit)
+    return convert_objectids_to_strings(jobs)
+
+@app.get("/admin/jobs/{job_id}")
+async def admin_get_job(job_id: str, admin_user: User = Depends(get_admin_user)):
+    """One admin job with its progress counters"""
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    job = await db.admin_jobs.find_one({"_id": ObjectId(job_id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return convert_objectids_to_strings(job)
+
 # Submission Endpoints
 @app.post("/submissions/", response_model=Submission)
 async def create_submission(
-    submission: SubmissionBase, current_user: User = Depends(get_current_active_user)
+    submission: SubmissionBase,
+    current_user: User = Depends(get_current_active_user),
+    idempotency_key: Optional[str] = Header(None),
+    wait: bool = True
 ):
+    """Judge a submission. With wait=false, or when remote workers judge, the answer is
+    the pending submission, to be followed at /submissions/{id}/events."""
+    claims = []
     try:
         # Debug logs removed to reduce console spam
         
@@ -865,151 +2075,131 @@ async def create_submission(
         challenge = await db.challenges.find_one({"_id": challenge_obj_id})
         if not challenge:
             raise HTTPException(status_code=404, detail="Challenge not found")
+        if not challenge.get("test_cases"):
+            raise HTTPException(status_code=400, detail=NO_TEST_CASES_ERROR)
+        
+        user_obj_id = ObjectId(current_user.id) if isinstance(current_user.id, str) else current_user.id
+        
+        # Retries and double submits get the submission their first attempt produced
+        new_claims = submission_claims(user_obj_id, challenge_obj_id, submission, idempotency_key)
+        respond_pending = JUDGE_MODE == "remote" or not wait
+        existing = await claim_submission(new_claims, wait_for_verdict=not respond_pending)
+        if existing:
+            return convert_objectids_to_strings(existing)
+        claims = new_claims
     
         submission_dict = submission.dict()
         submission_dict["challenge_id"] = challenge_obj_id
-        submission_dict["user_id"] = ObjectId(current_user.id) if isinstance(current_user.id, str) else current_user.id
+        submission_dict["user_id"] = user_obj_id
         submission_dict["submitted_at"] = datetime.utcnow()
-        
-        # Execute code and run test cases
-        import time
-        execution_start = time.time()
-        
-        test_results = []
-        all_tests_passed = True
-        execution_error = None
-    
-        # Get test cases from challenge
-        test_cases = challenge.get("test_cases", [])
-        
-        if not test_cases:
-            # If no test cases, create a simple execution test
-            test_cases = [{"input": "", "expected_output": ""}]
-        
-        for i, test_case in enumerate(test_cases):
+        submission_dict["status"] = "Pending"
+        submission_dict["points_earned"] = 0
+        submission_dict["test_results"] = []
+        if JUDGE_MODE != "remote" and not wait:
             try:
-                # Create temp file for code execution
-                suffix = '.py' if submission.language == 'python' else '.js' if submission.language == 'javascript' else '.txt'
-                with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix=suffix) as temp:
-                    temp.write(submission.code)
-                    temp_path = temp.name
-
-                # Determine execution command
-                if submission.language == 'python':
-                    cmd = ['python', '-u', temp_path]
-                elif submission.language == 'javascript':
-                    cmd = ['node', temp_path]
-                else:
-                    raise ValueError(f"Unsupported language: {submission.language}")
-
-                # Execute with test input
-                process = subprocess.Popen(
-                    cmd,
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                
-                test_input = test_case.get("input", "")
-                stdout, stderr = process.communicate(input=test_input, timeout=5)
-                
-                # Clean up temp file
-                os.unlink(temp_path)
-                
-                # Check if execution was successful
-                if process.returncode == 0:
-                    actual_output = stdout.strip()
-                    expected_output = test_case.get("expected_output", "").strip()
-                    
-                    # Simple output comparison (can be enhanced)
-                    passed = actual_output == expected_output or not expected_output
-                    
-                    test_results.append({
-                        "test_case": i + 1,
-                        "passed": passed,
-                        "input": test_input,
-                        "expected_output": expected_output,
-                        "actual_output": actual_output,
-                        "error": None
-                    })
-                    
-                    if not passed:
-                        all_tests_passed = False
-                else:
-                    # Runtime error
-                    test_results.append({
-                        "test_case": i + 1,
-                        "passed": False,
-                        "input": test_input,
-                        "expected_output": test_case.get("expected_output", ""),
-                        "actual_output": "",
-                        "error": stderr.strip()
-                    })
-                    all_tests_passed = False
-                    
-            except subprocess.TimeoutExpired:
-                process.kill()
-                if 'temp_path' in locals():
-                    os.unlink(temp_path)
-                test_results.append({
-                    "test_case": i + 1,
-                    "passed": False,
-                    "input": test_case.get("input", ""),
-                    "expected_output": test_case.get("expected_output", ""),
-                    "actual_output": "",
-                    "error": "Time limit exceeded"
-                })
-                all_tests_passed = False
-                
-            except Exception as e:
-                if 'temp_path' in locals():
-                    try:
-                        os.unlink(temp_path)
-                    except:
-                        pass
-                test_results.append({
-                    "test_case": i + 1,
-                    "passed": False,
-                    "input": test_case.get("input", ""),
-                    "expected_output": test_case.get("expected_output", ""),
-                    "actual_output": "",
-                    "error": str(e)
-                })
-                all_tests_passed = False
-                
-        execution_time = time.time() - execution_start
+                judge_pool.check_admission(str(user_obj_id), len(challenge["test_cases"]))
+            except JudgeBusyError as busy:
+                raise judge_busy_error(busy)
         
-        # Update submission with results
-        submission_dict["status"] = "Completed" if all_tests_passed else "Failed"
-        submission_dict["points_earned"] = challenge["points"] if all_tests_passed else 0
-        submission_dict["execution_time"] = execution_time
-        submission_dict["test_results"] = test_results
-        
-        # Save submission
         result = await db.submissions.insert_one(submission_dict)
+        submission_dict["_id"] = result.inserted_id
+        await complete_submission_claims(claims, result.inserted_id)
         
-        # Update user points if submission successful
-        if all_tests_passed:
-            user_obj_id = ObjectId(current_user.id) if isinstance(current_user.id, str) else current_user.id
-            await db.users.update_one(
-                {"_id": user_obj_id},
-                {
-                    "$inc": {"points": challenge["points"]},
-                    "$addToSet": {"completed_challenges": challenge_obj_id}
-                }
-            )
-        
+        try:
+            if JUDGE_MODE == "remote":
+                # A judge worker takes it from here; the client follows the pending submission
+                await enqueue_judge_job(submission_dict, challenge)
+                return convert_objectids_to_strings(submission_dict)
+            if not wait:
+                task = asyncio.create_task(judge_in_background(submission_dict, challenge))
+                background_judgings.add(task)
+                task.add_done_callback(background_judgings.discard)
+                return convert_objectids_to_strings(submission_dict)
+            verdict = await run_judge(submission_dict, challenge)
+        except Exception as e:
+            await db.submissions.delete_one({"_id": result.inserted_id})
+            submission_event_hub.discard(str(result.inserted_id))
+            if isinstance(e, JudgeBusyError):
+                raise judge_busy_error(e)
+            raise
+        
+        await finalize_submission(submission_dict, challenge, verdict)
         created_submission = await db.submissions.find_one({"_id": result.inserted_id})
         return convert_objectids_to_strings(created_submission)
         
+    except HTTPException:
+        await release_submission_claims(claims)
+        raise
     except Exception as e:
+        await release_submission_claims(claims)
         print(f"Submission creation error: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to create submission: {str(e)}"
         )
 
+@app.get("/submissions/{submission_id}", response_model=Submission)
+async def get_submission(submission_id: str, current_user: User = Depends(get_current_active_user)):
+    """One of the user's submissions; how clients follow a pending one"""
+    if not ObjectId.is_valid(submission_id):
+        raise HTTPException(status_code=400, detail="Invalid submission ID")
+    submission = await db.submissions.find_one({"_id": ObjectId(submission_id)})
+    if not submission or (str(submission["user_id"]) != str(current_user.id) and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Submission not found")
+    return convert_objectids_to_strings(submission)
+
+@app.get("/submissions/{submission_id}/events")
+async def stream_submission_events(
+    submission_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Judging progress of one of the user's submissions, as NDJSON (see SubmissionEventHub)"""
+    if not ObjectId.is_valid(submission_id):
+        raise HTTPException(status_code=400, detail="Invalid submission ID")
+    submission = await db.submissions.find_one({"_id": ObjectId(submission_id)}, {"user_id": 1})
+    if not submission or (str(submission["user_id"]) != str(current_user.id) and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Submission not found")
+
+    async def event_lines():
+        # Subscribe before reading the status, so a verdict can't slip in between
+        queue = submission_event_hub.subscribe(submission_id)
+        try:
+            current = await db.submissions.find_one({"_id": ObjectId(submission_id)})
+            if not current:
+                return  # Dropped after its judging failed to start
+            if current["status"] != "Pending":
+                yield json.dumps(jsonable_encoder({"type": "verdict", "submission": convert_objectids_to_strings(current)})) + "\n"
+                return
+            deadline = time.monotonic() + SUBMISSION_STREAM_TIMEOUT
+            while time.monotonic() < deadline:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SUBMISSION_STREAM_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    # Local verdicts only reach this process's hub; if another worker judged
+                    # the submission, the stored status is how this stream finds out
+                    current = await db.submissions.find_one({"_id": ObjectId(submission_id)})
+                    if not current:
+                        return
+                    if current["status"] != "Pending":
+                        yield json.dumps(jsonable_encoder({"type": "verdict", "submission": convert_objectids_to_strings(current)})) + "\n"
+                        return
+                    yield json.dumps({"type": "ping"}) + "\n"
+                    continue
+                yield json.dumps(event) + "\n"
+                if event["type"] == "verdict":
+                    return
+        finally:
+            submission_event_hub.unsubscribe(submission_id, queue)
+
+    return StreamingResponse(
+        event_lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/submissions/")
 async def list_user_submissions(current_user: User = Depends(get_current_active_user)):
     try:
@@ -1132,27 +2322,19 @@ class ChatResponse(BaseModel):
     response: str
     error: Optional[str] = None
 
-# Chatbot Endpoint
-@app.post("/chatbot", response_model=ChatResponse)
-async def chat_with_gemini(
-    chat_message: ChatMessage, 
-    current_user: User = Depends(get_current_active_user)
-):
-    """
-    Chat with Gemini AI assistant for coding help and general questions
-    """
-    try:
-        if not GEMINI_API_KEY:
-            return ChatResponse(
-                response="I'm sorry, but the AI chatbot is currently unavailable. Please check the server configuration.",
-                error="Gemini API key not configured"
-            )
-        
-        # Create model instance
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Prepare the prompt with context
-        system_context = """You are an AI assistant for an Interactive Creator Platform - a coding learning platform. 
+# ================================= CHATBOT BACKENDS =================================
+
+# One backend instance (and its model client) is shared by every request. Calls go
+# through the async API, bounded by a global semaphore and a per-request timeout so
+# a slow LLM call never blocks the event loop.
+CHATBOT_BACKEND = os.getenv("CHATBOT_BACKEND", "gemini")  # gemini or fake
+CHATBOT_MODEL = os.getenv("CHATBOT_MODEL", "gemini-1.5-flash")
+CHATBOT_TIMEOUT = float(os.getenv("CHATBOT_TIMEOUT", "30"))  # seconds per generation
+CHATBOT_MAX_CONCURRENCY = int(os.getenv("CHATBOT_MAX_CONCURRENCY", "8"))
+CHATBOT_QUEUE_TIMEOUT = float(os.getenv("CHATBOT_QUEUE_TIMEOUT", "5"))  # seconds to wait for a slot
+CHATBOT_FAKE_DELAY = float(os.getenv("CHATBOT_FAKE_DELAY", "0.05"))
+
+CHATBOT_SYSTEM_CONTEXT = """You are an AI assistant for an Interactive Creator Platform - a coding learning platform. 
         You help users with:
         - Programming questions and debugging
         - Explaining coding concepts
@@ -1161,21 +2343,367 @@ async def chat_with_gemini(
         - Learning resources and tips
         
         Keep your responses helpful, educational, and encouraging. Focus on helping users learn and improve their coding skills."""
+
+class ChatbotBusyError(Exception):
+    """Raised when no generation slot frees up within CHATBOT_QUEUE_TIMEOUT"""
+
+class ChatbotBackend:
+    """Base class for the LLM behind /chatbot"""
+    name = "base"
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    async def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        # Backends without native streaming emit the whole reply as one chunk
+        yield await self.generate(prompt)
+
+class GeminiChatbotBackend(ChatbotBackend):
+    """Gemini backend reusing a single GenerativeModel client"""
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str], model_name: str):
+        self.model = genai.GenerativeModel(model_name) if api_key else None
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+class FakeChatbotBackend(ChatbotBackend):
+    """Deterministic local backend for tests and load benchmarks"""
+    name = "fake"
+
+    def __init__(self, delay: float = CHATBOT_FAKE_DELAY):
+        self.delay = delay
+
+    async def generate(self, prompt: str) -> str:
+        await asyncio.sleep(self.delay)
+        question = prompt.rsplit("User question:", 1)[-1].strip()
+        return f"You asked: {question}"
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        reply = await self.generate(prompt)
+        for word in reply.split(" "):
+            await asyncio.sleep(self.delay / 10)
+            yield word + " "
+
+def create_chatbot_backend(name: str = CHATBOT_BACKEND) -> ChatbotBackend:
+    if name == "fake":
+        return FakeChatbotBackend()
+    if name == "gemini":
+        return GeminiChatbotBackend(GEMINI_API_KEY, CHATBOT_MODEL)
+    raise ValueError(f"Unsupported chatbot backend: {name}")
+
+chatbot_backend = create_chatbot_backend()
+chatbot_semaphore = asyncio.Semaphore(CHATBOT_MAX_CONCURRENCY)
+
+def build_chatbot_prompt(chat_message: ChatMessage) -> str:
+    user_context = chat_message.context if chat_message.context else ""
+    return f"{CHATBOT_SYSTEM_CONTEXT}\n\nUser context: {user_context}\n\nUser question: {chat_message.message}"
+
+async def acquire_chatbot_slot():
+    """Take a chatbot_semaphore permit, or raise ChatbotBusyError after CHATBOT_QUEUE_TIMEOUT"""
+    if hasattr(asyncio, "timeout"):
+        try:
+            async with asyncio.timeout(CHATBOT_QUEUE_TIMEOUT):
+                await chatbot_semaphore.acquire()
+        except TimeoutError:
+            raise ChatbotBusyError()
+        return
+    # Before Python 3.11, wait_for can time out after the acquire went through, losing
+    # the permit. Acquire in a task of its own, and when giving up on it, hand back
+    # whatever permit it still ends up with.
+    acquire = asyncio.ensure_future(chatbot_semaphore.acquire())
+
+    def give_back(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is None:
+            chatbot_semaphore.release()
+
+    try:
+        await asyncio.wait_for(asyncio.shield(acquire), timeout=CHATBOT_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        acquire.add_done_callback(give_back)
+        acquire.cancel()
+        raise ChatbotBusyError()
+    except asyncio.CancelledError:
+        acquire.add_done_callback(give_back)
+        acquire.cancel()
+        raise
+
+async def generate_chatbot_reply(prompt: str) -> str:
+    """Generate a reply through the shared backend, honouring the concurrency limit and timeout"""
+    await acquire_chatbot_slot()
+    try:
+        return await asyncio.wait_for(chatbot_backend.generate(prompt), timeout=CHATBOT_TIMEOUT)
+    finally:
+        chatbot_semaphore.release()
+
+async def stream_chatbot_reply(prompt: str) -> AsyncIterator[str]:
+    """Stream a reply through the shared backend under the same limits as generate_chatbot_reply"""
+    await acquire_chatbot_slot()
+    upstream = chatbot_backend.stream(prompt)
+    try:
+        deadline = asyncio.get_running_loop().time() + CHATBOT_TIMEOUT
+        while True:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                chunk = await asyncio.wait_for(upstream.__anext__(), timeout=remaining)
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        # Closing the upstream generator stops the LLM call when the client goes away
+        await upstream.aclose()
+        chatbot_semaphore.release()
+
+# ================================= CHATBOT RESPONSE CACHE =================================
+
+# Replies are cached on the normalized question plus a hash of the context. Optionally,
+# near-identical questions are matched with MinHash signatures over character
+# shingles, indexed with LSH bands so a lookup only compares a handful of candidates.
+# A near match must also name the same keywords (languages, technologies, numbers):
+# "reverse a list in python" and "... in java" are close as strings, not as questions.
+# Questions longer than CHATBOT_CACHE_NEAR_MAX_CHARS are only matched exactly, which
+# bounds the hashing done on the event loop.
+CHATBOT_CACHE_SIZE = int(os.getenv("CHATBOT_CACHE_SIZE", "1000"))
+CHATBOT_CACHE_TTL = int(os.getenv("CHATBOT_CACHE_TTL", "3600"))  # seconds
+CHATBOT_CACHE_NEAR_DUPLICATES = os.getenv("CHATBOT_CACHE_NEAR_DUPLICATES", "true").lower() == "true"
+CHATBOT_CACHE_SIMILARITY = float(os.getenv("CHATBOT_CACHE_SIMILARITY", "0.9"))
+CHATBOT_CACHE_NEAR_MAX_CHARS = 300
+
+CHATBOT_CACHE_FILLER_WORDS = {"a", "an", "the", "please", "pls", "hey", "hi"}
+CHATBOT_CACHE_KEYWORDS = {
+    "python", "java", "javascript", "js", "typescript", "ts", "c", "cpp", "csharp", "go",
+    "golang", "rust", "ruby", "php", "kotlin", "swift", "scala", "sql", "mysql", "mongodb",
+    "html", "css", "react", "node", "nodejs", "django", "flask", "fastapi", "bash"
+}
+
+def normalize_chatbot_prompt(text: str) -> str:
+    """Lowercase, drop punctuation and filler words, and collapse whitespace"""
+    text = re.sub(r"[^\w\s]", " ", (text or "").lower())
+    return " ".join(word for word in text.split() if word not in CHATBOT_CACHE_FILLER_WORDS)
+
+def chatbot_prompt_keywords(normalized: str) -> frozenset:
+    """Words a near-duplicate must share exactly: known technologies and anything with a digit"""
+    return frozenset(
+        word for word in normalized.split()
+        if word in CHATBOT_CACHE_KEYWORDS or any(char.isdigit() for char in word)
+    )
+
+class MinHasher:
+    """MinHash signatures over character shingles, split into LSH bands"""
+    MERSENNE_PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle_size: int = 4, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randrange(1, self.MERSENNE_PRIME), rng.randrange(0, self.MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def shingles(self, text: str) -> set:
+        if len(text) <= self.shingle_size:
+            return {text}
+        return {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> tuple:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+            for shingle in self.shingles(text)
+        ]
+        return tuple(
+            min((a * h + b) % self.MERSENNE_PRIME for h in hashes)
+            for a, b in self.permutations
+        )
+
+    def band_keys(self, signature: tuple) -> List[tuple]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    @staticmethod
+    def similarity(first: tuple, second: tuple) -> float:
+        """Estimated Jaccard similarity of the underlying shingle sets"""
+        return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+class ChatbotResponseCache:
+    """In-memory LRU + TTL cache of chatbot replies with near-duplicate lookup"""
+
+    def __init__(self, max_entries: int, ttl: int, near_duplicates: bool, threshold: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.near_duplicates = near_duplicates
+        self.threshold = threshold
+        self.hasher = MinHasher()
+        self.entries = OrderedDict()  # key -> entry, least recently used first
+        self.bands = {}  # (context hash, band, rows) -> set of keys
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _key(self, message: str, context: Optional[str]):
+        normalized = normalize_chatbot_prompt(message)
+        context_hash = hashlib.sha256((context or "").encode()).hexdigest()[:16]
+        key = hashlib.sha256(f"{context_hash}:{normalized}".encode()).hexdigest()
+        return key, normalized, context_hash
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry and entry["band_keys"]:
+            for band_key in entry["band_keys"]:
+                keys = self.bands.get(band_key)
+                if keys:
+                    keys.discard(key)
+                    if not keys:
+                        del self.bands[band_key]
+
+    def _live(self, key: str) -> Optional[dict]:
+        entry = self.entries.get(key)
+        if entry and entry["expires_at"] < time.monotonic():
+            self._remove(key)
+            return None
+        return entry
+
+    def get(self, message: str, context: Optional[str]) -> Optional[str]:
+        key, normalized, context_hash = self._key(message, context)
+        entry = self._live(key)
+        if entry:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry["response"]
+
+        if self.near_duplicates and normalized and len(normalized) <= CHATBOT_CACHE_NEAR_MAX_CHARS:
+            signature = self.hasher.signature(normalized)
+            keywords = chatbot_prompt_keywords(normalized)
+            candidates = set()
+            for band, rows in self.hasher.band_keys(signature):
+                candidates |= self.bands.get((context_hash, band, rows), set())
+            best_key, best_score = None, self.threshold
+            for candidate in candidates:
+                candidate_entry = self._live(candidate)
+                if not candidate_entry or candidate_entry["keywords"] != keywords:
+                    continue
+                score = MinHasher.similarity(signature, candidate_entry["signature"])
+                if score >= best_score:
+                    best_key, best_score = candidate, score
+            if best_key:
+                self.entries.move_to_end(best_key)
+                self.near_hits += 1
+                return self.entries[best_key]["response"]
+
+        self.misses += 1
+        return None
+
+    def put(self, message: str, context: Optional[str], response: str):
+        key, normalized, context_hash = self._key(message, context)
+        self._remove(key)
+
+        signature, band_keys = None, []
+        if self.near_duplicates and normalized and len(normalized) <= CHATBOT_CACHE_NEAR_MAX_CHARS:
+            signature = self.hasher.signature(normalized)
+            band_keys = [(context_hash, band, rows) for band, rows in self.hasher.band_keys(signature)]
+            for band_key in band_keys:
+                self.bands.setdefault(band_key, set()).add(key)
+
+        self.entries[key] = {
+            "response": response,
+            "expires_at": time.monotonic() + self.ttl,
+            "signature": signature,
+            "keywords": chatbot_prompt_keywords(normalized),
+            "band_keys": band_keys
+        }
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "near_duplicates": self.near_duplicates,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.near_hits) / lookups * 100, 2) if lookups else 0
+        }
+
+chatbot_cache = ChatbotResponseCache(
+    CHATBOT_CACHE_SIZE,
+    CHATBOT_CACHE_TTL,
+    CHATBOT_CACHE_NEAR_DUPLICATES,
+    CHATBOT_CACHE_SIMILARITY
+)
+
+@app.get("/admin/chatbot/cache")
+async def admin_get_chatbot_cache_stats(admin_user: User = Depends(get_admin_user)):
+    """Admin endpoint reporting chatbot response cache hit rates"""
+    return chatbot_cache.stats()
+
+# Chatbot Endpoint
+@app.post("/chatbot", response_model=ChatResponse)
+async def chat_with_gemini(
+    chat_message: ChatMessage, 
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Chat with Gemini AI assistant for coding help and general questions
+    """
+    try:
+        if not chatbot_backend.available:
+            return ChatResponse(
+                response="I'm sorry, but the AI chatbot is currently unavailable. Please check the server configuration.",
+                error="Gemini API key not configured"
+            )
         
-        user_context = chat_message.context if chat_message.context else ""
-        full_prompt = f"{system_context}\n\nUser context: {user_context}\n\nUser question: {chat_message.message}"
+        # Serve repeated questions from the cache
+        cached_text = chatbot_cache.get(chat_message.message, chat_message.context)
+        if cached_text:
+            return ChatResponse(response=cached_text)
         
         # Generate response
-        response = model.generate_content(full_prompt)
+        response_text = await generate_chatbot_reply(build_chatbot_prompt(chat_message))
         
-        if response.text:
-            return ChatResponse(response=response.text)
+        if response_text:
+            chatbot_cache.put(chat_message.message, chat_message.context, response_text)
+            return ChatResponse(response=response_text)
         else:
             return ChatResponse(
                 response="I'm sorry, I couldn't generate a response. Please try asking your question differently.",
                 error="No response generated"
             )
             
+    except ChatbotBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="The AI assistant is busy. Please try again in a moment.",
+            headers={"Retry-After": str(int(CHATBOT_QUEUE_TIMEOUT))}
+        )
+    except asyncio.TimeoutError:
+        return ChatResponse(
+            response="I'm sorry, that took too long to answer. Please try again or ask a shorter question.",
+            error="Generation timed out"
+        )
     except Exception as e:
         print(f"Chatbot error: {str(e)}")
         return ChatResponse(
@@ -1183,6 +2711,1097 @@ async def chat_with_gemini(
             error=str(e)
         )
 
+@app.post("/chatbot/stream")
+async def stream_chat_with_gemini(
+    chat_message: ChatMessage,
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Stream the assistant's reply as NDJSON lines while it is being generated.
+
+    Each line is one of {"type": "token", "text": ...}, {"type": "done"} or
+    {"type": "error", "error": ..., "response": ...}.
+    """
+    if not chatbot_backend.available:
+        raise HTTPException(status_code=503, detail="Gemini API key not configured")
+
+    cached_text = chatbot_cache.get(chat_message.message, chat_message.context)
+
+    async def event_lines():
+        if cached_text:
+            yield json.dumps({"type": "token", "text": cached_text}) + "\n"
+            yield json.dumps({"type": "done"}) + "\n"
+            return
+
+        tokens = stream_chatbot_reply(build_chatbot_prompt(chat_message))
+        streamed = []
+        try:
+            async for token in tokens:
+                if await request.is_disconnected():
+                    break
+                streamed.append(token)
+                yield json.dumps({"type": "token", "text": token}) + "\n"
+            else:
+                # Only complete replies are worth caching
+                if streamed:
+                    chatbot_cache.put(chat_message.message, chat_message.context, "".join(streamed))
+                yield json.dumps({"type": "done"}) + "\n"
+        except ChatbotBusyError:
+            yield json.dumps({
+                "type": "error",
+                "error": "busy",
+                "response": "The AI assistant is busy. Please try again in a moment."
+            }) + "\n"
+        except asyncio.TimeoutError:
+            yield json.dumps({
+                "type": "error",
+                "error": "Generation timed out",
+                "response": "I'm sorry, that took too long to answer. Please try again or ask a shorter question."
+            }) + "\n"
+        except Exception as e:
+            print(f"Chatbot stream error: {str(e)}")
+            yield json.dumps({
+                "type": "error",
+                "error": str(e),
+                "response": "I'm sorry, I encountered an error while processing your request. Please try again later."
+            }) + "\n"
+        finally:
+            await tokens.aclose()
+
+    return StreamingResponse(
+        event_lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ================================= CODE SANDBOX =================================
+
+# User code runs in a throwaway working directory with a scrubbed environment (no API
+# secrets), in its own session so a timeout kills everything it forked, under kernel
+# limits: CPU seconds, memory, file size and no core dumps (setrlimit, applied by exec'ing
+# through prlimit: runs start from the judge's worker threads, where a preexec_fn is
+# unsafe). Where unprivileged user namespaces work it also gets fresh user/network/IPC/PID namespaces,
+# i.e. no network and no view of host processes. A process cap needs either a
+# dedicated SANDBOX_USER (RLIMIT_NPROC counts every process of the uid) or a delegated
+# cgroup v2 directory (pids.max, memory.max per run); without one the API and judge
+# workers refuse to start, unless SANDBOX_ALLOW_UNLIMITED_PROCESSES opts out.
+MAX_CODE_SIZE = int(os.getenv("MAX_CODE_SIZE", "10000"))
+MAX_INPUT_SIZE = int(os.getenv("MAX_INPUT_SIZE", "1000"))
+CODE_TIMEOUT = int(os.getenv("CODE_TIMEOUT", "10"))
+MAX_OUTPUT_SIZE = int(os.getenv("MAX_OUTPUT_SIZE", "5000"))
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "5"))
+# Submissions are judged on CPU time (user + sys), which load on the host doesn't inflate;
+# wall time only has to catch programs that block or sleep
+JUDGE_CPU_LIMIT = float(os.getenv("JUDGE_CPU_LIMIT", "2"))
+JUDGE_WALL_TIME_FACTOR = 3
+# The kernel checks RLIMIT_CPU on scheduler ticks, so a killed run can read slightly under it
+SANDBOX_CPU_SLACK = 0.01
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "256"))
+SANDBOX_MAX_PROCESSES = int(os.getenv("SANDBOX_MAX_PROCESSES", "64"))
+SANDBOX_MAX_FILE_KB = int(os.getenv("SANDBOX_MAX_FILE_KB", "1024"))
+SANDBOX_OUTPUT_LIMIT = int(os.getenv("SANDBOX_OUTPUT_LIMIT", str(64 * 1024)))  # Bytes per stream
+SANDBOX_NAMESPACES = os.getenv("SANDBOX_NAMESPACES", "auto")  # auto, on or off
+SANDBOX_USER = os.getenv("SANDBOX_USER")  # Dedicated account to run code as (needs root)
+SANDBOX_CGROUP_ROOT = os.getenv("SANDBOX_CGROUP_ROOT")  # e.g. /sys/fs/cgroup/judge
+# Lets code run with no process cap at all (a fork bomb takes the host down); development only
+SANDBOX_ALLOW_UNLIMITED_PROCESSES = os.getenv("SANDBOX_ALLOW_UNLIMITED_PROCESSES", "false").lower() == "true"
+
+SANDBOX_UNSHARE = ["unshare", "--user", "--map-root-user", "--net", "--ipc", "--pid", "--fork", "--kill-child", "--"]
+
+# memory_limit: V8 reserves gigabytes of address space up front, so node is held to
+# RLIMIT_DATA (what it actually allocates) instead of RLIMIT_AS
+SANDBOX_LANGUAGES = {
+    "python": {"suffix": ".py", "command": ["python", "-u"], "memory_limit": "RLIMIT_AS"},
+    "javascript": {
+        "suffix": ".js",
+        "command": ["node", f"--max-old-space-size={SANDBOX_MEMORY_MB}"],
+        "memory_limit": "RLIMIT_DATA"
+    }
+}
+
+_sandbox_namespaces_available = None
+
+def sandbox_namespaces_enabled() -> bool:
+    """Probe unprivileged namespaces once; SANDBOX_NAMESPACES=on fails closed without them"""
+    global _sandbox_namespaces_available
+    if SANDBOX_NAMESPACES == "off":
+        return False
+    if _sandbox_namespaces_available is None:
+        try:
+            probe = subprocess.run(SANDBOX_UNSHARE + ["true"], capture_output=True, timeout=5)
+            _sandbox_namespaces_available = probe.returncode == 0
+        except (OSError, subprocess.SubprocessError):
+            _sandbox_namespaces_available = False
+    if SANDBOX_NAMESPACES == "on" and not _sandbox_namespaces_available:
+        raise RuntimeError("SANDBOX_NAMESPACES=on but user namespaces are not available")
+    return _sandbox_namespaces_available
+
+PRLIMIT_OPTIONS = {"RLIMIT_AS": "--as", "RLIMIT_DATA": "--data"}
+
+def sandbox_limits_command(memory_limit: str, cgroup: Optional[str], cpu_seconds: int = SANDBOX_CPU_SECONDS) -> List[str]:
+    """Exec wrapper that puts the program in its cgroup and under its rlimits.
+
+    It runs in the child after the switch to SANDBOX_USER: sh moves itself into the
+    cgroup, then execs prlimit, which sets the limits on itself and execs the program.
+    """
+    memory = SANDBOX_MEMORY_MB * 1024 * 1024
+    file_size = SANDBOX_MAX_FILE_KB * 1024
+    # A single value sets soft and hard limit alike: SIGKILL right at the CPU limit, as
+    # PID 1 of its namespace the program never sees the SIGXCPU a lower soft limit sends
+    command = [
+        "prlimit",
+        f"--cpu={cpu_seconds}",
+        f"{PRLIMIT_OPTIONS[memory_limit]}={memory}",
+        f"--fsize={file_size}",
+        "--core=0"
+    ]
+    if SANDBOX_USER:
+        command.append(f"--nproc={SANDBOX_MAX_PROCESSES}")
+    command.append("--")
+    if cgroup:
+        command = ["sh", "-c", 'echo $$ > "$0" && exec "$@"', os.path.join(cgroup, "cgroup.procs")] + command
+    return command
+
+def create_sandbox_cgroup() -> Optional[str]:
+    if not SANDBOX_CGROUP_ROOT:
+        return None
+    cgroup = tempfile.mkdtemp(prefix="run-", dir=SANDBOX_CGROUP_ROOT)
+    limits = {
+        "pids.max": str(SANDBOX_MAX_PROCESSES),
+        "memory.max": str(SANDBOX_MEMORY_MB * 1024 * 1024),
+        "memory.swap.max": "0"
+    }
+    for name, value in limits.items():
+        try:
+            with open(os.path.join(cgroup, name), "w") as control:
+                control.write(value)
+        except OSError:
+            pass  # Controller not enabled for this subtree
+    return cgroup
+
+def sandbox_process_limited() -> bool:
+    """Whether runs are capped: by RLIMIT_NPROC on SANDBOX_USER, or by pids.max in their
+    cgroups, which needs the pids controller enabled below SANDBOX_CGROUP_ROOT"""
+    if SANDBOX_USER:
+        return True
+    if not SANDBOX_CGROUP_ROOT:
+        return False
+    try:
+        with open(os.path.join(SANDBOX_CGROUP_ROOT, "cgroup.subtree_control")) as controllers:
+            return "pids" in controllers.read().split()
+    except OSError:
+        return False
+
+def require_sandbox_process_limit():
+    if not sandbox_process_limited() and not SANDBOX_ALLOW_UNLIMITED_PROCESSES:
+        raise RuntimeError(
+            "Sandboxed code would have no process limit: set SANDBOX_USER, or SANDBOX_CGROUP_ROOT "
+            "to a cgroup v2 directory with the pids controller enabled for its children. "
+            "SANDBOX_ALLOW_UNLIMITED_PROCESSES=true runs code without one (development only)."
+        )
+
+def kill_process_group(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def reap_process(process: subprocess.Popen, deadline: Optional[float] = None):
+    """Wait for process to exit (until deadline, if given) and return the resource usage
+    of it and its reaped descendants; None if it is still running at the deadline"""
+    while True:
+        pid, wait_status, usage = os.wait4(process.pid, 0 if deadline is None else os.WNOHANG)
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(wait_status)
+            return usage
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.005)
+
+def resident_memory_kb() -> int:
+    """Current RSS of this (API) process"""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() // 1024
+
+def sandbox_peak_memory_kb(cgroup: Optional[str], max_rss_kb: int, inherited_kb: int) -> Optional[int]:
+    """Peak memory of a run in KB, or None if it can't be told apart from the API process.
+
+    A forked child starts out with the API process's resident pages counted in its
+    ru_maxrss, so that figure is only the program's own once it is above what the child
+    inherited. The cgroup's memory.peak (Linux 5.19+) has no such floor.
+    """
+    if cgroup:
+        try:
+            with open(os.path.join(cgroup, "memory.peak")) as peak:
+                return int(peak.read()) // 1024
+        except (OSError, ValueError):
+            pass
+    return max_rss_kb if max_rss_kb > inherited_kb else None
+
+class OutputCollector:
+    """Reads a pipe into buffers allocated once, up front.
+
+    Data goes straight from the pipe into the buffer (no per-read chunks). The first
+    `keep` bytes are retained; past that, reads go into a fixed scratch buffer and are
+    only shown to the consumer, so memory per stream stays bounded however much the
+    program prints. Reading stops once `limit` bytes have been seen or the consumer
+    returns False.
+    """
+
+    SCRATCH_SIZE = 65536
+
+    def __init__(self, stream, limit: int, keep: Optional[int] = None, consumer=None):
+        self.stream = stream
+        self.limit = limit
+        keep = limit if keep is None else min(keep, limit)
+        # When everything is kept, one spare byte is how overflow is noticed
+        self.buffer = bytearray(keep + 1 if keep == limit else keep)
+        self.view = memoryview(self.buffer)
+        self.scratch = memoryview(bytearray(self.SCRATCH_SIZE)) if keep < limit else None
+        self.consumer = consumer
+        self.kept = 0
+        self.size = 0
+        self.rejected = False
+
+    @property
+    def exceeded(self) -> bool:
+        return self.size > self.limit
+
+    def read(self) -> bool:
+        """Take whatever the pipe has; False at EOF, past the limit or on rejection"""
+        if self.kept < len(self.buffer):
+            count = os.readv(self.stream.fileno(), [self.view[self.kept:]])
+            data = self.view[self.kept:self.kept + count]
+            self.kept += count
+        else:
+            count = os.readv(self.stream.fileno(), [self.scratch])
+            data = self.scratch[:count]
+        self.size += count
+        if count and self.consumer and not self.consumer(data):
+            self.rejected = True
+        return count > 0 and not self.exceeded and not self.rejected
+
+    def getvalue(self) -> bytes:
+        return bytes(self.view[:min(self.kept, self.limit)])
+
+def communicate_capped(
+    process: subprocess.Popen,
+    stdin_data: bytes,
+    timeout: float,
+    limit: int,
+    keep: Optional[int] = None,
+    stdout_consumer=None
+) -> dict:
+    """communicate() that never holds more than `limit` bytes of stdout and
+    SANDBOX_OUTPUT_LIMIT of stderr.
+
+    The process group is killed the moment either stream goes past the limit, the
+    stdout consumer rejects the output, or the timeout passes, so a program printing
+    in a loop cannot grow API memory.
+    """
+    deadline = time.monotonic() + timeout
+    collectors = {
+        process.stdout: OutputCollector(process.stdout, limit, keep, stdout_consumer),
+        # Room for long answers is only ever needed on stdout
+        process.stderr: OutputCollector(process.stderr, min(limit, SANDBOX_OUTPUT_LIMIT))
+    }
+    timed_out = stopped = False
+    written = 0
+
+    with selectors.DefaultSelector() as selector:
+        if stdin_data:
+            os.set_blocking(process.stdin.fileno(), False)
+            selector.register(process.stdin, selectors.EVENT_WRITE)
+        else:
+            process.stdin.close()
+        selector.register(process.stdout, selectors.EVENT_READ)
+        selector.register(process.stderr, selectors.EVENT_READ)
+
+        while selector.get_map() and not stopped:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(remaining):
+                if key.fileobj is process.stdin:
+                    try:
+                        written += os.write(key.fd, stdin_data[written:written + 65536])
+                    except BlockingIOError:
+                        continue
+                    except BrokenPipeError:
+                        written = len(stdin_data)  # Program stopped reading; not an error
+                    if written >= len(stdin_data):
+                        selector.unregister(process.stdin)
+                        process.stdin.close()
+                    continue
+                collector = collectors[key.fileobj]
+                if not collector.read():
+                    if collector.exceeded or collector.rejected:
+                        stopped = True
+                        break
+                    selector.unregister(key.fileobj)
+
+    usage = None
+    if not (timed_out or stopped):
+        usage = reap_process(process, deadline)
+        timed_out = usage is None
+    if timed_out or stopped:
+        kill_process_group(process)
+        usage = reap_process(process)
+    for stream in (process.stdin, process.stdout, process.stderr):
+        if not stream.closed:
+            stream.close()
+    stdout, stderr = collectors[process.stdout], collectors[process.stderr]
+    return {
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        "timed_out": timed_out,
+        "output_limit_exceeded": stdout.exceeded or stderr.exceeded,
+        "rejected": stdout.rejected,
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        "max_rss_kb": usage.ru_maxrss  # Peak of the largest process in the tree (KB on Linux)
+    }
+
+def run_sandboxed(
+    language: str,
+    code: str,
+    stdin="",
+    timeout: float = CODE_TIMEOUT,
+    output_limit: int = SANDBOX_OUTPUT_LIMIT,
+    keep: Optional[int] = None,
+    stdout_consumer=None,
+    cpu_limit: Optional[float] = None
+) -> dict:
+    """Run code in the sandbox; returns its capped output, exit status and resource use.
+
+    cpu_limit (seconds, at most SANDBOX_CPU_SECONDS) is the CPU time the run may use;
+    the kernel stops it just past the limit and cpu_limit_exceeded reports it.
+
+    stdin is text or any bytes-like object, such as a memory-mapped test data file,
+    which is written to the program a slice at a time without being copied whole.
+    stdout_consumer, if given, sees stdout as it arrives and can stop the run early by
+    returning False (reported as "rejected").
+    """
+    spec = SANDBOX_LANGUAGES.get(language)
+    if not spec:
+        raise ValueError(f"Unsupported language: {language}")
+
+    cpu_limit = min(cpu_limit or SANDBOX_CPU_SECONDS, SANDBOX_CPU_SECONDS)
+    workdir = tempfile.mkdtemp(prefix="sandbox-")
+    cgroup = None
+    try:
+        source_path = os.path.join(workdir, "main" + spec["suffix"])
+        with open(source_path, "w") as source:
+            source.write(code)
+        user_options = {}
+        if SANDBOX_USER:
+            os.chmod(workdir, 0o777)
+            os.chmod(source_path, 0o644)
+            user_options = {"user": SANDBOX_USER, "group": SANDBOX_USER, "extra_groups": []}
+
+        command = spec["command"] + [source_path]
+        if sandbox_namespaces_enabled():
+            command = SANDBOX_UNSHARE + command
+        cgroup = create_sandbox_cgroup()
+        command = sandbox_limits_command(spec["memory_limit"], cgroup, math.ceil(cpu_limit)) + command
+
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=workdir,
+            env={"PATH": os.environ.get("PATH", "/usr/bin:/bin"), "HOME": workdir, "LANG": "C.UTF-8"},
+            start_new_session=True,
+            **user_options
+        )
+        inherited_kb = resident_memory_kb()
+        stdin_data = (stdin or "").encode() if isinstance(stdin, str) or stdin is None else stdin
+        run = communicate_capped(process, stdin_data, timeout, output_limit, keep, stdout_consumer)
+        cpu_time = run["cpu_time"]
+        return {
+            "returncode": process.returncode,
+            "stdout": run["stdout"].decode("utf-8", errors="replace"),
+            "stderr": run["stderr"].decode("utf-8", errors="replace"),
+            "timed_out": run["timed_out"],
+            "output_limit_exceeded": run["output_limit_exceeded"],
+            "rejected": run["rejected"],
+            # Under unshare the signal is seen by the wrapper, not us, so go by CPU time
+            "cpu_limit_exceeded": not run["timed_out"] and cpu_time >= cpu_limit - SANDBOX_CPU_SLACK,
+            "cpu_time": cpu_time,
+            "wall_time": time.perf_counter() - started,
+            "max_rss_kb": sandbox_peak_memory_kb(cgroup, run["max_rss_kb"], inherited_kb)
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if cgroup:
+            try:
+                os.rmdir(cgroup)
+            except OSError:
+                pass
+
+def measure_sandbox_overhead(runs: int) -> dict:
+    """Mean wall time of a no-op Python program with and without the sandbox"""
+    def mean_ms(run) -> float:
+        started = time.perf_counter()
+        for _ in range(runs):
+            run()
+        return (time.perf_counter() - started) / runs * 1000
+
+    bare_ms = mean_ms(lambda: subprocess.run(["python", "-c", "pass"], capture_output=True))
+    sandboxed_ms = mean_ms(lambda: run_sandboxed("python", "pass"))
+    return {
+        "runs": runs,
+        "bare_ms": round(bare_ms, 2),
+        "sandboxed_ms": round(sandboxed_ms, 2),
+        "overhead_ms": round(sandboxed_ms - bare_ms, 2)
+    }
+
+# Runs execute on a fixed pool of judge threads, never on the event loop. Waiting jobs
+# sit in priority lanes (contest submissions, then practice submissions, then /compile
+# runs, then admin rejudges). Within a lane, users take turns by deficit round robin weighted by job cost
+# (sandbox runs: a submission costs one per test case), so a user resubmitting in a
+# loop only delays their own jobs. Past JUDGE_QUEUE_LIMIT waiting jobs, or
+# JUDGE_USER_QUEUE_LIMIT for one user, callers get 429 with an estimate of when to retry.
+JUDGE_WORKERS = int(os.getenv("JUDGE_WORKERS", str(os.cpu_count() or 2)))
+JUDGE_QUEUE_LIMIT = int(os.getenv("JUDGE_QUEUE_LIMIT", "32"))
+JUDGE_USER_QUEUE_LIMIT = int(os.getenv("JUDGE_USER_QUEUE_LIMIT", "4"))
+JUDGE_LANES = ["contest", "practice", "run", "rejudge"]
+JUDGE_QUANTUM = 4  # Cost credit a user gets per round
+JUDGE_WAIT_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+JUDGE_DEPTH_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100]
+
+class JudgeBusyError(Exception):
+    """Raised when the judge queue is full"""
+
+    def __init__(self, queue_position: int, retry_after: int):
+        super().__init__("Judge queue is full")
+        self.queue_position = queue_position
+        self.retry_after = retry_after
+
+def judge_busy_error(busy: JudgeBusyError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"The judge is busy. Try again in {busy.retry_after} seconds.",
+        headers={"Retry-After": str(busy.retry_after)}
+    )
+
+class Histogram:
+    """Counts of observed values by upper bucket bound, reported cumulatively"""
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def snapshot(self) -> dict:
+        cumulative = list(itertools.accumulate(self.counts))
+        return {
+            "buckets": {str(bound): count for bound, count in zip(self.bounds + ["+Inf"], cumulative)},
+            "count": cumulative[-1],
+            "sum": round(self.total, 3)
+        }
+
+class JudgeJob:
+    def __init__(self, func, args: tuple, user: str, lane: str, cost: int, future: asyncio.Future):
+        self.func = func
+        self.args = args
+        self.user = user
+        self.lane = lane
+        self.cost = cost
+        self.future = future
+        self.queued_at = time.monotonic()
+
+class FairQueue:
+    """Priority lanes, each a deficit round robin over per-user FIFO queues"""
+
+    def __init__(self, lanes: List[str], quantum: int):
+        self.lanes = {lane: OrderedDict() for lane in lanes}  # user -> deque of jobs, in turn order
+        self.deficits = {}  # (lane, user) -> cost credit left this round
+        self.quantum = quantum
+        self.user_jobs = {}  # user -> queued jobs over all lanes
+        self.cost = 0
+
+    def __len__(self) -> int:
+        return sum(self.user_jobs.values())
+
+    def lane_size(self, lane: str) -> int:
+        return sum(len(jobs) for jobs in self.lanes[lane].values())
+
+    def push(self, job: JudgeJob):
+        flows = self.lanes[job.lane]
+        if job.user not in flows:
+            flows[job.user] = deque()
+            self.deficits[(job.lane, job.user)] = 0
+        flows[job.user].append(job)
+        self.user_jobs[job.user] = self.user_jobs.get(job.user, 0) + 1
+        self.cost += job.cost
+
+    def _take(self, flows: OrderedDict, user: str, lane: str) -> JudgeJob:
+        job = flows[user].popleft()
+        if not flows[user]:
+            # An emptied queue gives up its turn and any credit left
+            del flows[user]
+            del self.deficits[(lane, user)]
+        self.user_jobs[user] -= 1
+        if not self.user_jobs[user]:
+            del self.user_jobs[user]
+        self.cost -= job.cost
+        return job
+
+    def pop(self) -> Optional[JudgeJob]:
+        """Next job to run, skipping ones whose caller has gone away"""
+        for lane, flows in self.lanes.items():
+            while flows:
+                user, jobs = next(iter(flows.items()))
+                if jobs[0].future.done():
+                    self._take(flows, user, lane)
+                    continue
+                if self.deficits[(lane, user)] >= jobs[0].cost:
+                    self.deficits[(lane, user)] -= jobs[0].cost
+                    return self._take(flows, user, lane)
+                # Out of credit: top up and go to the back of the round
+                self.deficits[(lane, user)] += self.quantum
+                flows.move_to_end(user)
+        return None
+
+class JudgePool:
+    """Fixed judge thread pool fed by a FairQueue, with admission control"""
+
+    def __init__(self, workers: int, queue_limit: int, user_queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.user_queue_limit = user_queue_limit
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="judge")
+        self.queue = FairQueue(JUDGE_LANES, JUDGE_QUANTUM)
+        self.running = 0
+        self.average_run_time = 1.0  # Seconds per unit of cost, moving average
+        self.rejected = 0
+        self.queue_depth = Histogram(JUDGE_DEPTH_BUCKETS)  # Jobs waiting, as seen by each arrival
+        self.wait_times = {lane: Histogram(JUDGE_WAIT_BUCKETS) for lane in JUDGE_LANES}
+
+    @property
+    def waiting(self) -> int:
+        return len(self.queue)
+
+    def retry_after(self, cost: int = 1) -> int:
+        """Seconds until the current queue has likely drained"""
+        return max(1, math.ceil((self.queue.cost + cost) / self.workers * self.average_run_time))
+
+    def check_admission(self, user: str, cost: int = 1):
+        """Raise JudgeBusyError if a job from this user would be turned away now"""
+        waiting = self.waiting
+        if waiting >= self.queue_limit or self.queue.user_jobs.get(user, 0) >= self.user_queue_limit:
+            self.rejected += 1
+            raise JudgeBusyError(waiting, self.retry_after(cost))
+
+    async def run(self, func, *args, user: str = "", lane: str = "run", cost: int = 1):
+        self.check_admission(user, cost)
+        waiting = self.waiting
+        self.queue_depth.observe(waiting)
+        job = JudgeJob(func, args, user, lane, cost, asyncio.get_running_loop().create_future())
+        self.queue.push(job)
+        self.dispatch()
+        return await job.future
+
+    def dispatch(self):
+        while self.running < self.workers:
+            job = self.queue.pop()
+            if job is None:
+                return
+            self.running += 1
+            self.wait_times[job.lane].observe(time.monotonic() - job.queued_at)
+            asyncio.ensure_future(self.execute(job))
+
+    async def execute(self, job: JudgeJob):
+        started = time.monotonic()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, job.func, *job.args)
+            if not job.future.done():
+                job.future.set_result(result)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self.running -= 1
+            elapsed = (time.monotonic() - started) / max(job.cost, 1)
+            self.average_run_time = 0.8 * self.average_run_time + 0.2 * elapsed
+            self.dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "waiting": self.waiting,
+            "waiting_by_lane": {lane: self.queue.lane_size(lane) for lane in JUDGE_LANES},
+            "queue_limit": self.queue_limit,
+            "user_queue_limit": self.user_queue_limit,
+            "average_run_time": round(self.average_run_time, 3),
+            "rejected": self.rejected,
+            "queue_depth": self.queue_depth.snapshot(),
+            "wait_seconds": {lane: histogram.snapshot() for lane, histogram in self.wait_times.items()}
+        }
+
+judge_pool = JudgePool(JUDGE_WORKERS, JUDGE_QUEUE_LIMIT, JUDGE_USER_QUEUE_LIMIT)
+
+# Identical runs (same language and runtime, code, stdin, limits and sandbox/judge
+# settings) are served from memory. Results that depend on machine load (timeouts,
+# CPU-limit kills, verdicts from a checker script that timed out) are never cached, and
+# entries expire so programs using time or randomness don't stick forever.
+EXECUTION_CACHE_ENTRIES = int(os.getenv("EXECUTION_CACHE_ENTRIES", "2000"))
+EXECUTION_CACHE_MB = int(os.getenv("EXECUTION_CACHE_MB", "64"))
+EXECUTION_CACHE_TTL = int(os.getenv("EXECUTION_CACHE_TTL", "600"))
+
+_runtime_versions = {}
+
+def runtime_version(language: str) -> str:
+    """Interpreter version, probed once per process"""
+    if language not in _runtime_versions:
+        spec = SANDBOX_LANGUAGES.get(language)
+        try:
+            probe = subprocess.run([spec["command"][0], "--version"], capture_output=True, text=True, timeout=5)
+            _runtime_versions[language] = (probe.stdout or probe.stderr).strip()
+        except (TypeError, OSError, subprocess.SubprocessError):
+            _runtime_versions[language] = "unknown"
+    return _runtime_versions[language]
+
+@app.on_event("startup")
+async def check_sandbox_process_limit():
+    # Every API process runs /compile code, so a missing limit stops it here rather than
+    # failing each run
+    require_sandbox_process_limit()
+
+@app.on_event("startup")
+async def probe_runtime_versions():
+    """Probe interpreters off the event loop before the first cache key needs them"""
+    for language in SANDBOX_LANGUAGES:
+        await asyncio.to_thread(runtime_version, language)
+
+def content_digest(data, digest: Optional[str] = None) -> str:
+    """sha256 of text or bytes-like data; a known digest (a test data ref) is used as is"""
+    if digest:
+        return digest
+    return hashlib.sha256(data.encode() if isinstance(data, str) else data).hexdigest()
+
+def execution_cache_key(
+    language: str,
+    code: str,
+    stdin,
+    timeout: float,
+    output_limit: int,
+    checker: str = "",
+    stdin_digest: Optional[str] = None,
+    cpu_limit: Optional[float] = None
+) -> str:
+    """checker is the fingerprint of the output checker, for results that carry a verdict.
+
+    Probes the runtime version on first use, so call it off the event loop.
+    """
+    limits = (timeout, output_limit, cpu_limit)
+    settings = (
+        SANDBOX_CPU_SECONDS, SANDBOX_MEMORY_MB, SANDBOX_MAX_FILE_KB, SANDBOX_MAX_PROCESSES,
+        SANDBOX_NAMESPACES, SANDBOX_USER, SANDBOX_CGROUP_ROOT,
+        JUDGE_WALL_TIME_FACTOR, MAX_OUTPUT_SIZE, CHECKER_SCRIPT_TIMEOUT
+    )
+    parts = [
+        language,
+        runtime_version(language),
+        hashlib.sha256(code.encode()).hexdigest(),
+        content_digest(stdin or "", stdin_digest),
+        repr(limits),
+        repr(settings),
+        checker
+    ]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+class ExecutionCache:
+    """LRU + TTL cache of sandbox results, bounded by entry count and output bytes"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, size, result), least recently used first
+        self.lock = threading.Lock()  # Judge threads share the cache
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remove(self, key: str):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def get(self, key: str) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[2])
+
+    def put(self, key: str, result: dict):
+        if result["timed_out"] or result["cpu_limit_exceeded"]:
+            return
+        size = len(result["stdout"]) + len(result["stderr"])
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, size, dict(result))
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0
+        }
+
+execution_cache = ExecutionCache(EXECUTION_CACHE_ENTRIES, EXECUTION_CACHE_MB * 1024 * 1024, EXECUTION_CACHE_TTL)
+
+# Output checkers decide whether a test case's stdout is accepted. Streaming checkers
+# are fed stdout as it arrives (run_sandboxed's stdout_consumer) and reject a wrong
+# answer as soon as it diverges, killing the run early; nothing but a small display
+# prefix of the output is kept. Script checkers need the whole output and run after.
+# Expected output is text or bytes-like (a memory-mapped test data file); the streaming
+# checkers walk it in place rather than copying or splitting it up front.
+CHECKER_TYPES = ["exact", "tokens", "float", "script"]
+CHECKER_DEFAULT_TOLERANCE = 1e-6
+CHECKER_SCRIPT_TIMEOUT = 5
+
+class OutputChecker:
+    """Accepts any output; used when a test case has no expected output"""
+    streaming = True
+    timed_out = False  # Set when the verdict came from a run that hit its time limit
+
+    def __init__(self, expected, spec: dict, test_input, expected_digest: Optional[str] = None):
+        expected = expected or b""
+        self.expected_data = expected.encode() if isinstance(expected, str) else expected
+        self.expected_digest = content_digest(self.expected_data, expected_digest)
+        self.spec = spec
+
+    @property
+    def fingerprint(self) -> str:
+        description = json.dumps([type(self).__name__, self.spec, self.expected_digest], sort_keys=True)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def feed(self, data) -> bool:
+        """Take the next piece of stdout; False once the output can no longer be accepted"""
+        return True
+
+    def finish(self, output: str) -> bool:
+        """Final verdict; output is the kept stdout"""
+        return True
+
+class ExactChecker(OutputChecker):
+    """Output must equal the expected output, ignoring leading and trailing whitespace"""
+
+    def __init__(self, expected, spec: dict, test_input, expected_digest: Optional[str] = None):
+        super().__init__(expected, spec, test_input, expected_digest)
+        # Bounds of the expected output without surrounding whitespace; position is
+        # relative to start
+        first = re.search(rb"\S", self.expected_data)
+        self.start = first.start() if first else 0
+        self.end = len(self.expected_data)
+        while self.end > self.start and self.expected_data[self.end - 1:self.end].isspace():
+            self.end -= 1
+        self.position = 0
+        self.started = False
+        self.pending = b""  # Whitespace that may turn out to be trailing
+        self.only_whitespace = False  # Pending whitespace outgrew the rest of expected
+
+    def feed(self, data) -> bool:
+        chunk = bytes(data)
+        if not self.started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return True
+            self.started = True
+        body = chunk.rstrip()
+        tail = chunk[len(body):]
+        if body:
+            segment = self.pending + body
+            offset = self.start + self.position
+            if (
+                self.only_whitespace
+                or offset + len(segment) > self.end
+                or self.expected_data[offset:offset + len(segment)] != segment
+            ):
+                return False
+            self.position += len(segment)
+            self.pending = tail
+        else:
+            self.pending += tail
+        if len(self.pending) > self.end - self.start - self.position:
+            self.only_whitespace = True
+            self.pending = b""
+        return True
+
+    def finish(self, output: str) -> bool:
+        return self.position == self.end - self.start
+
+class TokenChecker(OutputChecker):
+    """Whitespace-insensitive: output must have the same whitespace-separated tokens"""
+
+    def __init__(self, expected, spec: dict, test_input, expected_digest: Optional[str] = None):
+        super().__init__(expected, spec, test_input, expected_digest)
+        self.expected_tokens = re.finditer(rb"\S+", self.expected_data)
+        self.current = self.next_expected()  # None once every expected token matched
+        self.partial = b""  # Token that may continue in the next chunk
+
+    def next_expected(self) -> Optional[bytes]:
+        token = next(self.expected_tokens, None)
+        return token.group() if token else None
+
+    def match(self, token: bytes, expected: bytes) -> bool:
+        return token == expected
+
+    def consume(self, token: bytes) -> bool:
+        if self.current is None or not self.match(token, self.current):
+            return False
+        self.current = self.next_expected()
+        return True
+
+    def feed(self, data) -> bool:
+        chunk = self.partial + bytes(data)
+        tokens = chunk.split()
+        self.partial = tokens.pop() if tokens and not chunk[-1:].isspace() else b""
+        if not all(self.consume(token) for token in tokens):
+            return False
+        # The partial token can only grow into the current expected one (plus slack for numbers)
+        return len(self.partial) <= len(self.current or b"") + 64
+
+    def finish(self, output: str) -> bool:
+        if self.partial and not self.consume(self.partial):
+            return False
+        return self.current is None
+
+class FloatChecker(TokenChecker):
+    """Like tokens, but numbers match within an absolute or relative tolerance"""
+
+    def __init__(self, expected, spec: dict, test_input, expected_digest: Optional[str] = None):
+        super().__init__(expected, spec, test_input, expected_digest)
+        self.tolerance = float(spec.get("tolerance", CHECKER_DEFAULT_TOLERANCE))
+
+    def match(self, token: bytes, expected: bytes) -> bool:
+        if token == expected:
+            return True
+        try:
+            return math.isclose(float(token), float(expected), rel_tol=self.tolerance, abs_tol=self.tolerance)
+        except ValueError:
+            return False
+
+def write_json_string(stream, data, chunk_size: int = 65536):
+    """Write text or UTF-8 bytes-like data to a binary stream as a JSON string, a chunk at a time"""
+    stream.write(b'"')
+    if isinstance(data, str):
+        chunks = (data[start:start + chunk_size] for start in range(0, len(data), chunk_size))
+    else:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        chunks = itertools.chain(
+            (decoder.decode(data[start:start + chunk_size]) for start in range(0, len(data), chunk_size)),
+            [decoder.decode(b"", final=True)]
+        )
+    for chunk in chunks:
+        stream.write(json.dumps(chunk)[1:-1].encode())
+    stream.write(b'"')
+
+class ScriptChecker(OutputChecker):
+    """A Python script run in the sandbox decides.
+
+    It reads {"input", "expected_output", "output"} as JSON on stdin and accepts by
+    exiting with status 0.
+    """
+    streaming = False
+
+    def __init__(self, expected, spec: dict, test_input, expected_digest: Optional[str] = None):
+        super().__init__(expected, spec, test_input, expected_digest)
+        self.test_input = test_input
+
+    def finish(self, output: str) -> bool:
+        # The JSON is written to a temporary file a slice at a time and mapped back in as
+        # the script's stdin, so large input and expected output are never copied whole
+        with tempfile.TemporaryFile() as payload_file:
+            fields = [("input", self.test_input or ""), ("expected_output", self.expected_data), ("output", output)]
+            for number, (name, data) in enumerate(fields):
+                payload_file.write((("{" if number == 0 else ", ") + json.dumps(name) + ": ").encode())
+                write_json_string(payload_file, data)
+            payload_file.write(b"}")
+            payload_file.flush()
+            payload = mmap.mmap(payload_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            cache_key = execution_cache_key("python", self.spec["script"], payload, CHECKER_SCRIPT_TIMEOUT, SANDBOX_OUTPUT_LIMIT)
+            result = execution_cache.get(cache_key)
+            if result is None:
+                result = run_sandboxed("python", self.spec["script"], payload, CHECKER_SCRIPT_TIMEOUT)
+                execution_cache.put(cache_key, result)
+        finally:
+            payload.close()
+        self.timed_out = result["timed_out"] or result["cpu_limit_exceeded"]
+        return result["returncode"] == 0 and not self.timed_out
+
+CHECKERS = {"exact": ExactChecker, "tokens": TokenChecker, "float": FloatChecker, "script": ScriptChecker}
+
+def validate_checker(spec: Optional[dict]):
+    if not spec:
+        return
+    if spec.get("type") not in CHECKER_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid checker type. Must be one of {CHECKER_TYPES}")
+    if spec["type"] == "script" and not spec.get("script"):
+        raise HTTPException(status_code=400, detail="Script checkers need a script")
+    if spec["type"] == "float":
+        try:
+            tolerance = float(spec.get("tolerance", CHECKER_DEFAULT_TOLERANCE))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Checker tolerance must be a number")
+        # math.isclose raises on negative tolerances, which would fail every answer
+        if not tolerance >= 0 or math.isinf(tolerance):
+            raise HTTPException(status_code=400, detail="Checker tolerance must be a non-negative number")
+
+def validate_test_cases(test_cases: Optional[List[dict]]):
+    """Every test case needs an expected output; without one any output would pass"""
+    for number, test_case in enumerate(test_cases or [], start=1):
+        if not isinstance(test_case.get("expected_output"), str):
+            raise HTTPException(status_code=400, detail=f"Test case {number} needs an expected_output")
+        if not isinstance(test_case.get("input", ""), str):
+            raise HTTPException(status_code=400, detail=f"Test case {number} input must be text")
+
+def validate_cpu_limit(cpu_limit: Optional[float]):
+    if cpu_limit is not None and not 0 < cpu_limit <= SANDBOX_CPU_SECONDS:
+        raise HTTPException(status_code=400, detail=f"CPU limit must be between 0 and {SANDBOX_CPU_SECONDS} seconds")
+
+def build_checker(spec: Optional[dict], expected, test_input, expected_digest: Optional[str] = None) -> OutputChecker:
+    """Checker for one test case; expected None (only the stand-in case of a challenge
+    without test cases) means the case only has to run cleanly"""
+    spec = spec or {"type": "exact"}
+    if expected is None:
+        return OutputChecker(expected, spec, test_input)
+    return CHECKERS[spec.get("type", "exact")](expected, spec, test_input, expected_digest)
+
+def sandbox_run_error(result: dict) -> Optional[str]:
+    """Why a judged run failed other than by giving a wrong answer, if it did"""
+    if result["timed_out"] or result["cpu_limit_exceeded"]:
+        return "Time limit exceeded"
+    if result.get("rejected"):
+        return None  # Killed early by the checker: a wrong answer
+    if result["output_limit_exceeded"]:
+        return "Output limit exceeded"
+    if result["returncode"] != 0:
+        return result["stderr"].strip()
+    return None
+
+def judge_submission(
+    language: str,
+    code: str,
+    test_cases: List[dict],
+    shown_cases: List[dict],
+    checker_spec: Optional[dict],
+    cpu_limit: float,
+    on_case=None
+) -> dict:
+    """Run code against every test case and return the per-case results.
+
+    Blocking: runs on a judge thread. shown_cases are the test cases as results display
+    them (previews of stored test data). on_case, if given, is called with each test
+    result as soon as it is known.
+    """
+    # CPU time used by the code across test cases; cached results carry the time of
+    # their original run
+    execution_time = 0.0
+    wall_timeout = cpu_limit * JUDGE_WALL_TIME_FACTOR
+    test_results = []
+    all_tests_passed = True
+
+    for i, (test_case, shown_case) in enumerate(zip(test_cases, shown_cases)):
+        test_input = expected_output = checker = None
+        try:
+            if language not in SANDBOX_LANGUAGES:
+                raise ValueError(f"Unsupported language: {language}")
+            if "expected_output" not in test_case and "expected_output_ref" not in test_case:
+                raise ValueError("Test case has no expected output")
+            test_input, input_digest = open_test_case_field(test_case, "input")
+            expected_output, expected_digest = open_test_case_field(test_case, "expected_output")
+            checker = build_checker(checker_spec, expected_output, test_input, expected_digest)
+
+            # Room for the expected answer with slack; anything much longer is wrong anyway
+            output_limit = max(SANDBOX_OUTPUT_LIMIT, 2 * len(checker.expected_data) + 1024)
+            cache_key = execution_cache_key(
+                language, code, test_input, wall_timeout, output_limit, checker.fingerprint, input_digest, cpu_limit
+            )
+            result = execution_cache.get(cache_key)
+            if result is None:
+                # Streaming checkers judge the output as it arrives; only a display prefix is kept
+                result = run_sandboxed(
+                    language, code, test_input, wall_timeout, output_limit,
+                    keep=MAX_OUTPUT_SIZE if checker.streaming else None,
+                    stdout_consumer=checker.feed if checker.streaming else None,
+                    cpu_limit=cpu_limit
+                )
+                result["accepted"] = (
+                    sandbox_run_error(result) is None
+                    and not result["rejected"]
+                    and checker.finish(result["stdout"])
+                )
+                if not checker.timed_out:
+                    execution_cache.put(cache_key, result)
+            execution_time += result["cpu_time"]
+
+            error = sandbox_run_error(result)
+            test_results.append({
+                "test_case": i + 1,
+                "passed": result["accepted"],
+                "input": shown_case.get("input", ""),
+                "expected_output": (shown_case.get("expected_output") or "").strip(),
+                "actual_output": result["stdout"].strip() if error is None else "",
+                "error": error,
+                "cpu_time": round(result["cpu_time"], 4),
+                "wall_time": round(result["wall_time"], 4),
+                "max_rss_kb": result["max_rss_kb"]
+            })
+            if not result["accepted"]:
+                all_tests_passed = False
+
+        except Exception as e:
+            test_results.append({
+                "test_case": i + 1,
+                "passed": False,
+                "input": shown_case.get("input", ""),
+                "expected_output": shown_case.get("expected_output") or "",
+                "actual_output": "",
+                "error": str(e)
+            })
+            all_tests_passed = False
+        finally:
+            checker = None  # Drops its views of the mapped test data before unmapping
+            close_test_case_data(test_input, expected_output)
+        if on_case:
+            on_case(test_results[-1])
+
+    return {"test_results": test_results, "all_tests_passed": all_tests_passed, "execution_time": execution_time}
+
 class CompileRequest(BaseModel):
     code: str
     language: str
@@ -1195,14 +3814,15 @@ async def compile_code(request: CompileRequest, current_user: User = Depends(get
     """
     try:
         # Validate code length (prevent extremely large code submissions)
-        if len(request.code) > 10000:  # 10KB limit
-            return {"output": "Error: Code too large (max 10KB allowed)", "error": True}
+        if len(request.code) > MAX_CODE_SIZE:
+            return {"output": f"Error: Code too large (max {MAX_CODE_SIZE // 1000}KB allowed)", "error": True}
         
         # Validate inputs length
-        if request.inputs and len(request.inputs) > 1000:  # 1KB limit for inputs
-            return {"output": "Error: Input too large (max 1KB allowed)", "error": True}
+        if request.inputs and len(request.inputs) > MAX_INPUT_SIZE:
+            return {"output": f"Error: Input too large (max {MAX_INPUT_SIZE // 1000}KB allowed)", "error": True}
         
-        # Basic security check - prevent dangerous imports/commands
+        # Basic security check - prevent dangerous imports/commands.
+        # The sandbox is what actually contains the code; this only gives early feedback.
         dangerous_patterns = [
             'import os', 'import subprocess', 'import sys', '__import__',
             'eval(', 'exec(', 'open(', 'file(', 'input(', 'raw_input(',
@@ -1217,105 +3837,432 @@ async def compile_code(request: CompileRequest, current_user: User = Depends(get
                     "error": True
                 }
         
-        # Create a temporary file with proper extension
-        suffix = '.py' if request.language == 'python' else '.js' if request.language == 'javascript' else '.txt'
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix=suffix) as temp:
-            temp.write(request.code)
-            temp_path = temp.name
-
-        # Determine the execution command based on language
-        if request.language == 'python':
-            cmd = ['python', '-u', temp_path]  # -u for unbuffered output
-        elif request.language == 'javascript':
-            cmd = ['node', temp_path]
-        else:
-            os.unlink(temp_path)
+        # Execute the code in the sandbox with timeout and optional inputs, off the event loop
+        if request.language not in SANDBOX_LANGUAGES:
             raise ValueError(f"Unsupported language: {request.language}")
-
-        # Execute the code with timeout and optional inputs
+        cache_key = await asyncio.to_thread(
+            execution_cache_key, request.language, request.code, request.inputs, CODE_TIMEOUT, SANDBOX_OUTPUT_LIMIT
+        )
         try:
-            process = subprocess.Popen(
-                cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            # Provide inputs if available
-            stdout, stderr = process.communicate(
-                input=request.inputs if request.inputs else "", 
-                timeout=10
+            result = execution_cache.get(cache_key)
+            if result is None:
+                result = await judge_pool.run(
+                    run_sandboxed, request.language, request.code, request.inputs or "", CODE_TIMEOUT,
+                    user=str(current_user.id), lane="run"
+                )
+                execution_cache.put(cache_key, result)
+        except JudgeBusyError as busy:
+            return JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={
+                    "output": f"Error: The code runner is busy ({busy.queue_position} runs waiting). Try again in {busy.retry_after} seconds.",
+                    "error": True,
+                    "queue_position": busy.queue_position,
+                    "retry_after": busy.retry_after
+                },
+                headers={"Retry-After": str(busy.retry_after)}
             )
-            
-            # Clean up the temporary file
-            os.unlink(temp_path)
-
-            # Return the output or error
-            if process.returncode == 0:
-                output = stdout.strip() if stdout else "No output"
-                # Limit output size
-                if len(output) > 5000:
-                    output = output[:5000] + "\n... (output truncated)"
-                return {"output": output, "error": False}
-            else:
-                error_output = stderr.strip() if stderr else "Unknown error"
-                # Limit error output size
-                if len(error_output) > 2000:
-                    error_output = error_output[:2000] + "\n... (error truncated)"
-                return {"output": f"Runtime Error:\n{error_output}", "error": True}
-                
-        except subprocess.TimeoutExpired:
-            process.kill()
-            os.unlink(temp_path)
-            return {"output": "Error: Code execution timed out (10 seconds limit)", "error": True}
+        
+        if result["timed_out"]:
+            return {"output": f"Error: Code execution timed out ({CODE_TIMEOUT} seconds limit)", "error": True}
+        if result["output_limit_exceeded"]:
+            return {"output": f"Error: Output limit exceeded ({SANDBOX_OUTPUT_LIMIT // 1024}KB)", "error": True}
+        if result["cpu_limit_exceeded"]:
+            return {"output": f"Error: CPU time limit exceeded ({SANDBOX_CPU_SECONDS} seconds)", "error": True}
+        
+        # Return the output or error
+        if result["returncode"] == 0:
+            output = result["stdout"].strip() or "No output"
+            # Limit output size
+            if len(output) > MAX_OUTPUT_SIZE:
+                output = output[:MAX_OUTPUT_SIZE] + "\n... (output truncated)"
+            return {"output": output, "error": False}
+        else:
+            error_output = result["stderr"].strip() or "Unknown error"
+            # Limit error output size
+            if len(error_output) > 2000:
+                error_output = error_output[:2000] + "\n... (error truncated)"
+            return {"output": f"Runtime Error:\n{error_output}", "error": True}
 
     except Exception as e:
-        # Clean up temp file if it exists
-        try:
-            if 'temp_path' in locals():
-                os.unlink(temp_path)
-        except:
-            pass
         return {"output": f"Execution error: {str(e)}", "error": True}
 
+@app.get("/admin/judge-queue")
+async def admin_get_judge_queue_stats(admin_user: User = Depends(get_admin_user)):
+    """Admin endpoint reporting judge queue depth and wait-time histograms"""
+    return judge_pool.stats()
+
+@app.get("/admin/execution-cache")
+async def admin_get_execution_cache_stats(admin_user: User = Depends(get_admin_user)):
+    """Admin endpoint reporting execution cache hit rates"""
+    return execution_cache.stats()
+
+@app.get("/admin/sandbox")
+async def admin_get_sandbox_info(runs: int = 5, admin_user: User = Depends(get_admin_user)):
+    """Admin endpoint for the sandbox configuration and its measured per-run overhead"""
+    try:
+        runs = max(1, min(runs, 20))
+        namespaces = await asyncio.to_thread(sandbox_namespaces_enabled)
+        overhead = await asyncio.to_thread(measure_sandbox_overhead, runs)
+        return {
+            "limits": {
+                "cpu_seconds": SANDBOX_CPU_SECONDS,
+                "judge_cpu_seconds": JUDGE_CPU_LIMIT,
+                "memory_mb": SANDBOX_MEMORY_MB,
+                "max_file_kb": SANDBOX_MAX_FILE_KB,
+                "output_limit_bytes": SANDBOX_OUTPUT_LIMIT,
+                "max_processes": SANDBOX_MAX_PROCESSES if sandbox_process_limited() else None,
+                "unlimited_processes_allowed": SANDBOX_ALLOW_UNLIMITED_PROCESSES,
+                "timeout_seconds": CODE_TIMEOUT
+            },
+            "namespaces": namespaces,
+            "user": SANDBOX_USER,
+            "cgroup_root": SANDBOX_CGROUP_ROOT,
+            "judge_pool": judge_pool.stats(),
+            "execution_cache": execution_cache.stats(),
+            "overhead": overhead
+        }
+    except Exception as e:
+        print(f"Error measuring sandbox: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to measure sandbox overhead")
+
 
 # ================================= EVENT ENDPOINTS =================================
 
+# Events keep the legacy date/time strings, plus a real datetime "start" derived from
+# them. Range queries run against (user_id, start) and (start) indexes instead of
+# comparing strings. Legacy events whose strings don't parse keep them as they are and
+# get start_invalid instead of a start; they still show up in unfiltered listings.
+# Listings are paged on a (start, _id) keyset: a full page carries an X-Next-Cursor
+# header, and passing it back as `cursor` returns the page after it.
+EVENT_MIGRATION_BATCH_SIZE = 500
+EVENT_PAGE_SIZE = 1000  # Event documents per listing page
+
+def event_start(date: str, time: Optional[str] = "") -> datetime:
+    """Combine the legacy YYYY-MM-DD / HH:MM strings into a datetime"""
+    return datetime.strptime(f"{date} {time or '00:00'}", "%Y-%m-%d %H:%M")
+
+# start, end and the calendar ranges are wall-clock times in the event's own timezone, so
+# a 09:00 standup stays at 09:00 across DST changes. Only the reminder time is converted
+# to UTC, the way every other stored timestamp is.
+def event_zone(event: dict) -> ZoneInfo:
+    try:
+        return ZoneInfo(event.get("timezone") or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo("UTC")
+
+def validate_event_timezone(name: Optional[str]):
+    if not name:
+        return
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid timezone. Use an IANA name like Europe/Berlin")
+
+def event_wall_time(value: Optional[datetime], zone: ZoneInfo) -> Optional[datetime]:
+    """Timezone-aware datetimes (e.g. an end sent as "...Z") as wall-clock time in the event's zone"""
+    if value is not None and value.tzinfo:
+        return value.astimezone(zone).replace(tzinfo=None)
+    return value
+
+def event_time_utc(value: datetime, zone: ZoneInfo) -> datetime:
+    """An event's wall-clock time as naive UTC"""
+    return value.replace(tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+
+EVENT_CLEARABLE_FIELDS = ["recurrence", "end"]
+
+def validate_event_end(start: Optional[datetime], end: Optional[datetime]):
+    if start and end and end < start:
+        raise HTTPException(status_code=400, detail="Event end must not be before its start")
+
+def event_range_bounds(date: Optional[str], start_date: Optional[str], end_date: Optional[str]):
+    """Translate the date filters accepted by the event endpoints into a half-open [lo, hi) range"""
+    try:
+        if date:
+            day = event_start(date)
+            return day, day + timedelta(days=1)
+        lo = event_start(start_date) if start_date else None
+        # end_date is inclusive
+        hi = event_start(end_date) + timedelta(days=1) if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    return lo, hi
+
+def start_range(lo: Optional[datetime], hi: Optional[datetime]) -> dict:
+    bounds = {}
+    if lo:
+        bounds["$gte"] = lo
+    if hi:
+        bounds["$lt"] = hi
+    return {"start": bounds} if bounds else {}
+
+def event_range_query(date: Optional[str], start_date: Optional[str], end_date: Optional[str]) -> dict:
+    """Translate the date filters accepted by the event endpoints into a range on start"""
+    return start_range(*event_range_bounds(date, start_date, end_date))
+
+def encode_event_cursor(event: dict, id_field: str = "_id") -> str:
+    start = event.get("start")
+    return f"{start.isoformat() if start else ''}~{event[id_field]}"
+
+def decode_event_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    if not cursor:
+        return None
+    moment, _, object_id = cursor.partition("~")
+    try:
+        start = to_naive_utc(datetime.fromisoformat(moment)) if moment else None
+    except ValueError:
+        start = object_id = None
+    if not ObjectId.is_valid(object_id or ""):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return (start, ObjectId(object_id))
+
+def after_event_cursor(query: dict, cursor: Optional[tuple], id_field: str = "_id") -> dict:
+    """query narrowed to what sorts after cursor on (start, id_field); no start sorts first"""
+    if cursor is None:
+        return query
+    start, object_id = cursor
+    if start is None:
+        after = {"$or": [{"start": None, id_field: {"$gt": object_id}}, {"start": {"$type": "date"}}]}
+    else:
+        after = {"$or": [{"start": {"$gt": start}}, {"start": start, id_field: {"$gt": object_id}}]}
+    return {"$and": [query, after]} if query else after
+
+async def find_events_after(collection, query: dict, cursor: Optional[tuple], id_field: str = "_id", projection: Optional[dict] = None) -> List[dict]:
+    """Up to one more than a page of documents after cursor, in (start, id_field) order"""
+    return await collection.find(after_event_cursor(query, cursor, id_field), projection).sort(
+        [("start", 1), (id_field, 1)]
+    ).limit(EVENT_PAGE_SIZE + 1).to_list(EVENT_PAGE_SIZE + 1)
+
+def event_page(documents: List[dict], id_field: str = "_id") -> Tuple[List[dict], Optional[str]]:
+    """(the page, cursor of the next page or None if this is the last one)"""
+    if len(documents) <= EVENT_PAGE_SIZE:
+        return documents, None
+    documents = documents[:EVENT_PAGE_SIZE]
+    return documents, encode_event_cursor(documents[-1], id_field)
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+# Recurring events are stored once, with a repeat rule. Queries pick up every series
+# that may overlap the requested range and expand it into occurrences in memory, so
+# storage and query cost grow with the number of series, not occurrences.
+RECURRENCE_FREQUENCIES = ["daily", "weekly", "monthly", "yearly"]
+EVENT_EXPANSION_HORIZON = timedelta(days=366)  # Used when a range has no end
+EVENT_MAX_OCCURRENCES = 1000  # Per series per query
+RECURRENCE_MAX_PERIODS = 100000
+
+def validate_recurrence(rule: Optional[dict]):
+    if not rule:
+        return
+    if rule.get("freq") not in RECURRENCE_FREQUENCIES:
+        raise HTTPException(status_code=400, detail=f"Invalid recurrence frequency. Must be one of {RECURRENCE_FREQUENCIES}")
+    if (rule.get("interval") or 1) < 1:
+        raise HTTPException(status_code=400, detail="Recurrence interval must be at least 1")
+    if rule.get("count") is not None and rule["count"] < 1:
+        raise HTTPException(status_code=400, detail="Recurrence count must be at least 1")
+    if any(day not in range(7) for day in rule.get("by_weekday") or []):
+        raise HTTPException(status_code=400, detail="Recurrence weekdays must be between 0 (Monday) and 6 (Sunday)")
+    if rule.get("until"):
+        try:
+            datetime.strptime(rule["until"], '%Y-%m-%d')
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid recurrence until date. Use YYYY-MM-DD")
+
+def add_months(day: date_type, months: int) -> Optional[date_type]:
+    """Same day of month, months later; None if that month is too short"""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    if day.day > calendar.monthrange(year, month)[1]:
+        return None
+    return day.replace(year=year, month=month)
+
+def recurrence_dates(rule: dict, first: date_type, not_before: Optional[date_type] = None):
+    """Yield a series' occurrence dates in order.
+
+    Without a count, whole periods before not_before are skipped arithmetically rather
+    than generated; with a count every occurrence from the first has to be counted.
+    """
+    freq = rule["freq"]
+    interval = rule.get("interval") or 1
+    until = datetime.strptime(rule["until"], '%Y-%m-%d').date() if rule.get("until") else None
+    count = rule.get("count")
+    weekdays = sorted(set(rule.get("by_weekday") or [first.weekday()]))
+    week_start = first - timedelta(days=first.weekday())
+
+    period = 0
+    if not_before and not count and not_before > first:
+        days = (not_before - first).days
+        periods_behind = {"daily": days, "weekly": days // 7, "monthly": days // 31, "yearly": days // 366}[freq]
+        period = max(0, periods_behind // interval - 1)
+
+    produced = 0
+    while period < RECURRENCE_MAX_PERIODS:
+        if freq == "daily":
+            candidates = [first + timedelta(days=period * interval)]
+        elif freq == "weekly":
+            base = week_start + timedelta(weeks=period * interval)
+            candidates = [base + timedelta(days=weekday) for weekday in weekdays]
+        elif freq == "monthly":
+            candidates = [add_months(first, period * interval)]
+        else:
+            candidates = [add_months(first, 12 * period * interval)]
+
+        for day in candidates:
+            if day is None or day < first:
+                continue
+            if until and day > until:
+                return
+            yield day
+            produced += 1
+            if count and produced >= count:
+                return
+        period += 1
+
+def recurrence_series_end(rule: Optional[dict], start: datetime) -> Optional[datetime]:
+    """Start of the last occurrence, or None for open-ended series"""
+    if not rule or (not rule.get("until") and not rule.get("count")):
+        return None
+    last = start.date()
+    for last in recurrence_dates(rule, start.date()):
+        pass
+    return datetime.combine(last, start.time())
+
+def user_events_query(user_id: str, lo: Optional[datetime], hi: Optional[datetime]) -> dict:
+    """Single events starting in [lo, hi) plus every series that may overlap it"""
+    single = {"recurrence": None, **start_range(lo, hi)}
+    series = {"recurrence": {"$ne": None}}
+    if hi:
+        series["start"] = {"$lt": hi}
+    if lo:
+        series["$or"] = [{"series_end": None}, {"series_end": {"$gte": lo}}]
+    return {"user_id": user_id, "$or": [single, series]}
+
+def expand_event_occurrences(event: dict, lo: Optional[datetime], hi: Optional[datetime]) -> List[dict]:
+    """Materialize one series' occurrences in [lo, hi), applying its exceptions"""
+    first_start = event["start"]
+    lo = lo or first_start
+    hi = hi or lo + EVENT_EXPANSION_HORIZON
+    duration = event["end"] - first_start if event.get("end") else None
+    exdates = set(event.get("exdates") or [])
+    overrides = event.get("overrides") or {}
+    series_id = str(event.get("_id", ""))
+
+    occurrences = []
+    for day in recurrence_dates(event["recurrence"], first_start.date(), lo.date()):
+        start = datetime.combine(day, first_start.time())
+        if start >= hi:
+            break
+        day_key = day.isoformat()
+        if day_key in exdates:
+            continue
+        override = overrides.get(day_key, {})
+        if override.get("time"):
+            start = event_start(day_key, override["time"])
+        if start < lo:
+            continue
+
+        occurrence = {key: value for key, value in event.items() if key not in ("exdates", "overrides")}
+        occurrence.update(override)
+        occurrence.update({
+            "_id": f"{series_id}:{day_key}",
+            "series_id": series_id,
+            "occurrence_date": day_key,
+            "date": day_key,
+            "start": start,
+            "end": start + duration if duration else None
+        })
+        occurrences.append(occurrence)
+        if len(occurrences) >= EVENT_MAX_OCCURRENCES:
+            break
+    return occurrences
+
+def expand_recurring_events(events: List[dict], lo: Optional[datetime], hi: Optional[datetime]) -> List[dict]:
+    """Replace recurring series with their occurrences in [lo, hi), sorted by start.
+
+    Unbounded queries get the stored series back as-is.
+    """
+    if lo is None and hi is None:
+        return events
+    expanded = []
+    for event in events:
+        if event.get("recurrence") and event.get("start"):
+            expanded.extend(expand_event_occurrences(event, lo, hi))
+        else:
+            expanded.append(event)
+    expanded.sort(key=lambda event: event.get("start") or datetime.min)
+    return expanded
+
+async def migrate_event_start_fields(collection):
+    """Backfill start on events created before it existed"""
+    migrated = invalid = 0
+    while True:
+        # start: None is what earlier versions of this migration wrote for bad dates
+        legacy = await collection.find(
+            {"$or": [{"start": {"$exists": False}}, {"start": None}], "start_invalid": {"$ne": True}},
+            {"date": 1, "time": 1}
+        ).limit(EVENT_MIGRATION_BATCH_SIZE).to_list(EVENT_MIGRATION_BATCH_SIZE)
+        if not legacy:
+            break
+        updates = []
+        for event in legacy:
+            try:
+                start = event_start(event.get("date", ""), event.get("time"))
+                updates.append(UpdateOne({"_id": event["_id"]}, {"$set": {"start": start}}))
+                migrated += 1
+            except (TypeError, ValueError):
+                # Flagged, with the original strings left alone, so it isn't retried forever
+                updates.append(UpdateOne({"_id": event["_id"]}, {"$set": {"start_invalid": True}, "$unset": {"start": ""}}))
+                invalid += 1
+        await collection.bulk_write(updates, ordered=False)
+    if migrated or invalid:
+        print(f"Migrated {migrated} {collection.name} documents to datetime start; {invalid} have unparseable dates (start_invalid)")
+
+@app.on_event("startup")
+async def prepare_event_collections():
+    """Create the calendar indexes and backfill start on legacy events"""
+    try:
+        await db.events.create_index([("user_id", 1), ("start", 1), ("_id", 1)])
+        await db.admin_events.create_index([("start", 1), ("_id", 1)])
+        await db.admin_event_audience.create_index([("user_id", 1), ("start", 1), ("event_id", 1)])
+        await db.admin_event_audience.create_index([("event_id", 1), ("user_id", 1)], unique=True)
+        await migrate_event_start_fields(db.events)
+        await migrate_event_start_fields(db.admin_events)
+        await migrate_admin_event_audience()
+    except Exception as e:
+        print(f"Error preparing event collections: {str(e)}")
+
 @app.get("/user/events", response_model=List[Event])
 async def get_user_events(
+    response: Response,
     date: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    Get events for the current user, optionally filtered by date or date range
+    Get events for the current user, optionally filtered by date or date range.
+
+    Pages are cut on stored events; a recurring series' occurrences come with the page
+    holding the series.
     """
     try:
-        # Build query
-        query = {"user_id": current_user.id}
+        # Build query: index range scans on (user_id, start)
+        lo, hi = event_range_bounds(date, start_date, end_date)
         
-        if date:
-            # Filter by specific date
-            query["date"] = date
-        elif start_date and end_date:
-            # Filter by date range
-            query["date"] = {"$gte": start_date, "$lte": end_date}
-        elif start_date:
-            # Filter from start date onwards
-            query["date"] = {"$gte": start_date}
-        elif end_date:
-            # Filter up to end date
-            query["date"] = {"$lte": end_date}
-        
-        # Get events and sort by date and time
-        cursor = db.events.find(query).sort([("date", 1), ("time", 1)])
-        events = await cursor.to_list(length=1000)
+        # Get events in chronological order, with recurring series expanded in the range
+        events, next_cursor = event_page(
+            await find_events_after(db.events, user_events_query(current_user.id, lo, hi), decode_event_cursor(cursor))
+        )
+        set_next_cursor(response, next_cursor)
+        events = expand_recurring_events(events, lo, hi)
         
         # Convert ObjectIds and return
         return [convert_objectids_to_strings(event) for event in events]
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching user events: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch events")
@@ -1342,16 +4289,26 @@ async def create_event(
             except ValueError:
                 raise HTTPException(status_code=400, detail="Invalid time format. Use HH:MM")
         
+        validate_recurrence(event_data.recurrence.model_dump() if event_data.recurrence else None)
+        validate_event_timezone(event_data.timezone)
+        
         # Create event document
         event_dict = event_data.model_dump()
+        start = event_start(event_data.date, event_data.time)
+        event_dict["end"] = event_wall_time(event_dict["end"], event_zone(event_dict))
+        validate_event_end(start, event_dict["end"])
         event_dict.update({
+            "start": start,
+            "series_end": recurrence_series_end(event_dict["recurrence"], start),
             "user_id": current_user.id,
             "created_at": datetime.utcnow(),
             "updated_at": None
         })
+        event_dict["remind_at"] = event_reminder_time(event_dict, datetime.utcnow())
         
         # Insert into database
         result = await db.events.insert_one(event_dict)
+        reminder_scheduler.sync(str(result.inserted_id), event_dict["remind_at"])
         
         # Get the created event
         created_event = await db.events.find_one({"_id": result.inserted_id})
@@ -1417,14 +4374,21 @@ async def update_event(
         if not existing_event:
             raise HTTPException(status_code=404, detail="Event not found")
         
-        # Prepare update data
+        # Prepare update data: only fields the client sent. An explicit null clears the
+        # fields that may be empty (stops a series repeating); elsewhere it is ignored.
         update_data = {}
+        cleared = []
         for field, value in event_update.model_dump(exclude_unset=True).items():
             if value is not None:
                 update_data[field] = value
+            elif field in EVENT_CLEARABLE_FIELDS:
+                cleared.append(field)
         
-        if not update_data:
+        if not update_data and not cleared:
             raise HTTPException(status_code=400, detail="No update data provided")
+        if "recurrence" in cleared:
+            # Cancelled and changed occurrences only mean something in a series
+            cleared += ["exdates", "overrides"]
         
         # Validate date format if being updated
         if "date" in update_data:
@@ -1440,17 +4404,43 @@ async def update_event(
             except ValueError:
                 raise HTTPException(status_code=400, detail="Invalid time format. Use HH:MM")
         
+        # Keep the datetime start in step with the legacy strings
+        if "date" in update_data or "time" in update_data:
+            update_data["start"] = event_start(
+                update_data.get("date", existing_event.get("date")),
+                update_data.get("time", existing_event.get("time"))
+            )
+        
+        validate_event_timezone(update_data.get("timezone"))
+        if "end" in update_data:
+            update_data["end"] = event_wall_time(update_data["end"], event_zone({**existing_event, **update_data}))
+        updated = {**existing_event, **update_data, **{field: None for field in cleared}}
+        validate_event_end(updated.get("start"), updated.get("end"))
+        
+        # Recompute where a series ends when its rule or first occurrence moves
+        if "recurrence" in update_data:
+            validate_recurrence(update_data["recurrence"])
+        if "recurrence" in update_data or "recurrence" in cleared or "start" in update_data:
+            update_data["series_end"] = recurrence_series_end(updated.get("recurrence"), updated.get("start"))
+        
+        # The pending reminder moves with the event
+        update_data["remind_at"] = event_reminder_time(updated, datetime.utcnow())
+        
         # Add updated timestamp
         update_data["updated_at"] = datetime.utcnow()
         
         # Update the event
+        changes = {"$set": update_data}
+        if cleared:
+            changes["$unset"] = {field: "" for field in cleared}
         result = await db.events.update_one(
             {"_id": ObjectId(event_id), "user_id": current_user.id},
-            {"$set": update_data}
+            changes
         )
         
         if result.modified_count == 0:
             raise HTTPException(status_code=400, detail="No changes made to event")
+        reminder_scheduler.sync(event_id, update_data["remind_at"])
         
         # Return updated event
         updated_event = await db.events.find_one({"_id": ObjectId(event_id)})
@@ -1483,6 +4473,7 @@ async def delete_event(
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Event not found")
+        reminder_scheduler.cancel(event_id)
         
         return {"message": "Event deleted successfully"}
         
@@ -1492,28 +4483,173 @@ async def delete_event(
         print(f"Error deleting event: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to delete event")
 
+@app.post("/events/{event_id}/exceptions", response_model=Event)
+async def add_event_exception(
+    event_id: str,
+    exception: EventOccurrenceException,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Cancel or change a single occurrence of a recurring event
+    """
+    try:
+        if not ObjectId.is_valid(event_id):
+            raise HTTPException(status_code=400, detail="Invalid event ID format")
+        
+        series = await db.events.find_one({
+            "_id": ObjectId(event_id),
+            "user_id": current_user.id,
+            "recurrence": {"$ne": None}
+        })
+        if not series:
+            raise HTTPException(status_code=404, detail="Recurring event not found")
+        
+        try:
+            day = datetime.strptime(exception.date, '%Y-%m-%d').date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+        if exception.time:
+            try:
+                datetime.strptime(exception.time, '%H:%M')
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid time format. Use HH:MM")
+        
+        # The date has to be one the rule actually produces
+        is_occurrence = False
+        for occurrence_day in recurrence_dates(series["recurrence"], series["start"].date(), day):
+            if occurrence_day >= day:
+                is_occurrence = occurrence_day == day
+                break
+        if not is_occurrence:
+            raise HTTPException(status_code=400, detail="Date is not an occurrence of this event")
+        
+        if exception.cancelled:
+            update = {
+                "$addToSet": {"exdates": exception.date},
+                "$unset": {f"overrides.{exception.date}": ""},
+                "$set": {"updated_at": datetime.utcnow()}
+            }
+        else:
+            changes = exception.model_dump(exclude={"date", "cancelled"}, exclude_none=True)
+            if not changes:
+                raise HTTPException(status_code=400, detail="No update data provided")
+            update = {
+                "$pull": {"exdates": exception.date},
+                "$set": {f"overrides.{exception.date}": changes, "updated_at": datetime.utcnow()}
+            }
+        
+        await db.events.update_one({"_id": series["_id"]}, update)
+        updated_series = await db.events.find_one({"_id": series["_id"]})
+        
+        # A cancelled or moved occurrence may change which reminder is next
+        remind_at = event_reminder_time(updated_series, datetime.utcnow())
+        if remind_at != updated_series.get("remind_at"):
+            await db.events.update_one({"_id": series["_id"]}, {"$set": {"remind_at": remind_at}})
+            updated_series["remind_at"] = remind_at
+        reminder_scheduler.sync(event_id, remind_at)
+        return convert_objectids_to_strings(updated_series)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error adding event exception: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to update event occurrence")
+
 @app.get("/events", response_model=List[Event])
-async def get_all_user_events(current_user: User = Depends(get_current_active_user)):
+async def get_all_user_events(
+    response: Response,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user)
+):
     """
     Get all events for the current user
     """
     try:
-        cursor = db.events.find({"user_id": current_user.id}).sort([("date", 1), ("time", 1)])
-        events = await cursor.to_list(length=1000)
+        events, next_cursor = event_page(
+            await find_events_after(db.events, {"user_id": current_user.id}, decode_event_cursor(cursor))
+        )
+        set_next_cursor(response, next_cursor)
         
         return [convert_objectids_to_strings(event) for event in events]
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching all user events: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch events")
 
 # ================================= ADMIN EVENT ENDPOINTS =================================
 
+# Who can see an admin event is fanned out on write into admin_event_audience: one row
+# per (audience, event) carrying the event's start, where the audience is a user id or
+# AUDIENCE_ALL for public events. A user's calendar is then one range scan of the
+# (user_id, start) index instead of an $or over is_public and the target_users array.
+# audience_indexed is set on the event only once its rows are written, and cleared by
+# every change to it, so events whose sync was interrupted are picked up by the backfill.
+AUDIENCE_ALL = "*"
+
+def admin_event_audience(event: dict) -> List[str]:
+    if event.get("is_public"):
+        return [AUDIENCE_ALL]
+    return list(dict.fromkeys(event.get("target_users") or []))
+
+async def sync_admin_event_audience(event: dict):
+    """Upsert the event's audience rows, drop the ones no longer in its audience and mark it indexed"""
+    audience = admin_event_audience(event)
+    if audience:
+        await db.admin_event_audience.bulk_write([
+            UpdateOne(
+                {"event_id": event["_id"], "user_id": user_id},
+                {"$set": {"start": event.get("start")}},
+                upsert=True
+            )
+            for user_id in audience
+        ], ordered=False)
+    await db.admin_event_audience.delete_many({"event_id": event["_id"], "user_id": {"$nin": audience}})
+    await db.admin_events.update_one({"_id": event["_id"]}, {"$set": {"audience_indexed": True}})
+
+async def migrate_admin_event_audience():
+    """Build audience rows for admin events created before the index existed"""
+    migrated = 0
+    while True:
+        legacy = await db.admin_events.find(
+            {"audience_indexed": {"$exists": False}},
+            {"start": 1, "is_public": 1, "target_users": 1}
+        ).limit(EVENT_MIGRATION_BATCH_SIZE).to_list(EVENT_MIGRATION_BATCH_SIZE)
+        if not legacy:
+            break
+        for event in legacy:
+            await sync_admin_event_audience(event)
+        migrated += len(legacy)
+    if migrated:
+        print(f"Indexed the audience of {migrated} admin events")
+
+async def find_visible_admin_events(
+    user_id: str, lo: Optional[datetime], hi: Optional[datetime], cursor: Optional[tuple] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of the admin events user_id can see starting in [lo, hi), in (start, _id)
+    order, and the cursor of the next page"""
+    rows, next_cursor = event_page(await find_events_after(
+        db.admin_event_audience,
+        {"user_id": {"$in": [user_id, AUDIENCE_ALL]}, **start_range(lo, hi)},
+        cursor,
+        id_field="event_id",
+        projection={"event_id": 1, "start": 1, "_id": 0}
+    ), id_field="event_id")
+    # Public events only have the "*" row and targeted ones only user rows, so each
+    # visible event matches exactly one row
+    event_ids = [row["event_id"] for row in rows]
+    events = await db.admin_events.find({"_id": {"$in": event_ids}}).to_list(len(event_ids))
+    events_by_id = {event["_id"]: event for event in events}
+    return [events_by_id[event_id] for event_id in event_ids if event_id in events_by_id], next_cursor
+
 @app.get("/admin/events", response_model=List[AdminEvent])
 async def get_admin_events(
+    response: Response,
     date: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_admin_user)
 ):
     """
@@ -1521,59 +4657,41 @@ async def get_admin_events(
     """
     try:
         # Build query
-        query = {}
-        
-        if date:
-            query["date"] = date
-        elif start_date and end_date:
-            query["date"] = {"$gte": start_date, "$lte": end_date}
-        elif start_date:
-            query["date"] = {"$gte": start_date}
-        elif end_date:
-            query["date"] = {"$lte": end_date}
+        query = event_range_query(date, start_date, end_date)
         
-        cursor = db.admin_events.find(query).sort([("date", 1), ("time", 1)])
-        events = await cursor.to_list(length=1000)
+        events, next_cursor = event_page(await find_events_after(db.admin_events, query, decode_event_cursor(cursor)))
+        set_next_cursor(response, next_cursor)
         
         return [convert_objectids_to_strings(event) for event in events]
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching admin events: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch admin events")
 
 @app.get("/public/events", response_model=List[AdminEvent])
 async def get_public_events(
+    response: Response,
     date: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Get public admin events visible to all users
     """
     try:
-        # Build query for public events or events targeting this specific user
-        query = {
-            "$or": [
-                {"is_public": True},
-                {"target_users": current_user.id}
-            ]
-        }
-        
-        if date:
-            query["date"] = date
-        elif start_date and end_date:
-            query["date"] = {"$gte": start_date, "$lte": end_date}
-        elif start_date:
-            query["date"] = {"$gte": start_date}
-        elif end_date:
-            query["date"] = {"$lte": end_date}
-        
-        cursor = db.admin_events.find(query).sort([("date", 1), ("time", 1)])
-        events = await cursor.to_list(length=1000)
+        # Public events and events targeting this user, from the audience index
+        lo, hi = event_range_bounds(date, start_date, end_date)
+        events, next_cursor = await find_visible_admin_events(current_user.id, lo, hi, decode_event_cursor(cursor))
+        set_next_cursor(response, next_cursor)
         
         return [convert_objectids_to_strings(event) for event in events]
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching public events: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch public events")
@@ -1614,6 +4732,7 @@ async def create_admin_event(
         # Create admin event document
         event_dict = event_data.model_dump()
         event_dict.update({
+            "start": event_start(event_data.date, event_data.time),
             "created_by": current_user.id,
             "created_at": datetime.utcnow(),
             "updated_at": None
@@ -1624,6 +4743,7 @@ async def create_admin_event(
         
         # Get the created event
         created_event = await db.admin_events.find_one({"_id": result.inserted_id})
+        await sync_admin_event_audience(created_event)
         
         return convert_objectids_to_strings(created_event)
         
@@ -1709,13 +4829,20 @@ async def update_admin_event(
                 if not user_exists:
                     raise HTTPException(status_code=400, detail=f"User not found: {user_id}")
         
+        # Keep the datetime start in step with the legacy strings
+        if "date" in update_data or "time" in update_data:
+            update_data["start"] = event_start(
+                update_data.get("date", existing_event.get("date")),
+                update_data.get("time", existing_event.get("time"))
+            )
+        
         # Add updated timestamp
         update_data["updated_at"] = datetime.utcnow()
         
-        # Update the event
+        # Update the event; its audience rows are stale until synced below
         result = await db.admin_events.update_one(
             {"_id": ObjectId(event_id)},
-            {"$set": update_data}
+            {"$set": update_data, "$unset": {"audience_indexed": ""}}
         )
         
         if result.modified_count == 0:
@@ -1723,6 +4850,7 @@ async def update_admin_event(
         
         # Return updated event
         updated_event = await db.admin_events.find_one({"_id": ObjectId(event_id)})
+        await sync_admin_event_audience(updated_event)
         return convert_objectids_to_strings(updated_event)
         
     except HTTPException:
@@ -1747,6 +4875,7 @@ async def delete_admin_event(
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Admin event not found")
+        await db.admin_event_audience.delete_many({"event_id": ObjectId(event_id)})
         
         return {"message": "Admin event deleted successfully"}
         
@@ -1757,6 +4886,103 @@ async def delete_admin_event(
         raise HTTPException(status_code=500, detail="Failed to delete admin event")
 
 
+# ================================= CALENDAR FEED =================================
+
+def calendar_feed_etag(*event_lists: List[dict]) -> str:
+    """Weak ETag from the newest updated_at and the size of each list"""
+    latest = max(
+        (event.get("updated_at") or event.get("created_at") or datetime.min for events in event_lists for event in events),
+        default=datetime.min
+    )
+    fingerprint = f"{latest.isoformat()}:{':'.join(str(len(events)) for events in event_lists)}"
+    return f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()}"'
+
+# A feed cursor pairs a cursor into the personal events with one into the admin events;
+# FEED_DONE marks a side with nothing left
+FEED_DONE = "done"
+
+def event_sort_key(event: dict) -> datetime:
+    return event.get("start") or datetime.min
+
+def decode_calendar_feed_cursor(cursor: Optional[str]) -> Tuple:
+    if not cursor:
+        return None, None
+    parts = cursor.split(",")
+    if len(parts) != 2:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple(FEED_DONE if part == FEED_DONE else decode_event_cursor(part) for part in parts)
+
+def calendar_feed_side_cursor(cursor, fetched: List[dict], page: List[dict], next_page: Optional[str]) -> str:
+    """Where one side of the feed resumes: after the last of its events on this page, or
+    where it was if none made it in. A side whose fetched events all fit continues at
+    its own next page, if it has one."""
+    if cursor == FEED_DONE:
+        return FEED_DONE
+    if len(page) == len(fetched):
+        return next_page or FEED_DONE
+    if page:
+        return encode_event_cursor(page[-1])
+    return encode_event_cursor({"start": cursor[0], "_id": cursor[1]}) if cursor else ""
+
+@app.get("/calendar/feed")
+async def get_calendar_feed(
+    request: Request,
+    response: Response,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Personal and admin events for a date range in one chronologically merged list.
+
+    Responses carry an ETag; repeating the request with If-None-Match returns 304
+    while nothing in the range has changed. Pages are cut on the merged stored events,
+    and a full page carries X-Next-Cursor like the other listings.
+    """
+    try:
+        lo, hi = event_range_bounds(None, start, end)
+        user_query = user_events_query(current_user.id, lo, hi)
+        user_cursor, admin_cursor = decode_calendar_feed_cursor(cursor)
+        
+        async def user_side():
+            return [] if user_cursor == FEED_DONE else await find_events_after(db.events, user_query, user_cursor)
+        
+        async def admin_side():
+            return ([], None) if admin_cursor == FEED_DONE else await find_visible_admin_events(current_user.id, lo, hi, admin_cursor)
+        
+        # Both range scans run concurrently
+        user_events, (admin_events, admin_next) = await asyncio.gather(user_side(), admin_side())
+        for event in admin_events:
+            event["is_admin_event"] = True
+        
+        # Both lists are already sorted by start, so a linear merge is enough
+        page = list(itertools.islice(heapq.merge(user_events, admin_events, key=event_sort_key), EVENT_PAGE_SIZE))
+        user_page = [event for event in page if not event.get("is_admin_event")]
+        admin_page = [event for event in page if event.get("is_admin_event")]
+        next_parts = [
+            calendar_feed_side_cursor(user_cursor, user_events, user_page, None),
+            calendar_feed_side_cursor(admin_cursor, admin_events, admin_page, admin_next)
+        ]
+        next_cursor = None if next_parts == [FEED_DONE, FEED_DONE] else ",".join(next_parts)
+        
+        etag = calendar_feed_etag(user_page, admin_page)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+        set_next_cursor(response, next_cursor)
+        
+        user_page = expand_recurring_events(user_page, lo, hi)
+        merged = heapq.merge(user_page, admin_page, key=event_sort_key)
+        return [convert_objectids_to_strings(event) for event in merged]
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error fetching calendar feed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to fetch calendar feed")
+
 # ================================= CHAT ENDPOINTS =================================
 
 # Chat models
@@ -1865,77 +5091,238 @@ async def get_chat_users(current_user: User = Depends(get_current_active_user)):
         print(f"Error in get_chat_users: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch chat users")
 
+# Long-poll wakeups: every user has a change counter per scope ("chat",
+# "notifications") in db.change_versions, shared by all API processes. send_message and
+# mark_messages_as_read bump the counters of both participants; a touch also goes to the
+# capped collection db.change_feed, which every process tails to wake the /chat/wait
+# requests it has parked on those users, whichever worker made the change.
+CHAT_WAIT_TIMEOUT = 25  # seconds, kept below common proxy idle timeouts
+CHANGE_FEED_MB = 16
+
+change_notifiers = {}  # scope -> ChangeNotifier
+
+class ChangeNotifier:
+    """Shared per-user change counters that long-poll requests can wait on"""
+
+    def __init__(self, scope: str):
+        self.scope = scope
+        self.waiters = {}  # user id -> asyncio.Event shared by that user's parked requests
+        self.waiter_counts = {}  # user id -> number of parked requests
+        change_notifiers[scope] = self
+
+    async def version(self, user_id: str) -> int:
+        counter = await db.change_versions.find_one({"_id": f"{self.scope}:{user_id}"})
+        return counter["version"] if counter else 0
+
+    async def touch(self, *user_ids: str):
+        user_ids = [str(user_id) for user_id in user_ids]
+        for user_id in user_ids:
+            await db.change_versions.update_one({"_id": f"{self.scope}:{user_id}"}, {"$inc": {"version": 1}}, upsert=True)
+        try:
+            await db.change_feed.insert_one({"scope": self.scope, "user_ids": user_ids})
+        except Exception as e:
+            # Other workers' waiters then notice at their timeout
+            print(f"Change feed error: {str(e)}")
+        self.wake(user_ids)
+
+    def wake(self, user_ids: List[str]):
+        for user_id in user_ids:
+            event = self.waiters.pop(user_id, None)
+            if event:
+                event.set()
+
+    async def wait(self, user_id: str, seen_version: int, timeout: float) -> int:
+        """Return as soon as user_id's counter differs from seen_version, or on timeout"""
+        deadline = time.monotonic() + timeout
+        self.waiter_counts[user_id] = self.waiter_counts.get(user_id, 0) + 1
+        try:
+            while True:
+                # Parked before reading, so a touch in between still wakes us
+                event = self.waiters.setdefault(user_id, asyncio.Event())
+                current = await self.version(user_id)
+                remaining = deadline - time.monotonic()
+                if current != seen_version or remaining <= 0:
+                    return current
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.waiter_counts[user_id] -= 1
+            if not self.waiter_counts[user_id]:
+                # Drop idle entries so quiet users don't accumulate state
+                del self.waiter_counts[user_id]
+                self.waiters.pop(user_id, None)
+
+async def tail_change_feed():
+    """Wake this process's waiters for touches made by any process"""
+    try:
+        await db.create_collection("change_feed", capped=True, size=CHANGE_FEED_MB * 1024 * 1024)
+    except CollectionInvalid:
+        pass  # Already there
+    except Exception as e:
+        print(f"Change feed unavailable, waiters only wake for local changes: {str(e)}")
+        return
+
+    def handle(document: dict):
+        notifier = change_notifiers.get(document.get("scope"))
+        if notifier:
+            notifier.wake(document.get("user_ids", []))
+
+    await tail_capped_collection(db.change_feed, handle)
+
+@app.on_event("startup")
+async def start_change_feed_tail():
+    app.state.change_feed_task = asyncio.create_task(tail_change_feed())
+
+chat_notifier = ChangeNotifier("chat")
+
+# Delta sync: a watermark is a pair of keyset cursors, (created_at, _id) of the last
+# new message and (read_at, _id) of the last read receipt handed out, so a sync resumes
+# where the previous one stopped even when timestamps tie. Timestamps come from the app
+# servers' clocks and are stamped before the write lands, so the cursors handed out
+# trail the clock by CHAT_SYNC_SKEW: a message stamped just before a concurrent sync is
+# still picked up by the next one (clients de-duplicate by id).
+CHAT_CURSOR_START = (datetime(1970, 1, 1), ObjectId("0" * 24))
+CHAT_SYNC_SKEW = timedelta(seconds=2)
+
+@app.on_event("startup")
+async def create_chat_indexes():
+    """Indexes backing conversation pages and delta sync range probes"""
+    try:
+        await db.messages.create_index([("sender_id", 1), ("receiver_id", 1), ("created_at", 1)])
+        await db.messages.create_index([("sender_id", 1), ("receiver_id", 1), ("read_at", 1)])
+    except Exception as e:
+        print(f"Error creating chat indexes: {str(e)}")
+
+def encode_chat_watermark(message_key: tuple, receipt_key: tuple) -> str:
+    return ",".join(f"{moment.isoformat()}~{object_id}" for moment, object_id in [message_key, receipt_key])
+
+def decode_chat_watermark(watermark: str) -> Tuple[tuple, tuple]:
+    """(message cursor, receipt cursor); a bare timestamp from older clients starts both there"""
+    def key(part: str) -> tuple:
+        moment, _, object_id = part.partition("~")
+        moment = to_naive_utc(datetime.fromisoformat(moment.replace("Z", "+00:00")))
+        return (moment, ObjectId(object_id) if object_id else CHAT_CURSOR_START[1])
+
+    parts = watermark.split(",")
+    if len(parts) == 1:
+        return key(parts[0]), key(parts[0])
+    return key(parts[0]), key(parts[1])
+
+def after_chat_cursor(field: str, cursor: tuple) -> dict:
+    moment, object_id = cursor
+    return {"$or": [{field: {"$gt": moment}}, {field: moment, "_id": {"$gt": object_id}}]}
+
+def next_chat_cursor(cursor: tuple, rows: List[dict], field: str, query_time: datetime) -> tuple:
+    """Cursor after the last row handed out, but never past query_time - CHAT_SYNC_SKEW"""
+    if rows:
+        cursor = (rows[-1][field], rows[-1]["_id"])
+    return min(cursor, (query_time - CHAT_SYNC_SKEW, CHAT_CURSOR_START[1]))
+
+def enrich_chat_message(message: dict, user_details: dict) -> dict:
+    sender_id = str(message["sender_id"])
+    receiver_id = str(message["receiver_id"])
+    sender = user_details.get(sender_id, {})
+    receiver = user_details.get(receiver_id, {})
+    return {
+        "id": str(message["_id"]),
+        "sender_id": sender_id,
+        "receiver_id": receiver_id,
+        "content": message["content"],
+        "created_at": message["created_at"].isoformat(),
+        "read_at": message["read_at"].isoformat() if message.get("read_at") else None,
+        "sender_name": sender.get("username", "Unknown"),
+        "receiver_name": receiver.get("username", "Unknown")
+    }
+
 @app.get("/chat/messages/{user_id}")
 async def get_chat_messages(
     user_id: str,
     current_user: User = Depends(get_current_active_user),
     page: int = 1,
-    limit: int = 50
+    limit: int = 50,
+    since: Optional[str] = None
 ):
-    """Get messages between current user and specified user"""
+    """
+    Get messages between current user and specified user.
+
+    With `since` (the `watermark` from a previous response) only messages created
+    after it and read receipts that changed after it are returned, or 204 if
+    nothing changed.
+    """
     try:
         if not ObjectId.is_valid(user_id):
             raise HTTPException(status_code=400, detail="Invalid user ID")
         
-        # Calculate skip for pagination
-        skip = (page - 1) * limit
+        me = ObjectId(current_user.id)
+        other = ObjectId(user_id)
+        query_time = datetime.utcnow()
         
-        # Get messages between the two users
-        query = {
-            "$or": [
-                {"sender_id": ObjectId(current_user.id), "receiver_id": ObjectId(user_id)},
-                {"sender_id": ObjectId(user_id), "receiver_id": ObjectId(current_user.id)}
-            ]
-        }
-        
-        # Get messages sorted by creation time
-        messages = await db.messages.find(query).sort("created_at", 1).skip(skip).limit(limit).to_list(limit)
-        
-        # Get user details for sender and receiver names
-        user_details = {}
-        for message in messages:
-            sender_id = str(message["sender_id"])
-            receiver_id = str(message["receiver_id"])
-            
-            if sender_id not in user_details:
-                sender = await db.users.find_one({"_id": message["sender_id"]})
-                if sender:
-                    user_details[sender_id] = sender
-            
-            if receiver_id not in user_details:
-                receiver = await db.users.find_one({"_id": message["receiver_id"]})
-                if receiver:
-                    user_details[receiver_id] = receiver
-        
-        # Enrich messages with user names
-        enriched_messages = []
-        for message in messages:
-            sender_id = str(message["sender_id"])
-            receiver_id = str(message["receiver_id"])
+        if since is not None:
+            try:
+                message_key, receipt_key = decode_chat_watermark(since)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Invalid watermark")
             
-            sender = user_details.get(sender_id, {})
-            receiver = user_details.get(receiver_id, {})
+            # Two index range probes: new messages either way, and my messages read since
+            new_query = {
+                "$or": [
+                    {"sender_id": me, "receiver_id": other, **after_chat_cursor("created_at", message_key)},
+                    {"sender_id": other, "receiver_id": me, **after_chat_cursor("created_at", message_key)}
+                ]
+            }
+            receipt_query = {"sender_id": me, "receiver_id": other, **after_chat_cursor("read_at", receipt_key)}
+            messages, receipts = await asyncio.gather(
+                db.messages.find(new_query).sort([("created_at", 1), ("_id", 1)]).limit(limit).to_list(limit),
+                db.messages.find(receipt_query, {"read_at": 1}).sort([("read_at", 1), ("_id", 1)]).limit(limit).to_list(limit)
+            )
+            if not messages and not receipts:
+                return Response(status_code=status.HTTP_204_NO_CONTENT)
+        else:
+            # Calculate skip for pagination
+            skip = (page - 1) * limit
             
-            enriched_message = {
-                "id": str(message["_id"]),
-                "sender_id": sender_id,
-                "receiver_id": receiver_id,
-                "content": message["content"],
-                "created_at": message["created_at"].isoformat(),
-                "read_at": message["read_at"].isoformat() if message.get("read_at") else None,
-                "sender_name": sender.get("username", "Unknown"),
-                "receiver_name": receiver.get("username", "Unknown")
+            # Get messages between the two users
+            query = {
+                "$or": [
+                    {"sender_id": me, "receiver_id": other},
+                    {"sender_id": other, "receiver_id": me}
+                ]
             }
             
-            enriched_messages.append(enriched_message)
+            # Get messages sorted by creation time
+            messages = await db.messages.find(query).sort([("created_at", 1), ("_id", 1)]).skip(skip).limit(limit).to_list(limit)
+            # Later deltas pick up after this page; receipts from now on
+            message_key = CHAT_CURSOR_START
+            receipt_key = (query_time, CHAT_CURSOR_START[1])
         
-        return {
-            "messages": enriched_messages,
-            "total": len(enriched_messages),
+        # Both participants' names in a single lookup
+        user_details = {}
+        if messages:
+            participants = await db.users.find({"_id": {"$in": [me, other]}}, {"username": 1}).to_list(2)
+            user_details = {str(participant["_id"]): participant for participant in participants}
+        
+        response = {
+            "messages": [enrich_chat_message(m, user_details) for m in messages],
             "page": page,
             "limit": limit
         }
         
+        message_key = next_chat_cursor(message_key, messages, "created_at", query_time)
+        if since is not None:
+            new_ids = {m["_id"] for m in messages}
+            response["read_receipts"] = [
+                {"id": str(r["_id"]), "read_at": r["read_at"].isoformat()}
+                for r in receipts
+                if r["_id"] not in new_ids
+            ]
+            receipt_key = next_chat_cursor(receipt_key, receipts, "read_at", query_time)
+        response["watermark"] = encode_chat_watermark(message_key, receipt_key)
+        
+        response["total"] = len(response["messages"])
+        return response
+        
     except HTTPException:
         raise
     except Exception as e:
@@ -1971,6 +5358,7 @@ async def send_message(
         
         # Insert message
         result = await db.messages.insert_one(message_dict)
+        await chat_notifier.touch(current_user.id, message_data.receiver_id)
         
         # Get the created message with user details
         created_message = await db.messages.find_one({"_id": result.inserted_id})
@@ -2019,6 +5407,8 @@ async def mark_messages_as_read(
                 "$set": {"read_at": datetime.utcnow()}
             }
         )
+        if result.modified_count:
+            await chat_notifier.touch(current_user.id, user_id)
         
         return {
             "message": "Messages marked as read",
@@ -2031,6 +5421,29 @@ async def mark_messages_as_read(
         print(f"Error marking messages as read: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to mark messages as read")
 
+@app.get("/chat/wait")
+async def wait_for_chat_changes(
+    version: Optional[int] = None,
+    timeout: int = CHAT_WAIT_TIMEOUT,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Long-poll until one of the current user's conversations changes.
+
+    Pass the `version` from the previous response. Returns the new version as soon as a
+    message is sent or read in any of the user's conversations, or 204 on timeout.
+    Without `version` the current one is returned immediately.
+    """
+    current_version = await chat_notifier.version(current_user.id)
+    if version is None:
+        return {"changed": False, "version": current_version}
+    
+    timeout = max(1, min(timeout, CHAT_WAIT_TIMEOUT))
+    new_version = await chat_notifier.wait(current_user.id, version, timeout)
+    if new_version == version:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    return {"changed": True, "version": new_version}
+
 @app.get("/chat/unread-count")
 async def get_unread_message_count(current_user: User = Depends(get_current_active_user)):
     """Get total unread message count for current user"""
@@ -2176,8 +5589,557 @@ async def get_user_conversations(current_user: User = Depends(get_current_active
         print(f"Error getting conversations: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get conversations")
 
+# ================================= ANALYTICS ROLLUPS =================================
+
+# Submissions are appended to db.analytics_events and a background task folds them
+# into minute/hour/day buckets in db.analytics_rollups. Distinct active users per
+# hour/day bucket are one document each in db.analytics_active_users, so no rollup
+# document grows with the number of users. /admin/analytics only ever reads these,
+# never the raw submissions.
+ANALYTICS_ROLLUP_INTERVAL = int(os.getenv("ANALYTICS_ROLLUP_INTERVAL", "60"))  # seconds
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "5000"))
+ANALYTICS_EVENT_TTL_DAYS = int(os.getenv("ANALYTICS_EVENT_TTL_DAYS", "7"))
+ANALYTICS_SETTLE_SECONDS = 5  # Let in-flight inserts land before advancing the watermark
+ANALYTICS_LEASE_SECONDS = 120  # How long one worker may hold the rollup before another takes over
+ANALYTICS_GRANULARITIES = ["minute", "hour", "day"]
+ANALYTICS_DIMENSIONS = ["all", "challenge", "language", "status"]
+ANALYTICS_DEFAULT_RANGES = {
+    "minute": timedelta(hours=1),
+    "hour": timedelta(days=1),
+    "day": timedelta(days=30)
+}
+
+def truncate_to_bucket(timestamp: datetime, granularity: str) -> datetime:
+    """Round a timestamp down to the start of its minute/hour/day bucket"""
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unsupported granularity: {granularity}")
+
+def submission_analytics_event(submission_dict: dict, weight: int = 1) -> dict:
+    """A judged submission as an analytics event. A rejudge that changes a verdict takes
+    the old one back out with weight -1 and adds the new one."""
+    return {
+        "type": "submission",
+        "submission_id": submission_dict.get("_id"),
+        "user_id": str(submission_dict.get("user_id")),
+        "challenge_id": str(submission_dict.get("challenge_id")),
+        "language": submission_dict.get("language", "unknown"),
+        "status": submission_dict.get("status", "Unknown"),
+        "execution_time": submission_dict.get("execution_time") or 0,
+        "weight": weight,
+        "created_at": submission_dict.get("submitted_at") or datetime.utcnow()
+    }
+
+async def record_submission_event(submission_dict: dict):
+    """Append a judged submission to the analytics event stream"""
+    try:
+        await db.analytics_events.insert_one(submission_analytics_event(submission_dict))
+    except Exception as e:
+        # Analytics must never fail a submission
+        print(f"Analytics event error: {str(e)}")
+
+def build_rollup_updates(events: List[dict]) -> List[UpdateOne]:
+    """Fold a batch of events into one upsert per (granularity, bucket, dimension, key)"""
+    buckets = {}
+    for event in events:
+        weight = event.get("weight", 1)
+        passed = 1 if event.get("status") == "Completed" else 0
+        dimension_keys = {
+            "all": "all",
+            "challenge": event.get("challenge_id"),
+            "language": event.get("language"),
+            "status": event.get("status")
+        }
+        for granularity in ANALYTICS_GRANULARITIES:
+            bucket = truncate_to_bucket(event["created_at"], granularity)
+            for dimension, key in dimension_keys.items():
+                counters = buckets.setdefault((granularity, bucket, dimension, str(key)), {
+                    "submissions": 0,
+                    "passed": 0,
+                    "failed": 0,
+                    "execution_time_total": 0.0
+                })
+                counters["submissions"] += weight
+                counters["passed"] += weight * passed
+                counters["failed"] += weight * (1 - passed)
+                counters["execution_time_total"] += weight * (event.get("execution_time") or 0)
+
+    updates = []
+    for (granularity, bucket, dimension, key), counters in buckets.items():
+        updates.append(UpdateOne(
+            {"granularity": granularity, "bucket": bucket, "dimension": dimension, "key": key},
+            {"$inc": {
+                "submissions": counters["submissions"],
+                "passed": counters["passed"],
+                "failed": counters["failed"],
+                "execution_time_total": counters["execution_time_total"]
+            }},
+            upsert=True
+        ))
+    return updates
+
+def build_active_user_updates(events: List[dict]) -> List[UpdateOne]:
+    """One upsert per (granularity, bucket, user) for the hour/day active user counts"""
+    first_seen = {}
+    for event in events:
+        if event.get("weight", 1) < 0:
+            continue
+        for granularity in ["hour", "day"]:
+            key = (granularity, truncate_to_bucket(event["created_at"], granularity), event.get("user_id"))
+            first_seen[key] = min(first_seen.get(key, event["created_at"]), event["created_at"])
+    return [
+        UpdateOne(
+            {"granularity": granularity, "bucket": bucket, "user_id": user_id},
+            {"$min": {"first_seen": seen}},
+            upsert=True
+        )
+        for (granularity, bucket, user_id), seen in first_seen.items()
+    ]
+
+async def roll_up_analytics_events() -> int:
+    """Aggregate the next batch of events into the rollups, returning the batch size"""
+    state = await db.analytics_state.find_one({"_id": "submission_rollup"})
+    if not state:
+        await db.analytics_state.update_one(
+            {"_id": "submission_rollup"},
+            {"$setOnInsert": {"last_event_id": None}},
+            upsert=True
+        )
+        state = {"last_event_id": None}
+    last_event_id = state.get("last_event_id")
+
+    settled_before = ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=ANALYTICS_SETTLE_SECONDS))
+    id_range = {"$lt": settled_before}
+    if last_event_id:
+        id_range["$gt"] = last_event_id
+
+    events = await db.analytics_events.find({"_id": id_range}).sort("_id", 1).limit(ANALYTICS_BATCH_SIZE).to_list(ANALYTICS_BATCH_SIZE)
+    if not events:
+        return 0
+
+    # Lease the watermark so that concurrent API workers never fold the same events
+    # twice, and only advance it once the batch is written: a failed write leaves the
+    # batch for the next round instead of losing it
+    now = datetime.utcnow()
+    lease_id = ObjectId()
+    claimed = await db.analytics_state.update_one(
+        {
+            "_id": "submission_rollup",
+            "last_event_id": last_event_id,
+            "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}]
+        },
+        {"$set": {"lease_id": lease_id, "lease_expires_at": now + timedelta(seconds=ANALYTICS_LEASE_SECONDS)}}
+    )
+    if claimed.modified_count == 0:
+        return 0
+
+    try:
+        await db.analytics_rollups.bulk_write(build_rollup_updates(events), ordered=False)
+        await db.analytics_active_users.bulk_write(build_active_user_updates(events), ordered=False)
+    except Exception:
+        await db.analytics_state.update_one(
+            {"_id": "submission_rollup", "lease_id": lease_id},
+            {"$set": {"lease_expires_at": None}}
+        )
+        raise
+    await db.analytics_state.update_one(
+        {"_id": "submission_rollup", "lease_id": lease_id},
+        {"$set": {"last_event_id": events[-1]["_id"], "lease_expires_at": None, "updated_at": datetime.utcnow()}}
+    )
+    return len(events)
+
+async def run_analytics_rollups():
+    """Background loop that keeps the rollups up to date"""
+    while True:
+        try:
+            # Drain the backlog in full batches, then sleep until the next interval
+            while await roll_up_analytics_events() == ANALYTICS_BATCH_SIZE:
+                pass
+        except Exception as e:
+            print(f"Analytics rollup error: {str(e)}")
+        await asyncio.sleep(ANALYTICS_ROLLUP_INTERVAL)
+
+@app.on_event("startup")
+async def start_analytics_rollups():
+    """Create the analytics indexes and start the rollup task"""
+    try:
+        await db.analytics_rollups.create_index(
+            [("granularity", 1), ("dimension", 1), ("key", 1), ("bucket", 1)],
+            unique=True
+        )
+        await db.analytics_rollups.create_index([("granularity", 1), ("dimension", 1), ("bucket", 1)])
+        await db.analytics_events.create_index(
+            "created_at",
+            expireAfterSeconds=ANALYTICS_EVENT_TTL_DAYS * 24 * 3600
+        )
+        await db.analytics_active_users.create_index(
+            [("granularity", 1), ("bucket", 1), ("user_id", 1)],
+            unique=True
+        )
+    except Exception as e:
+        print(f"Error creating analytics indexes: {str(e)}")
+    app.state.analytics_task = asyncio.create_task(run_analytics_rollups())
+
+@app.get("/admin/analytics")
+async def admin_get_analytics(
+    granularity: str = "hour",
+    dimension: str = "all",
+    key: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    admin_user: User = Depends(get_admin_user)
+):
+    """Admin endpoint for time-series submission analytics served from the rollups"""
+    if granularity not in ANALYTICS_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Invalid granularity. Must be one of {ANALYTICS_GRANULARITIES}")
+    if dimension not in ANALYTICS_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid dimension. Must be one of {ANALYTICS_DIMENSIONS}")
+
+    end = to_naive_utc(end) or datetime.utcnow()
+    start = to_naive_utc(start) or end - ANALYTICS_DEFAULT_RANGES[granularity]
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    try:
+        match = {
+            "granularity": granularity,
+            "dimension": dimension,
+            "bucket": {"$gte": truncate_to_bucket(start, granularity), "$lte": end}
+        }
+        if key is not None:
+            match["key"] = key
+
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"bucket": 1, "key": 1}},
+            {
+                "$project": {
+                    "_id": 0,
+                    "bucket": 1,
+                    "key": 1,
+                    "submissions": 1,
+                    "passed": 1,
+                    "failed": 1,
+                    "execution_time_total": 1
+                }
+            }
+        ]
+        rollups = await db.analytics_rollups.aggregate(pipeline).to_list(None)
+
+        active_users = {}
+        if dimension == "all" and granularity != "minute":
+            counts = await db.analytics_active_users.aggregate([
+                {"$match": {"granularity": granularity, "bucket": match["bucket"]}},
+                {"$group": {"_id": "$bucket", "users": {"$sum": 1}}}
+            ]).to_list(None)
+            active_users = {count["_id"]: count["users"] for count in counts}
+
+        series = []
+        for rollup in rollups:
+            submissions = rollup.get("submissions", 0)
+            series.append({
+                "bucket": rollup["bucket"].isoformat(),
+                "key": rollup["key"],
+                "submissions": submissions,
+                "passed": rollup.get("passed", 0),
+                "failed": rollup.get("failed", 0),
+                "pass_rate": round(rollup.get("passed", 0) / submissions * 100, 2) if submissions else 0,
+                "average_execution_time": round(rollup.get("execution_time_total", 0) / submissions, 3) if submissions else 0,
+                "active_users": active_users.get(rollup["bucket"], 0) if dimension == "all" and granularity != "minute" else None
+            })
+
+        return {
+            "granularity": granularity,
+            "dimension": dimension,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "series": series
+        }
+
+    except Exception as e:
+        print(f"Error fetching analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to fetch analytics")
+
+# ================================= EVENT REMINDERS =================================
+
+# Reminders are fired by the server. Each event stores remind_at, the time its next
+# reminder is due (recurring series advance it occurrence by occurrence), indexed so the
+# scheduler only ever range-scans the next window. Pending reminders inside the window
+# live in a hashed timing wheel: scheduling and cancelling are O(1) dict operations and
+# each tick only looks at one slot. remind_at is UTC: occurrence starts are converted from
+# the event's timezone first.
+REMINDER_TICK_SECONDS = float(os.getenv("REMINDER_TICK_SECONDS", "1"))
+REMINDER_WHEEL_SLOTS = int(os.getenv("REMINDER_WHEEL_SLOTS", "3600"))
+REMINDER_WINDOW = timedelta(hours=int(os.getenv("REMINDER_WINDOW_HOURS", "6")))
+REMINDER_GRACE = timedelta(minutes=int(os.getenv("REMINDER_GRACE_MINUTES", "10")))  # Late delivery after downtime
+NOTIFICATION_TTL_DAYS = int(os.getenv("NOTIFICATION_TTL_DAYS", "30"))
+
+class Notification(BaseModel):
+    id: str = Field(alias="_id")
+    user_id: str
+    type: str
+    title: str
+    message: str
+    event_id: Optional[str] = None
+    event_start: Optional[datetime] = None
+    read: bool = False
+    created_at: datetime
+
+def event_reminder_time(event: dict, after: datetime) -> Optional[datetime]:
+    """When the event's next reminder is due, strictly after `after`; None if there is none"""
+    minutes = event.get("reminder_minutes") or 0
+    if minutes <= 0 or not event.get("start"):
+        return None
+    lead = timedelta(minutes=minutes)
+    zone = event_zone(event)
+    if not event.get("recurrence"):
+        remind_at = event_time_utc(event["start"], zone) - lead
+        return remind_at if remind_at > after else None
+    # First occurrence whose reminder is after `after`; occurrences are in wall-clock time,
+    # and an hour's slack covers the wall clock jumping at a DST change
+    lo = event_wall_time((after + lead).replace(tzinfo=timezone.utc), zone) - timedelta(hours=1)
+    lo = max(lo, event["start"])  # Series starting beyond the horizon
+    for occurrence in expand_event_occurrences(event, lo, lo + EVENT_EXPANSION_HORIZON):
+        remind_at = event_time_utc(occurrence["start"], zone) - lead
+        if remind_at > after:
+            return remind_at
+    return None
+
+class TimingWheel:
+    """Hashed timing wheel keyed by id.
+
+    Entries land in slot due_tick % slots; entries further out than one revolution share
+    slots with nearer ones and are skipped until their tick comes round.
+    """
+
+    EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, slots: int, tick_seconds: float):
+        self.tick_seconds = tick_seconds
+        self.slots = [{} for _ in range(slots)]  # key -> (due tick, payload)
+        self.locations = {}  # key -> slot index
+        self.current = self.tick_of(datetime.utcnow()) - 1  # Last processed tick
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def tick_of(self, when: datetime) -> int:
+        return int((when - self.EPOCH).total_seconds() // self.tick_seconds)
+
+    def schedule(self, key, when: datetime, payload=None):
+        self.cancel(key)
+        # Overdue entries fire on the next tick
+        due = max(self.tick_of(when), self.current + 1)
+        slot = due % len(self.slots)
+        self.slots[slot][key] = (due, payload)
+        self.locations[key] = slot
+
+    def cancel(self, key):
+        slot = self.locations.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def advance(self, now: datetime) -> list:
+        """Pop and return (key, payload) for everything due up to now"""
+        target = self.tick_of(now)
+        # After a stall longer than a revolution, every slot only needs visiting once
+        first = max(self.current + 1, target - len(self.slots) + 1)
+        fired = []
+        for tick in range(first, target + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            for key in [key for key, (due, _) in bucket.items() if due <= target]:
+                fired.append((key, bucket.pop(key)[1]))
+                del self.locations[key]
+        self.current = max(self.current, target)
+        return fired
+
+class ReminderScheduler:
+    """Keeps the wheel filled with reminders due before loaded_until and delivers them"""
+
+    def __init__(self):
+        self.wheel = TimingWheel(REMINDER_WHEEL_SLOTS, REMINDER_TICK_SECONDS)
+        self.loaded_until = None  # Reminders before this are in the wheel (or delivered)
+        self.delivered = 0
+
+    def sync(self, event_id: str, remind_at: Optional[datetime]):
+        """Reflect an event's new remind_at; anything past the loaded window waits for its load"""
+        self.wheel.cancel(event_id)
+        if remind_at and self.loaded_until and remind_at < self.loaded_until:
+            self.wheel.schedule(event_id, remind_at, remind_at)
+
+    def cancel(self, event_id: str):
+        self.wheel.cancel(event_id)
+
+    async def load_window(self, now: datetime):
+        """Range-scan the remind_at index for reminders due before now + REMINDER_WINDOW"""
+        lo = self.loaded_until or now - REMINDER_GRACE
+        hi = now + REMINDER_WINDOW
+        cursor = db.events.find({"remind_at": {"$gte": lo, "$lt": hi}}, {"remind_at": 1})
+        async for event in cursor:
+            self.wheel.schedule(str(event["_id"]), event["remind_at"], event["remind_at"])
+        self.loaded_until = hi
+
+    async def deliver(self, event_id: str, remind_at: datetime):
+        """Claim the reminder by advancing remind_at, then notify the owner.
+
+        The compare-and-set on remind_at means each reminder is delivered once even when
+        several workers run a scheduler, and a reminder moved since it was scheduled is
+        dropped here.
+        """
+        event = await db.events.find_one({"_id": ObjectId(event_id), "remind_at": remind_at})
+        if not event:
+            return
+        next_remind_at = event_reminder_time(event, remind_at)
+        claimed = await db.events.update_one(
+            {"_id": event["_id"], "remind_at": remind_at},
+            {"$set": {"remind_at": next_remind_at}}
+        )
+        if not claimed.modified_count:
+            return
+
+        starts_at = remind_at + timedelta(minutes=event["reminder_minutes"])
+        local_start = event_wall_time(starts_at.replace(tzinfo=timezone.utc), event_zone(event))
+        await db.notifications.insert_one({
+            "user_id": event["user_id"],
+            "type": "event_reminder",
+            "title": event["title"],
+            "message": f"{event['title']} starts at {local_start.strftime('%Y-%m-%d %H:%M')}",
+            "event_id": event_id,
+            "event_start": starts_at,
+            "read": False,
+            "created_at": datetime.utcnow()
+        })
+        await notification_notifier.touch(event["user_id"])
+        self.delivered += 1
+        self.sync(event_id, next_remind_at)
+
+    async def run(self):
+        while True:
+            try:
+                now = datetime.utcnow()
+                if self.loaded_until is None or now + REMINDER_WINDOW / 2 >= self.loaded_until:
+                    await self.load_window(now)
+                for event_id, remind_at in self.wheel.advance(now):
+                    await self.deliver(event_id, remind_at)
+            except Exception as e:
+                print(f"Reminder scheduler error: {str(e)}")
+            await asyncio.sleep(REMINDER_TICK_SECONDS)
+
+reminder_scheduler = ReminderScheduler()
+
+# Same long-poll mechanics as chat, separate counters
+notification_notifier = ChangeNotifier("notifications")
+
+async def migrate_event_reminders():
+    """Backfill remind_at on events created before reminders were scheduled"""
+    now = datetime.utcnow()
+    while True:
+        legacy = await db.events.find({"remind_at": {"$exists": False}}).limit(
+            EVENT_MIGRATION_BATCH_SIZE
+        ).to_list(EVENT_MIGRATION_BATCH_SIZE)
+        if not legacy:
+            break
+        await db.events.bulk_write([
+            UpdateOne({"_id": event["_id"]}, {"$set": {"remind_at": event_reminder_time(event, now)}})
+            for event in legacy
+        ], ordered=False)
+
+@app.on_event("startup")
+async def start_reminder_scheduler():
+    """Create the reminder indexes, backfill legacy events and start the scheduler"""
+    try:
+        await db.events.create_index([("remind_at", 1)])
+        await db.notifications.create_index([("user_id", 1), ("created_at", -1)])
+        await db.notifications.create_index(
+            "created_at",
+            expireAfterSeconds=NOTIFICATION_TTL_DAYS * 24 * 3600
+        )
+        await migrate_event_reminders()
+    except Exception as e:
+        print(f"Error preparing event reminders: {str(e)}")
+    app.state.reminder_task = asyncio.create_task(reminder_scheduler.run())
+
+@app.get("/notifications", response_model=List[Notification])
+async def get_notifications(
+    unread_only: bool = False,
+    limit: int = 50,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get the current user's most recent notifications"""
+    try:
+        query = {"user_id": current_user.id}
+        if unread_only:
+            query["read"] = False
+        cursor = db.notifications.find(query).sort("created_at", -1).limit(max(1, min(limit, 100)))
+        notifications = await cursor.to_list(length=None)
+        return [convert_objectids_to_strings(notification) for notification in notifications]
+    except Exception as e:
+        print(f"Error fetching notifications: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to fetch notifications")
+
+@app.get("/notifications/wait")
+async def wait_for_notifications(
+    version: Optional[int] = None,
+    timeout: int = CHAT_WAIT_TIMEOUT,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Long-poll until the current user gets a new notification.
+
+    Works like /chat/wait: pass the previous `version`, get the new one back, or 204
+    on timeout.
+    """
+    current_version = await notification_notifier.version(current_user.id)
+    if version is None:
+        return {"changed": False, "version": current_version}
+    
+    timeout = max(1, min(timeout, CHAT_WAIT_TIMEOUT))
+    new_version = await notification_notifier.wait(current_user.id, version, timeout)
+    if new_version == version:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    return {"changed": True, "version": new_version}
+
+@app.put("/notifications/{notification_id}/read")
+async def mark_notification_as_read(
+    notification_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Mark one of the current user's notifications as read"""
+    try:
+        if not ObjectId.is_valid(notification_id):
+            raise HTTPException(status_code=400, detail="Invalid notification ID format")
+        result = await db.notifications.update_one(
+            {"_id": ObjectId(notification_id), "user_id": current_user.id},
+            {"$set": {"read": True}}
+        )
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Notification not found")
+        return {"message": "Notification marked as read"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error marking notification as read: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to update notification")
+
+@app.get("/admin/reminders")
+async def admin_get_reminder_stats(admin_user: User = Depends(get_admin_user)):
+    """Admin endpoint for the reminder scheduler's state"""
+    return {
+        "pending_in_wheel": len(reminder_scheduler.wheel),
+        "loaded_until": reminder_scheduler.loaded_until.isoformat() if reminder_scheduler.loaded_until else None,
+        "delivered": reminder_scheduler.delivered
+    }
+
 # Run with: uvicorn main:app --reload
+# Judge workers (JUDGE_MODE=remote): python main.py judge
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if sys.argv[1:2] == ["judge"]:
+        asyncio.run(run_judge_worker())
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)
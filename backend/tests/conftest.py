@@ -0,0 +1,72 @@
+"""Shared fixtures: the API module for tests of its pure helpers, and for tests that need a
+real database a throwaway mongod per session. Tests using the database are skipped when
+no mongod binary is on PATH."""
+import importlib
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+from pymongo import MongoClient
+
+MONGOD = shutil.which("mongod")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def wait_for(condition, timeout: float, interval: float = 0.2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = condition()
+        if value:
+            return value
+        time.sleep(interval)
+    raise AssertionError("Timed out waiting")
+
+
+@pytest.fixture(scope="session")
+def mongodb_url():
+    if MONGOD is None:
+        pytest.skip("needs a mongod binary on PATH")
+    dbpath = tempfile.mkdtemp(prefix="createathon-test-db-")
+    port = free_port()
+    mongod = subprocess.Popen(
+        [MONGOD, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL
+    )
+    url = f"mongodb://127.0.0.1:{port}/"
+    try:
+        client = MongoClient(url, serverSelectionTimeoutMS=500)
+        wait_for(lambda: client.admin.command("ping"), timeout=30)
+        client.close()
+        yield url
+    finally:
+        mongod.terminate()
+        mongod.wait(timeout=30)
+        shutil.rmtree(dbpath, ignore_errors=True)
+
+
+@pytest.fixture
+def db(mongodb_url):
+    client = MongoClient(mongodb_url)
+    client.drop_database("createathon")
+    yield client.createathon
+    client.close()
+
+
+@pytest.fixture(scope="session")
+def main():
+    """main, imported against an address nothing listens on; the client only connects
+    when a query is made, which these tests never do"""
+    os.environ.setdefault("MONGODB_URL", "mongodb://127.0.0.1:1/")
+    sys.path.insert(0, BACKEND_DIR)
+    return importlib.import_module("main")
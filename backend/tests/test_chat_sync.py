@@ -0,0 +1,47 @@
+"""Chat delta sync watermarks: the encoded cursor pair, and how far a sync moves them."""
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+
+def test_watermark_round_trip(main):
+    message_key = (datetime(2026, 1, 5, 10, 0, 0, 123456), ObjectId())
+    receipt_key = (datetime(2026, 1, 5, 9, 59), ObjectId())
+
+    watermark = main.encode_chat_watermark(message_key, receipt_key)
+    assert main.decode_chat_watermark(watermark) == (message_key, receipt_key)
+
+
+def test_bare_timestamps_from_older_clients_start_both_cursors(main):
+    start = (datetime(2026, 1, 5, 8, 0), main.CHAT_CURSOR_START[1])
+    assert main.decode_chat_watermark("2026-01-05T08:00:00") == (start, start)
+    # Offsets are converted to the naive UTC the database stores
+    assert main.decode_chat_watermark("2026-01-05T10:00:00+02:00") == (start, start)
+    assert main.decode_chat_watermark("2026-01-05T08:00:00Z") == (start, start)
+
+
+def test_cursor_moves_to_the_last_row(main):
+    now = datetime(2026, 1, 5, 12, 0)
+    cursor = main.CHAT_CURSOR_START
+    rows = [{"_id": ObjectId(), "created_at": now - timedelta(minutes=minutes)} for minutes in (3, 2)]
+
+    assert main.next_chat_cursor(cursor, rows, "created_at", now) == (rows[-1]["created_at"], rows[-1]["_id"])
+    assert main.next_chat_cursor(cursor, [], "created_at", now) == cursor
+
+
+def test_cursor_trails_the_clock(main):
+    now = datetime(2026, 1, 5, 12, 0)
+    recent = [{"_id": ObjectId(), "read_at": now - timedelta(seconds=1)}]
+    trailing = (now - main.CHAT_SYNC_SKEW, main.CHAT_CURSOR_START[1])
+
+    # A row stamped inside the skew window is handed out again by the next sync
+    assert main.next_chat_cursor(main.CHAT_CURSOR_START, recent, "read_at", now) == trailing
+    # and a cursor already inside it is pulled back
+    assert main.next_chat_cursor((now, ObjectId()), [], "read_at", now) == trailing
+
+
+def test_cursor_query_breaks_ties_on_id(main):
+    moment, object_id = datetime(2026, 1, 5, 12, 0), ObjectId()
+    assert main.after_chat_cursor("created_at", (moment, object_id)) == {
+        "$or": [{"created_at": {"$gt": moment}}, {"created_at": moment, "_id": {"$gt": object_id}}]
+    }
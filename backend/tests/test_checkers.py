@@ -0,0 +1,144 @@
+"""Output checkers, fed the way the sandbox feeds them: stdout in arbitrary chunks as it
+arrives, then the kept output for the final verdict."""
+import os
+import threading
+
+import pytest
+
+
+def verdict(main, spec: dict, expected: str, output: str, chunk_size: int = 0, test_input: str = "") -> bool:
+    checker = main.build_checker(spec, expected, test_input)
+    data = output.encode()
+    if checker.streaming:
+        chunks = [data[start:start + chunk_size] for start in range(0, len(data), chunk_size)] if chunk_size else [data]
+        if not all(checker.feed(memoryview(chunk)) for chunk in chunks):
+            return False
+    return checker.finish(output)
+
+
+@pytest.mark.parametrize("chunk_size", [0, 1, 3])
+@pytest.mark.parametrize("output, accepted", [
+    ("1 2\n3\n", True),
+    ("  \n1 2\n3", True),
+    ("1 2\n3\n\n\n   \n", True),
+    ("1  2\n3\n", False),
+    ("1 2\n", False),
+    ("1 2\n3\n4\n", False),
+    ("1 2\n3  \n4", False),
+    ("", False)
+])
+def test_exact_checker(main, output, accepted, chunk_size):
+    assert verdict(main, {"type": "exact"}, "1 2\n3\n", output, chunk_size) is accepted
+
+
+def test_exact_checker_on_whitespace_only_expected_output(main):
+    assert verdict(main, {"type": "exact"}, "\n", "  \n", 1)
+    assert not verdict(main, {"type": "exact"}, "\n", "0\n", 1)
+
+
+@pytest.mark.parametrize("chunk_size", [0, 1, 2])
+@pytest.mark.parametrize("output, accepted", [
+    ("10 20\n30\n", True),
+    ("10\n20   30", True),
+    ("\t10 20 30 \n\n", True),
+    ("10 20\n3 0\n", False),
+    ("10 20\n", False),
+    ("10 20 30 40", False),
+    ("10 200 30", False)
+])
+def test_token_checker(main, output, accepted, chunk_size):
+    assert verdict(main, {"type": "tokens"}, "10 20\n30\n", output, chunk_size) is accepted
+
+
+def test_token_checker_rejects_an_overlong_token_before_it_ends(main):
+    checker = main.build_checker({"type": "tokens"}, "yes", "")
+    assert not all(checker.feed(b"y" * 100) for _ in range(2))
+
+
+@pytest.mark.parametrize("output, accepted", [
+    ("0.333333 2", True),
+    ("0.3333333333 2.0000000001", True),
+    ("3.33333e-1 2", True),
+    ("0.334 2", False),
+    ("0.333333 two", False),
+    ("0.333333", False)
+])
+def test_float_checker(main, output, accepted):
+    assert verdict(main, {"type": "float", "tolerance": 1e-6}, "0.3333333 2", output, 2) is accepted
+
+
+def test_float_checker_tolerance(main):
+    assert verdict(main, {"type": "float", "tolerance": 0.01}, "1.00", "1.009")
+    assert not verdict(main, {"type": "float", "tolerance": 0.01}, "1.00", "1.02")
+    # Without one, the default applies
+    assert verdict(main, {"type": "float"}, "1.00", "1.0000001")
+    assert not verdict(main, {"type": "float"}, "1.00", "1.001")
+
+
+SORTED_CHECKER = """import json, sys
+payload = json.load(sys.stdin)
+numbers = payload["input"].split()
+sys.exit(0 if payload["output"].split() == sorted(numbers, key=int) else 1)
+"""
+
+
+def test_script_checker(main):
+    spec = {"type": "script", "script": SORTED_CHECKER}
+    assert verdict(main, spec, "", "1 2 3\n", test_input="3 1 2")
+    assert not verdict(main, spec, "", "3 1 2\n", test_input="3 1 2")
+
+
+def test_script_checker_sees_the_fields_as_text(main):
+    script = """import json, sys
+payload = json.load(sys.stdin)
+sys.exit(0 if (payload["input"], payload["expected_output"], payload["output"]) == ("a\\"b", "\\u00e9\\n", "x\\ty") else 1)
+"""
+    assert verdict(main, {"type": "script", "script": script}, "é\n", "x\ty", test_input='a"b')
+
+
+def test_script_checker_times_out(main, monkeypatch):
+    monkeypatch.setattr(main, "CHECKER_SCRIPT_TIMEOUT", 0.5)
+    checker = main.build_checker({"type": "script", "script": "while True: pass"}, "", "")
+    assert not checker.finish("")
+    assert checker.timed_out
+
+
+def collect(main, output: bytes, limit: int, keep: int, consumer):
+    read_end, write_end = os.pipe()
+    writer = threading.Thread(target=lambda: (os.write(write_end, output), os.close(write_end)))
+    writer.start()
+    with os.fdopen(read_end, "rb", buffering=0) as stream:
+        collector = main.OutputCollector(stream, limit, keep, consumer)
+        while collector.read():
+            pass
+    writer.join()
+    return collector
+
+
+def test_output_collector_streams_everything_to_the_checker_but_keeps_a_prefix(main):
+    expected = "".join(f"{number}\n" for number in range(20000))
+    checker = main.build_checker({"type": "tokens"}, expected, "")
+    collector = collect(main, expected.encode(), limit=len(expected) * 2, keep=100, consumer=checker.feed)
+    assert not collector.rejected and not collector.exceeded
+    assert collector.size == len(expected)
+    assert collector.getvalue() == expected.encode()[:100]
+    assert checker.finish(collector.getvalue().decode())
+
+
+def test_output_collector_stops_once_the_checker_rejects(main):
+    expected = "".join(f"{number}\n" for number in range(20000))
+    wrong = "0\n1\n5\n" + expected
+    checker = main.build_checker({"type": "exact"}, expected, "")
+    read_end, write_end = os.pipe()
+    os.write(write_end, wrong.encode()[:4096])
+    with os.fdopen(read_end, "rb", buffering=0) as stream:
+        collector = main.OutputCollector(stream, len(wrong), 100, checker.feed)
+        assert not collector.read()
+    os.close(write_end)
+    assert collector.rejected
+
+
+def test_output_collector_stops_past_the_limit(main):
+    collector = collect(main, b"x" * 5000, limit=1000, keep=None, consumer=None)
+    assert collector.exceeded
+    assert collector.getvalue() == b"x" * 1000
@@ -0,0 +1,83 @@
+"""FairQueue: lanes in priority order, deficit round robin between users within a lane."""
+from concurrent.futures import Future
+
+import pytest
+
+
+@pytest.fixture
+def queue(main):
+    return main.FairQueue(["contest", "practice", "rejudge"], quantum=2)
+
+
+@pytest.fixture
+def push(main, queue):
+    """Queue a job named name; its args carry the name back out"""
+    def push_job(name: str, user: str, lane: str = "practice", cost: int = 1):
+        job = main.JudgeJob(None, (name,), user, lane, cost, Future())
+        queue.push(job)
+        return job
+    return push_job
+
+
+def drain(queue) -> list:
+    order = []
+    while (job := queue.pop()) is not None:
+        order.append(job.args[0])
+    return order
+
+
+def test_users_take_turns(queue, push):
+    for number in range(4):
+        push(f"a{number}", "alice")
+    push("b0", "bob")
+    push("c0", "carol")
+    push("b1", "bob")
+
+    # Two cost units each per round; alice went first so she leads each round
+    assert drain(queue) == ["a0", "a1", "b0", "b1", "c0", "a2", "a3"]
+
+
+def test_turns_are_weighed_by_cost(queue, push):
+    push("big", "alice", cost=4)
+    for number in range(6):
+        push(f"b{number}", "bob")
+
+    # alice saves up over two rounds for her one expensive job, bob spends his as he goes
+    assert drain(queue) == ["b0", "b1", "big", "b2", "b3", "b4", "b5"]
+
+
+def test_lanes_go_in_priority_order(queue, push):
+    push("rejudge", "admin", lane="rejudge")
+    push("practice", "alice")
+    push("contest", "bob", lane="contest")
+
+    assert drain(queue) == ["contest", "practice", "rejudge"]
+
+
+def test_cancelled_jobs_are_dropped(queue, push):
+    gone = push("gone", "alice", cost=3)
+    push("kept", "alice")
+    push("b0", "bob")
+    gone.future.cancel()  # The caller went away
+
+    assert drain(queue) == ["kept", "b0"]
+    assert len(queue) == 0
+    assert queue.cost == 0
+
+
+def test_sizes(queue, push):
+    push("a0", "alice", cost=3)
+    push("a1", "alice", lane="rejudge")
+    push("b0", "bob", cost=2)
+
+    assert len(queue) == 3
+    assert queue.lane_size("practice") == 2
+    assert queue.lane_size("rejudge") == 1
+    assert queue.lane_size("contest") == 0
+    assert queue.cost == 6
+    queue.pop()
+    assert len(queue) == 2
+    # An emptied user queue gives up its turn and credit
+    drain(queue)
+    assert queue.deficits == {}
+    assert queue.user_jobs == {}
@@ -0,0 +1,136 @@
+"""End-to-end tests of remote judging: real judge worker processes (`python main.py judge`)
+against a throwaway mongod. Skipped when no mongod binary is on PATH."""
+import os
+import socket
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from conftest import MONGOD, wait_for
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(MONGOD is None, reason="needs a mongod binary on PATH")
+
+# Sleeps so jobs outlast worker startup and every worker gets some of the queue
+SLOW_SUM = "import time\ntime.sleep(0.5)\na, b = map(int, input().split())\nprint(a + b)"
+
+
+@pytest.fixture
+def start_worker(mongodb_url, tmp_path):
+    workers = []
+
+    def start() -> str:
+        log_path = tmp_path / f"worker-{len(workers)}.log"
+        env = {
+            **os.environ,
+            "MONGODB_URL": mongodb_url,
+            "JUDGE_MODE": "remote",
+            "JUDGE_WORKERS": "1",
+            "JUDGE_LEASE_SECONDS": "3",
+            "JUDGE_POLL_SECONDS": "0.1",
+            "TEST_DATA_GRIDFS": "true",
+            "TEST_DATA_DIR": str(tmp_path / f"test-data-{len(workers)}"),
+            "SANDBOX_ALLOW_UNLIMITED_PROCESSES": "true",
+            "PYTHONUNBUFFERED": "1"
+        }
+        with open(log_path, "w") as log:
+            process = subprocess.Popen(
+                [sys.executable, "main.py", "judge"], cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+            )
+        workers.append(process)
+        wait_for(lambda: process.poll() is None and "started" in log_path.read_text(), timeout=60)
+        return f"{socket.gethostname()}:{process.pid}"
+
+    yield start
+    for process in workers:
+        process.kill()
+        process.wait()
+
+
+def create_pending_submission(db, challenge_id: ObjectId, **job_fields) -> ObjectId:
+    """A pending submission and its judge job, as POST /submissions/ stores them in remote mode"""
+    user_id = ObjectId()
+    submission_id = db.submissions.insert_one({
+        "challenge_id": challenge_id,
+        "user_id": user_id,
+        "code": SLOW_SUM,
+        "language": "python",
+        "submitted_at": datetime.utcnow(),
+        "status": "Pending",
+        "points_earned": 0,
+        "test_results": []
+    }).inserted_id
+    db.judge_jobs.insert_one({
+        "submission_id": submission_id,
+        "challenge_id": challenge_id,
+        "user_id": user_id,
+        "lane": "practice",
+        "priority": 1,
+        "status": "queued",
+        "attempts": 0,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "created_at": datetime.utcnow(),
+        **job_fields
+    })
+    return submission_id
+
+
+def create_challenge(db) -> ObjectId:
+    return db.challenges.insert_one({
+        "title": "Sum",
+        "description": "Add two numbers",
+        "difficulty": "easy",
+        "category": "math",
+        "points": 10,
+        "test_cases": [{"input": "1 2", "expected_output": "3"}, {"input": "20 22", "expected_output": "42"}]
+    }).inserted_id
+
+
+def wait_until_judged(db, submission_ids, timeout: float = 120):
+    wait_for(
+        lambda: db.submissions.count_documents({"_id": {"$in": submission_ids}, "status": "Pending"}) == 0,
+        timeout=timeout
+    )
+
+
+def test_workers_drain_the_queue_together(db, start_worker):
+    worker_ids = {start_worker(), start_worker()}
+    challenge_id = create_challenge(db)
+    submission_ids = [create_pending_submission(db, challenge_id) for _ in range(8)]
+
+    wait_until_judged(db, submission_ids)
+
+    statuses = [submission["status"] for submission in db.submissions.find({"_id": {"$in": submission_ids}})]
+    assert statuses == ["Completed"] * len(submission_ids)
+    jobs = list(db.judge_jobs.find({"submission_id": {"$in": submission_ids}}))
+    assert {job["status"] for job in jobs} == {"done"}
+    assert all(job["attempts"] == 1 for job in jobs)
+    # Each job was leased exactly once, and both workers took a share
+    assert {job["lease_owner"] for job in jobs} == worker_ids
+
+
+def test_worker_takes_over_an_expired_lease(db, start_worker):
+    challenge_id = create_challenge(db)
+    # A worker that died mid-judging: its lease ran out and nobody renews it
+    submission_id = create_pending_submission(
+        db,
+        challenge_id,
+        status="running",
+        attempts=1,
+        lease_owner="dead-worker:1",
+        lease_expires_at=datetime.utcnow() - timedelta(seconds=5)
+    )
+    worker_id = start_worker()
+
+    wait_until_judged(db, [submission_id])
+
+    assert db.submissions.find_one({"_id": submission_id})["status"] == "Completed"
+    job = db.judge_jobs.find_one({"submission_id": submission_id})
+    assert job["status"] == "done"
+    assert job["lease_owner"] == worker_id
+    assert job["attempts"] == 2
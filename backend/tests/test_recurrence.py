@@ -0,0 +1,102 @@
+"""Recurring event expansion: the dates a rule yields, and a series' occurrences in a
+range with its exceptions applied."""
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+import pytest
+
+
+def dates(main, rule: dict, first: date, not_before=None, limit: int = 10) -> list:
+    return list(islice(main.recurrence_dates(rule, first, not_before), limit))
+
+
+def test_daily_with_interval_and_count(main):
+    assert dates(main, {"freq": "daily", "interval": 2, "count": 3}, date(2026, 1, 30)) == [
+        date(2026, 1, 30), date(2026, 2, 1), date(2026, 2, 3)
+    ]
+
+
+def test_weekly_on_weekdays(main):
+    # Starts on a Wednesday; the Monday before it isn't part of the series
+    rule = {"freq": "weekly", "by_weekday": [0, 2], "until": "2026-01-19"}
+    assert dates(main, rule, date(2026, 1, 7)) == [
+        date(2026, 1, 7), date(2026, 1, 12), date(2026, 1, 14), date(2026, 1, 19)
+    ]
+
+
+def test_weekly_defaults_to_the_first_days_weekday(main):
+    assert dates(main, {"freq": "weekly", "interval": 2, "count": 3}, date(2026, 1, 7)) == [
+        date(2026, 1, 7), date(2026, 1, 21), date(2026, 2, 4)
+    ]
+
+
+def test_monthly_and_yearly_skip_missing_days(main):
+    assert dates(main, {"freq": "monthly", "count": 3}, date(2026, 1, 31)) == [
+        date(2026, 1, 31), date(2026, 3, 31), date(2026, 5, 31)
+    ]
+    assert dates(main, {"freq": "yearly", "count": 2}, date(2024, 2, 29)) == [date(2024, 2, 29), date(2028, 2, 29)]
+
+
+@pytest.mark.parametrize("rule", [
+    {"freq": "daily", "interval": 3},
+    {"freq": "weekly", "interval": 2, "by_weekday": [1, 4, 6]},
+    {"freq": "monthly", "interval": 5},
+    {"freq": "yearly"}
+])
+def test_skipping_ahead_yields_what_generating_everything_would(main, rule):
+    first = date(2020, 1, 31)
+    not_before = date(2031, 6, 15)
+    everything = [day for day in dates(main, rule, first, limit=5000) if day >= not_before][:5]
+    skipped = [day for day in dates(main, rule, first, not_before, limit=50) if day >= not_before][:5]
+    assert len(everything) == 5
+    assert skipped == everything
+
+
+def test_series_end(main):
+    start = datetime(2026, 1, 7, 9, 30)
+    assert main.recurrence_series_end({"freq": "daily", "count": 3}, start) == datetime(2026, 1, 9, 9, 30)
+    assert main.recurrence_series_end({"freq": "weekly", "until": "2026-02-01"}, start) == datetime(2026, 1, 28, 9, 30)
+    assert main.recurrence_series_end({"freq": "daily"}, start) is None
+    assert main.recurrence_series_end(None, start) is None
+
+
+@pytest.fixture
+def standup() -> dict:
+    return {
+        "_id": "series",
+        "title": "Standup",
+        "start": datetime(2026, 1, 5, 9, 0),
+        "end": datetime(2026, 1, 5, 9, 15),
+        "recurrence": {"freq": "daily"},
+        "exdates": ["2026-01-07"],
+        "overrides": {"2026-01-08": {"time": "10:30", "title": "Late standup"}}
+    }
+
+
+def test_occurrences_in_a_range(main, standup):
+    occurrences = main.expand_event_occurrences(standup, datetime(2026, 1, 6), datetime(2026, 1, 9))
+
+    assert [occurrence["_id"] for occurrence in occurrences] == ["series:2026-01-06", "series:2026-01-08"]
+    moved = occurrences[1]
+    assert (moved["title"], moved["start"], moved["end"]) == (
+        "Late standup", datetime(2026, 1, 8, 10, 30), datetime(2026, 1, 8, 10, 45)
+    )
+    assert (moved["series_id"], moved["occurrence_date"]) == ("series", "2026-01-08")
+    assert "exdates" not in moved and "overrides" not in moved
+    # The stored series is left as it was
+    assert standup["title"] == "Standup"
+
+
+def test_range_bounds(main, standup):
+    # An occurrence starting before lo is left out even when it is still running at lo
+    occurrences = main.expand_event_occurrences(standup, datetime(2026, 1, 6, 9, 5), datetime(2026, 1, 10, 9, 0))
+    assert [occurrence["date"] for occurrence in occurrences] == ["2026-01-08", "2026-01-09"]
+
+
+def test_open_ranges_are_capped(main, standup, monkeypatch):
+    occurrences = main.expand_event_occurrences(standup, None, None)
+    assert occurrences[0]["start"] == standup["start"]
+    assert occurrences[-1]["start"] < standup["start"] + main.EVENT_EXPANSION_HORIZON
+
+    monkeypatch.setattr(main, "EVENT_MAX_OCCURRENCES", 10)
+    assert len(main.expand_event_occurrences(standup, standup["start"], standup["start"] + timedelta(days=100))) == 10
@@ -0,0 +1,70 @@
+"""TDigest: quantile estimates close to exact ones, in bounded space, whichever way the
+sample was put together."""
+import random
+
+import pytest
+
+
+def exact_quantile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@pytest.fixture
+def runtimes() -> list:
+    generator = random.Random(7)
+    return [generator.lognormvariate(-3, 0.8) for _ in range(5000)]
+
+
+def test_empty_and_single_value(main):
+    assert main.TDigest().quantile(0.5) is None
+    digest = main.TDigest()
+    digest.add(0.25)
+    assert digest.quantile(0.1) == digest.quantile(0.9) == 0.25
+
+
+def test_quantiles_are_close_to_exact(main, runtimes):
+    digest = main.TDigest()
+    for runtime in runtimes:
+        digest.add(runtime)
+
+    assert digest.count == len(runtimes)
+    assert len(digest.centroids) <= 5 * digest.compression
+    for q in (0.1, 0.5, 0.9, 0.99):
+        # Within a percentile of rank
+        estimate = digest.quantile(q)
+        assert exact_quantile(runtimes, q - 0.01) <= estimate <= exact_quantile(runtimes, q + 0.01)
+
+
+def test_merged_digests_match_one_built_whole(main, runtimes):
+    whole = main.TDigest()
+    for runtime in runtimes:
+        whole.add(runtime)
+    merged = main.TDigest()
+    for start in range(0, len(runtimes), 700):
+        merged.merge(main.TDigest([[runtime, 1] for runtime in runtimes[start:start + 700]]))
+
+    assert merged.count == whole.count
+    for q in (0.1, 0.5, 0.9):
+        assert merged.quantile(q) == pytest.approx(whole.quantile(q), rel=0.05)
+
+
+def test_round_trips_through_its_stored_form(main, runtimes):
+    digest = main.TDigest()
+    for runtime in runtimes[:500]:
+        digest.add(runtime)
+    # As kept on the challenge document
+    stored = [list(centroid) for centroid in digest.centroids]
+
+    restored = main.TDigest(stored)
+    assert restored.centroids == digest.centroids
+    assert restored.quantile(0.9) == digest.quantile(0.9)
+
+
+def test_weighted_values(main):
+    digest = main.TDigest([[1.0, 90], [10.0, 10]])
+    assert digest.count == 100
+    assert digest.quantile(0.3) == 1.0
+    # Between the two centroids' centers, at ranks 45 and 95
+    assert digest.quantile(0.5) == pytest.approx(1.9)
+    assert digest.quantile(0.99) == 10.0
@@ -0,0 +1,70 @@
+"""TimingWheel, driven by explicit times rather than the clock."""
+from datetime import timedelta
+
+import pytest
+
+
+@pytest.fixture
+def wheel(main):
+    wheel = main.TimingWheel(slots=8, tick_seconds=1)
+    wheel.current = wheel.tick_of(wheel.EPOCH + timedelta(days=20000)) - 1
+    return wheel
+
+
+def at(wheel, seconds: float):
+    """seconds after the tick the wheel is about to process"""
+    return wheel.EPOCH + timedelta(seconds=(wheel.current + 1) * wheel.tick_seconds + seconds)
+
+
+def test_entries_fire_on_their_tick(wheel):
+    start = at(wheel, 0)
+    wheel.schedule("b", start + timedelta(seconds=5), "B")
+    wheel.schedule("a", start + timedelta(seconds=2.5), "A")
+
+    assert wheel.advance(start + timedelta(seconds=1)) == []
+    assert wheel.advance(start + timedelta(seconds=2)) == [("a", "A")]
+    assert len(wheel) == 1
+    assert wheel.advance(start + timedelta(seconds=7)) == [("b", "B")]
+    assert len(wheel) == 0
+
+
+def test_overdue_entries_fire_on_the_next_tick(wheel):
+    start = at(wheel, 0)
+    wheel.schedule("late", start - timedelta(hours=1))
+    assert wheel.advance(start) == [("late", None)]
+
+
+def test_entries_more_than_a_revolution_out_wait_their_turn(wheel):
+    start = at(wheel, 0)
+    # Both land in the same slot
+    wheel.schedule("near", start + timedelta(seconds=3))
+    wheel.schedule("far", start + timedelta(seconds=3 + 8 * 2))
+
+    assert wheel.advance(start + timedelta(seconds=3)) == [("near", None)]
+    assert wheel.advance(start + timedelta(seconds=11)) == []
+    assert wheel.advance(start + timedelta(seconds=19)) == [("far", None)]
+
+
+def test_cancel_and_reschedule(wheel):
+    start = at(wheel, 0)
+    wheel.schedule("moved", start + timedelta(seconds=1), "first")
+    wheel.schedule("moved", start + timedelta(seconds=4), "second")
+    wheel.schedule("dropped", start + timedelta(seconds=2))
+    wheel.cancel("dropped")
+    wheel.cancel("never scheduled")
+
+    assert len(wheel) == 1
+    assert wheel.advance(start + timedelta(seconds=3)) == []
+    assert wheel.advance(start + timedelta(seconds=4)) == [("moved", "second")]
+
+
+def test_catches_up_after_a_stall(wheel):
+    start = at(wheel, 0)
+    for second in range(30):
+        wheel.schedule(second, start + timedelta(seconds=second))
+
+    fired = wheel.advance(start + timedelta(minutes=5))
+    assert sorted(key for key, _ in fired) == list(range(30))
+    assert len(wheel) == 0
+    # Nothing fires twice or goes back in time
+    assert wheel.advance(start) == []
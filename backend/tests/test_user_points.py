@@ -0,0 +1,142 @@
+"""Points and stats upkeep for the admin jobs against a throwaway mongod: settling solvers
+and stats after a rejudge, and taking a deleted challenge's points back."""
+import asyncio
+import importlib
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def main(mongodb_url, monkeypatch):
+    monkeypatch.setenv("MONGODB_URL", mongodb_url)
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    return importlib.import_module("main")
+
+
+@pytest.fixture
+def run(main, mongodb_url, monkeypatch):
+    """Run a coroutine function with main's database on a client of the test's own loop"""
+    def run_with(function, *args):
+        async def runner():
+            client = AsyncIOMotorClient(mongodb_url)
+            monkeypatch.setattr(main, "client", client)
+            monkeypatch.setattr(main, "db", client.createathon)
+            try:
+                return await function(*args)
+            finally:
+                client.close()
+        return asyncio.run(runner())
+    return run_with
+
+
+def create_submission(db, user_id, challenge_id, status, minutes_ago, points_earned=0) -> ObjectId:
+    return db.submissions.insert_one({
+        "challenge_id": challenge_id,
+        "user_id": user_id,
+        "code": "print(3)",
+        "language": "python",
+        "status": status,
+        "points_earned": points_earned,
+        "test_results": [],
+        "submitted_at": datetime.utcnow() - timedelta(minutes=minutes_ago)
+    }).inserted_id
+
+
+def test_reconcile_challenge_solvers(db, main, run):
+    # Worth 20 when it was first solved, 10 now
+    challenge = {"_id": db.challenges.insert_one({"title": "Sum", "points": 10}).inserted_id, "points": 10}
+    kept, lost, new, moved = (
+        db.users.insert_one({"username": name, "points": points, "completed_challenges": solved}).inserted_id
+        for name, points, solved in [
+            ("kept", 20, [challenge["_id"]]),
+            ("lost", 25, [str(challenge["_id"])]),
+            ("new", 0, []),
+            ("moved", 20, [challenge["_id"]])
+        ]
+    )
+    kept_first = create_submission(db, kept, challenge["_id"], "Completed", 9, points_earned=20)
+    # Stored before user ids were ObjectIds; failed on the rejudge
+    lost_first = create_submission(db, str(lost), challenge["_id"], "Failed", 8, points_earned=20)
+    new_first = create_submission(db, new, challenge["_id"], "Failed", 7)
+    new_second = create_submission(db, new, challenge["_id"], "Completed", 6)
+    moved_first = create_submission(db, moved, challenge["_id"], "Failed", 5, points_earned=20)
+    moved_second = create_submission(db, moved, challenge["_id"], "Completed", 4)
+
+    run(main.reconcile_challenge_solvers, challenge)
+    # Repeating it, as a job resumed after a crash would, changes nothing
+    run(main.reconcile_challenge_solvers, challenge)
+
+    users = {user["username"]: user for user in db.users.find()}
+    assert (users["kept"]["points"], users["kept"]["completed_challenges"]) == (20, [challenge["_id"]])
+    assert (users["lost"]["points"], users["lost"]["completed_challenges"]) == (5, [])
+    assert (users["new"]["points"], users["new"]["completed_challenges"]) == (10, [challenge["_id"]])
+    assert (users["moved"]["points"], users["moved"]["completed_challenges"]) == (20, [challenge["_id"]])
+    earned = {submission["_id"]: submission["points_earned"] for submission in db.submissions.find()}
+    assert earned == {
+        kept_first: 20,
+        lost_first: 0,
+        new_first: 0,
+        new_second: 10,
+        moved_first: 0,
+        moved_second: 20
+    }
+
+
+def test_rebuild_challenge_stats(db, main, run):
+    challenge = {"_id": db.challenges.insert_one({
+        "title": "Sum", "points": 10, "stats": {"attempts": 9, "accepted": 9, "unique_solvers": 9}
+    }).inserted_id}
+    solver = ObjectId()
+    create_submission(db, solver, challenge["_id"], "Completed", 3)
+    create_submission(db, str(solver), challenge["_id"], "Completed", 2)
+    create_submission(db, ObjectId(), challenge["_id"], "Failed", 1)
+    create_submission(db, ObjectId(), challenge["_id"], "Pending", 0)
+    db.submissions.update_many({"status": "Completed"}, {"$set": {"execution_time": 0.01}})
+
+    run(main.rebuild_challenge_stats, challenge)
+
+    stats = db.challenges.find_one({"_id": challenge["_id"]})["stats"]
+    assert (stats["attempts"], stats["accepted"], stats["unique_solvers"]) == (3, 2, 1)
+    assert stats["median_runtime"] == 0.01
+    assert stats["digest_version"] == 1
+
+
+def test_delete_challenge_job_takes_off_the_points_it_awarded(db, main, run):
+    # Worth 8 when it was solved, 5 now; the deletion mustn't revalue it
+    kept = db.challenges.insert_one({"title": "Kept", "points": 5}).inserted_id
+    # Already gone, as admin_delete_challenge leaves it
+    deleted = ObjectId()
+    solver = db.users.insert_one({"username": "solver", "points": 28, "completed_challenges": [deleted, kept]}).inserted_id
+    legacy = db.users.insert_one({"username": "legacy", "points": 18, "completed_challenges": [str(deleted), kept]}).inserted_id
+    failer = db.users.insert_one({"username": "failer", "points": 8, "completed_challenges": [kept]}).inserted_id
+    create_submission(db, solver, deleted, "Completed", 2, points_earned=20)
+    create_submission(db, solver, deleted, "Completed", 1)
+    create_submission(db, solver, kept, "Completed", 1, points_earned=8)
+    # Stored before user ids were ObjectIds
+    create_submission(db, str(legacy), deleted, "Completed", 2, points_earned=10)
+    create_submission(db, str(legacy), kept, "Completed", 1, points_earned=8)
+    create_submission(db, failer, deleted, "Failed", 2)
+    create_submission(db, failer, kept, "Completed", 1, points_earned=8)
+    job = {
+        "_id": ObjectId(), "type": "delete_challenge", "challenge_id": deleted, "status": "running",
+        "progress": {"total": None, "processed": 0}, "checkpoint": None, "lease_owner": "worker"
+    }
+    db.admin_jobs.insert_one(dict(job))
+
+    run(main.delete_challenge_job, job, "worker")
+    # Running it again, as a job resumed after a crash would, changes nothing
+    run(main.delete_challenge_job, job, "worker")
+
+    for user in db.users.find():
+        assert user["points"] == 8
+        assert user["completed_challenges"] == [kept]
+    assert db.submissions.count_documents({"challenge_id": deleted}) == 0
+    assert db.submissions.count_documents({"challenge_id": kept}) == 3
+    assert db.admin_jobs.find_one({"_id": job["_id"]})["progress"]["users"] == 2
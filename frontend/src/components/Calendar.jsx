@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../hooks/useAuth';
-import { getUserEvents, getEventsByDateRange, createEvent, updateEvent, deleteEvent, formatDateForAPI, getAllEventsForUser } from '../services/eventService';
+import { getUserEvents, getEventsByDateRange, createEvent, updateEvent, deleteEvent, addEventException, formatDateForAPI, getAllEventsForUser, watchReminders, markNotificationAsRead } from '../services/eventService';
 import EventModal from './EventModal';
 import EventDetails from './EventDetails';
 import EventListModal from './EventListModal';
@@ -37,6 +37,15 @@ const Calendar = () => {
     }
   }, [currentMonth, currentYear, isAuthenticated]);
 
+  // Reminders are scheduled and fired by the server; just surface them
+  useEffect(() => {
+    if (!isAuthenticated) return;
+    return watchReminders((notification) => {
+      showToast(`Reminder: ${notification.message}`, 'info');
+      markNotificationAsRead(notification._id).catch(() => {});
+    });
+  }, [isAuthenticated]);
+
   const loadMonthEvents = async () => {
     try {
       setLoading(true);
@@ -205,7 +214,15 @@ const Calendar = () => {
   // Handler for deleting event from EventListModal
   const handleDeleteEventFromList = async (eventToDelete) => {
     try {
-      await deleteEvent(eventToDelete._id);
+      if (eventToDelete.series_id) {
+        // Only skip this occurrence; the rest of the series stays
+        await addEventException(eventToDelete.series_id, {
+          date: eventToDelete.occurrence_date,
+          cancelled: true
+        });
+      } else {
+        await deleteEvent(eventToDelete._id);
+      }
       showToast('Event deleted successfully', 'success');
       loadMonthEvents(); // Reload events
       
@@ -266,14 +283,29 @@ const Calendar = () => {
     }
   };
 
-  const handleDeleteEvent = async (eventId) => {
-    if (!window.confirm('Are you sure you want to delete this event?')) {
+  const handleDeleteEvent = async (eventToDelete) => {
+    // Occurrences of a repeating event are "seriesid:date" and can't be deleted
+    // directly: either skip this one or delete the whole series
+    let deleteOccurrence = false;
+    if (eventToDelete.series_id) {
+      deleteOccurrence = window.confirm('Delete only this occurrence? Choose Cancel to delete the whole series.');
+      if (!deleteOccurrence && !window.confirm('Delete every occurrence of this event?')) {
+        return;
+      }
+    } else if (!window.confirm('Are you sure you want to delete this event?')) {
       return;
     }
 
     try {
       setLoading(true);
-      await deleteEvent(eventId);
+      if (deleteOccurrence) {
+        await addEventException(eventToDelete.series_id, {
+          date: eventToDelete.occurrence_date,
+          cancelled: true
+        });
+      } else {
+        await deleteEvent(eventToDelete.series_id || eventToDelete._id || eventToDelete.id);
+      }
       await loadMonthEvents();
       setShowEventDetails(false);
       setSelectedEvent(null);
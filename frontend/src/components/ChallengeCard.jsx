@@ -12,6 +12,15 @@ function ChallengeCard({ challenge }) {
       </div>
       <h3>{challenge.title}</h3>
       <p>{challenge.description}</p>
+      {challenge.stats && challenge.stats.attempts > 0 && (
+        <div className="challenge-stats">
+          <span>{challenge.stats.acceptance_rate}% accepted</span>
+          <span>{challenge.stats.unique_solvers} solvers</span>
+          {challenge.stats.median_runtime !== null && (
+            <span>~{challenge.stats.median_runtime}s median</span>
+          )}
+        </div>
+      )}
       <div className="challenge-footer">
         <span className="points">
           <i className="icon-star"></i> {challenge.points} points
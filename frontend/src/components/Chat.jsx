@@ -35,13 +35,12 @@ const Chat = () => {
   const VIRTUAL_ITEM_HEIGHT = 80; // Approximate height per message
   const messagesEndRef = useRef(null);
   const messagesContainerRef = useRef(null);
-  const chatPollingRef = useRef(null);
   const statusPollingRef = useRef(null);
   const typingTimeoutRef = useRef(null);
   const lastMessageCount = useRef(0);
   const messageCache = useRef(new Map());
   const lastFetchTime = useRef(new Map());
-  const isPollingActive = useRef(true);
+  const syncWatermarks = useRef(new Map());
 
   // Initialize chat and update user status
   useEffect(() => {
@@ -55,56 +54,33 @@ const Chat = () => {
     };
   }, []);
 
-  // Set up message polling when a user is selected
+  // Watch the open conversation when a user is selected
   useEffect(() => {
-    if (selectedUser) {
-      fetchMessages();
+    if (!selectedUser) return undefined;
+
+    let cancelled = false;
+
+    const watchConversation = async () => {
+      await fetchMessages();
       markMessagesAsRead(selectedUser.id);
-      
-      // Adaptive polling - slower when inactive, faster when active
-      let pollInterval = 3000; // Default 3 seconds
-      
-      const adaptivePolling = () => {
-        if (!document.hidden && isPollingActive.current) {
-          const timeSinceLastFetch = Date.now() - (lastFetchTime.current.get(selectedUser.id) || 0);
-          
-          // If recent activity, poll more frequently
-          if (timeSinceLastFetch < 30000) { // 30 seconds
-            pollInterval = 2000; // 2 seconds
-          } else if (timeSinceLastFetch < 300000) { // 5 minutes
-            pollInterval = 5000; // 5 seconds
-          } else {
-            pollInterval = 10000; // 10 seconds for idle chats
-          }
-          
-          fetchMessages(true);
-        }
-      };
-      
-      // Start adaptive polling
-      chatPollingRef.current = setInterval(adaptivePolling, pollInterval);
-      
-      // Pause polling when tab is hidden
-      const handleVisibilityChange = () => {
-        isPollingActive.current = !document.hidden;
-      };
-      
-      document.addEventListener('visibilitychange', handleVisibilityChange);
-      
-      return () => {
-        if (chatPollingRef.current) {
-          clearInterval(chatPollingRef.current);
-          chatPollingRef.current = null;
-        }
-        document.removeEventListener('visibilitychange', handleVisibilityChange);
-      };
-    }
+      if (cancelled) return;
+
+      // Long-poll for changes and merge only what is new
+      chatService.startPolling(
+        selectedUser.id,
+        (delta) => {
+          lastFetchTime.current.set(selectedUser.id, Date.now());
+          applyMessageDelta(delta);
+        },
+        syncWatermarks.current.get(selectedUser.id)
+      );
+    };
+
+    watchConversation();
 
     return () => {
-      if (chatPollingRef.current) {
-        clearInterval(chatPollingRef.current);
-        chatPollingRef.current = null;
-      }
+      cancelled = true;
+      chatService.stopPolling();
     };
   }, [selectedUser]);
 
@@ -206,8 +182,24 @@ const Chat = () => {
       return;
     }
     
-    // Check cache first for silent requests
     const cacheKey = selectedUser.id;
+    
+    // Once we hold a watermark, background refreshes only ask for what changed
+    const watermark = syncWatermarks.current.get(cacheKey);
+    if (silent && watermark) {
+      try {
+        const delta = await chatService.syncMessages(selectedUser.id, watermark);
+        if (!delta) return;
+        syncWatermarks.current.set(cacheKey, delta.watermark);
+        lastFetchTime.current.set(cacheKey, Date.now());
+        applyMessageDelta(delta);
+      } catch (error) {
+        console.error('Error syncing messages:', error);
+      }
+      return;
+    }
+    
+    // Check cache first for silent requests
     const cachedMessages = messageCache.current.get(cacheKey);
     const lastFetch = lastFetchTime.current.get(cacheKey) || 0;
     const cacheAge = Date.now() - lastFetch;
@@ -238,6 +230,9 @@ const Chat = () => {
       // Update cache
       messageCache.current.set(cacheKey, transformedMessages);
       lastFetchTime.current.set(cacheKey, Date.now());
+      if (response.watermark) {
+        syncWatermarks.current.set(cacheKey, response.watermark);
+      }
       
       // Check for new messages
       if (silent && transformedMessages.length > lastMessageCount.current) {
@@ -265,6 +260,33 @@ const Chat = () => {
     }
   };
 
+  // Merge a delta sync response into the open conversation
+  const applyMessageDelta = (delta) => {
+    const newMessages = (delta.messages || []).map(msg => ({
+      id: msg.id,
+      senderId: msg.sender_id,
+      receiverId: msg.receiver_id,
+      content: msg.content,
+      timestamp: msg.created_at,
+      read: !!msg.read_at,
+      senderName: msg.sender_name,
+      receiverName: msg.receiver_name
+    }));
+    const readIds = new Set((delta.read_receipts || []).map(receipt => receipt.id));
+    
+    setMessages(prev => {
+      const known = new Set(prev.map(msg => msg.id));
+      const updated = prev.map(msg => (readIds.has(msg.id) ? { ...msg, read: true } : msg));
+      const added = newMessages.filter(msg => !known.has(msg.id));
+      return added.length ? [...updated, ...added] : updated;
+    });
+    
+    if (newMessages.some(msg => msg.senderId === selectedUser.id)) {
+      setHasNewMessages(true);
+      setTimeout(() => setHasNewMessages(false), 3000);
+    }
+  };
+
   const markMessagesAsRead = async (userId) => {
     if (!userId) {
       console.warn('Cannot mark messages as read: userId is undefined');
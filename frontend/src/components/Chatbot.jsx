@@ -9,8 +9,15 @@ const Chatbot = () => {
   const [isLoading, setIsLoading] = useState(false);
   const [isMinimized, setIsMinimized] = useState(true);
   const [showSuggestions, setShowSuggestions] = useState(true);
+  const [isStreaming, setIsStreaming] = useState(false);
   const messagesEndRef = useRef(null);
   const inputRef = useRef(null);
+  const abortRef = useRef(null);
+
+  // Stop any in-flight generation when the widget unmounts
+  useEffect(() => {
+    return () => abortRef.current?.abort();
+  }, []);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -49,25 +56,40 @@ const Chatbot = () => {
       setInputMessage('');
       setIsLoading(true);
 
-      // Send message to API
-      const response = await chatbotService.sendMessage(
+      // Stream the reply into a bot message that grows as tokens arrive
+      const botMessageId = Date.now() + 1;
+      abortRef.current = new AbortController();
+
+      const fullText = await chatbotService.streamMessage(
         validatedMessage,
-        "Interactive Creator Platform coding assistant"
+        "Interactive Creator Platform coding assistant",
+        (token, textSoFar) => {
+          setIsStreaming(true);
+          setMessages(prev => {
+            if (prev.some(message => message.id === botMessageId)) {
+              return prev.map(message =>
+                message.id === botMessageId ? { ...message, text: textSoFar } : message
+              );
+            }
+            return [...prev, chatbotService.createMessage(textSoFar, 'bot', botMessageId)];
+          });
+        },
+        abortRef.current.signal
       );
 
-      if (response.response) {
-        const botMessage = chatbotService.createMessage(response.response, 'bot', Date.now() + 1);
-        setMessages(prev => [...prev, botMessage]);
-      } else {
+      if (!fullText) {
         throw new Error('No response received');
       }
     } catch (error) {
+      if (error.name === 'AbortError') return;
       console.error('Chatbot error:', error);
       const errorText = chatbotService.handleError(error);
-      const errorMessage = chatbotService.createErrorMessage(errorText, Date.now() + 1);
+      const errorMessage = chatbotService.createErrorMessage(errorText, Date.now() + 2);
       setMessages(prev => [...prev, errorMessage]);
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
+      abortRef.current = null;
     }
   };
 
@@ -84,6 +106,7 @@ const Chatbot = () => {
   };
 
   const clearChat = () => {
+    abortRef.current?.abort();
     setMessages([chatbotService.getWelcomeMessage()]);
     setShowSuggestions(true);
     setInputMessage('');
@@ -162,7 +185,7 @@ const Chatbot = () => {
                 </div>
               </div>
             ))}
-            {isLoading && (
+            {isLoading && !isStreaming && (
               <div className="message bot">
                 <div className="message-content">
                   <div className="message-text typing">
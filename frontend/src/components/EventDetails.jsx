@@ -135,7 +135,7 @@ const EventDetails = ({
               <button className="edit-button" onClick={() => onEdit(event)}>
                 Edit Event
               </button>
-              <button className="delete-button" onClick={() => onDelete(event.id)}>
+              <button className="delete-button" onClick={() => onDelete(event)}>
                 Delete Event
               </button>
             </>
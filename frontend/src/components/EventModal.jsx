@@ -17,7 +17,8 @@ const EventModal = ({
     type: EVENT_TYPES.TASK,
     priority: EVENT_PRIORITIES.MEDIUM,
     all_day: false,
-    reminder_minutes: 15
+    reminder_minutes: 15,
+    repeat: ''
   });
 
   const [errors, setErrors] = useState({});
@@ -34,7 +35,8 @@ const EventModal = ({
         type: event.type || EVENT_TYPES.TASK,
         priority: event.priority || EVENT_PRIORITIES.MEDIUM,
         all_day: event.all_day || false,
-        reminder_minutes: event.reminder_minutes || 15
+        reminder_minutes: event.reminder_minutes || 15,
+        repeat: event.recurrence?.freq || ''
       });
     } else if (selectedDate) {
       // Creating new event for selected date
@@ -84,10 +86,23 @@ const EventModal = ({
       return;
     }
     
+    const { repeat, ...fields } = formData;
     const eventData = {
-      ...formData,
-      id: event?.id
+      ...fields,
+      // Editing an occurrence edits its whole series
+      id: event?.series_id || event?._id || event?.id,
+      ...(repeat && {
+        recurrence: event?.recurrence?.freq === repeat ? event.recurrence : { freq: repeat }
+      }),
+      // An explicit null stops an existing series repeating
+      ...(!repeat && event?.recurrence && { recurrence: null }),
+      // Date and time are in the user's zone; reminders are computed from it
+      timezone: event?.timezone || Intl.DateTimeFormat().resolvedOptions().timeZone
     };
+    if (event?.series_id) {
+      // Keep the series anchored on its first occurrence
+      delete eventData.date;
+    }
     
     onSave(eventData);
   };
@@ -101,7 +116,8 @@ const EventModal = ({
       type: EVENT_TYPES.TASK,
       priority: EVENT_PRIORITIES.MEDIUM,
       all_day: false,
-      reminder_minutes: 15
+      reminder_minutes: 15,
+      repeat: ''
     });
     setErrors({});
     onClose();
@@ -237,6 +253,22 @@ const EventModal = ({
             </select>
           </div>
 
+          <div className="form-group">
+            <label htmlFor="repeat">Repeats</label>
+            <select
+              id="repeat"
+              name="repeat"
+              value={formData.repeat}
+              onChange={handleChange}
+            >
+              <option value="">Does not repeat</option>
+              <option value="daily">Daily</option>
+              <option value="weekly">Weekly</option>
+              <option value="monthly">Monthly</option>
+              <option value="yearly">Yearly</option>
+            </select>
+          </div>
+
           <div className="form-actions">
             <button type="button" className="cancel-button" onClick={handleClose}>
               Cancel
@@ -2,10 +2,12 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { useAuth } from '../hooks/useAuth';
-import { getChallengeById, submitChallenge } from '../services/challengeService';
+import { getChallengeById, getSubmission, submitChallenge, watchSubmission } from '../services/challengeService';
 import CodeEditor from '../components/CodeEditor';
 import './ChallengeDetails.css';
 
+const PENDING_POLL_MS = 1000;
+
 function ChallengeDetails() {
   const { id } = useParams();
   const navigate = useNavigate();
@@ -68,10 +70,30 @@ function ChallengeDetails() {
         language
       };
       
-      const result = await submitChallenge(submissionData);
+      let result = await submitChallenge(submissionData);
+      if (result.status === 'Pending') {
+        // Show each test case as soon as it is judged rather than waiting for the verdict
+        setResult({ ...result, test_results: [] });
+        const submissionId = result._id || result.id;
+        try {
+          result = await watchSubmission(submissionId, (event) => {
+            if (event.type === 'case') {
+              setResult((prev) => ({ ...prev, test_results: [...(prev?.test_results || []), event.result] }));
+            }
+          });
+        } catch (streamError) {
+          // Stream unavailable: fall back to polling until the submission is judged
+          console.error(streamError);
+          result = await getSubmission(submissionId);
+          while (result.status === 'Pending') {
+            await new Promise((resolve) => setTimeout(resolve, PENDING_POLL_MS));
+            result = await getSubmission(submissionId);
+          }
+        }
+      }
       setResult(result);
     } catch (err) {
-      setError('Submission failed. Please try again.');
+      setError(err.message || 'Submission failed. Please try again.');
       console.error(err);
     } finally {
       setSubmitting(false);
@@ -209,6 +231,12 @@ function ChallengeDetails() {
                     {result.test_results.map((test, index) => (
                       <li key={index} className={test.passed ? 'passed' : 'failed'}>
                         Test Case {test.test_case}: {test.passed ? 'Passed ✓' : 'Failed ✗'}
+                        {test.cpu_time != null && (
+                          <span className="test-usage">
+                            {Math.round(test.cpu_time * 1000)} ms CPU
+                            {test.max_rss_kb != null && ` · ${(test.max_rss_kb / 1024).toFixed(1)} MB`}
+                          </span>
+                        )}
                         {!test.passed && <p className="error-output">{test.output}</p>}
                       </li>
                     ))}
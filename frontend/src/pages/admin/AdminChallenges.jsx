@@ -15,17 +15,29 @@ import {
   Play,
   CheckCircle,
   XCircle,
-  Clock
+  Clock,
+  RefreshCw
 } from 'lucide-react';
 import { 
   getAllChallenges, 
   updateChallenge, 
-  deleteChallenge 
+  deleteChallenge,
+  rejudgeChallenge,
+  getAdminJob
 } from '../../services/adminService';
 import LoadingSpinner from '../../components/LoadingSpinner';
 import ChallengeModal from '../../components/admin/ChallengeModal';
 import './AdminChallenges.css';
 
+const JOB_POLL_MS = 2000;
+
+const rejudgeLabel = (job) => {
+  if (!job || job.status === 'failed') return 'Rejudge';
+  if (job.status === 'done') return 'Rejudged';
+  if (job.progress.total == null) return 'Queued';
+  return `${job.progress.processed}/${job.progress.total}`;
+};
+
 const AdminChallenges = () => {
   const [challenges, setChallenges] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -44,6 +56,7 @@ const AdminChallenges = () => {
   const [currentPage, setCurrentPage] = useState(1);
   const [challengesPerPage] = useState(15);
   const [modalLoading, setModalLoading] = useState(false);
+  const [rejudgeJobs, setRejudgeJobs] = useState({});
 
   const categories = ['all', 'algorithms', 'data-structures', 'web-development', 'database', 'system-design', 'mathematics'];
   const difficulties = ['all', 'easy', 'medium', 'hard'];
@@ -103,6 +116,26 @@ const AdminChallenges = () => {
     }
   };
 
+  const handleRejudgeChallenge = async (challengeId) => {
+    if (!window.confirm('Rejudge all submissions to this challenge against its current test cases? User points will be recomputed.')) return;
+
+    try {
+      const showJob = (job) => setRejudgeJobs(jobs => ({ ...jobs, [challengeId]: job }));
+      let job = await rejudgeChallenge(challengeId);
+      showJob(job);
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_MS));
+        job = await getAdminJob(job._id || job.id);
+        showJob(job);
+      }
+      if (job.status === 'failed') {
+        setError(`Rejudge failed: ${job.error}`);
+      }
+    } catch (err) {
+      setError(err.message);
+    }
+  };
+
   const handleBulkDelete = async () => {
     if (selectedChallenges.length === 0) return;
     
@@ -398,6 +431,15 @@ const AdminChallenges = () => {
                 <Play size={16} />
                 Test
               </button>
+              <button
+                className="action-btn rejudge"
+                title="Rejudge Submissions"
+                onClick={() => handleRejudgeChallenge(challenge.id)}
+                disabled={['queued', 'running'].includes(rejudgeJobs[challenge.id]?.status)}
+              >
+                <RefreshCw size={16} />
+                {rejudgeLabel(rejudgeJobs[challenge.id])}
+              </button>
               <button
                 className="action-btn copy"
                 title="Duplicate Challenge"
@@ -93,6 +93,26 @@ export const createChallenge = async (challengeData) => {
   }
 };
 
+// Queue a rejudge of every submission to the challenge; resolves with the admin job
+export const rejudgeChallenge = async (challengeId) => {
+  try {
+    const response = await api.post(`/admin/challenges/${challengeId}/rejudge`);
+    return response.data;
+  } catch (error) {
+    throw new Error(error.response?.data?.detail || 'Failed to start rejudge');
+  }
+};
+
+// Admin Jobs
+export const getAdminJob = async (jobId) => {
+  try {
+    const response = await api.get(`/admin/jobs/${jobId}`);
+    return response.data;
+  } catch (error) {
+    throw new Error(error.response?.data?.detail || 'Failed to fetch job');
+  }
+};
+
 // Submission Management
 export const getAllSubmissions = async (skip = 0, limit = 100, challengeId = null, userId = null) => {
   try {
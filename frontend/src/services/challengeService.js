@@ -35,14 +35,73 @@ export const getChallengeById = async (id) => {
   }
 };
 
+const SUBMIT_RETRIES = 2;
+
+const newIdempotencyKey = () =>
+  window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
 export const submitChallenge = async (submissionData) => {
+  // One key per submit: a retry after a dropped connection gets the original result
+  // instead of judging (and scoring) the code again
+  const headers = { 'Idempotency-Key': newIdempotencyKey() };
+  for (let attempt = 0; ; attempt++) {
+    try {
+      // wait=false returns the pending submission at once; progress comes from watchSubmission
+      const response = await api.post('/submissions/', submissionData, { headers, params: { wait: false } });
+      return response.data;
+    } catch (error) {
+      if (!error.response && attempt < SUBMIT_RETRIES) continue;
+      throw new Error(error.response?.data?.detail || 'Submission failed');
+    }
+  }
+};
 
+export const getSubmission = async (id) => {
   try {
-    const response = await api.post('/submissions/', submissionData);
+    const response = await api.get(`/submissions/${id}`);
     return response.data;
   } catch (error) {
-    throw new Error(error.response?.data?.detail || 'Submission failed');
+    throw new Error(error.response?.data?.detail || 'Failed to fetch submission');
+  }
+};
+
+// Follow a submission's judging, calling onEvent with each NDJSON event as it arrives:
+// { type: 'case', total, result } per finished test case, then { type: 'verdict', submission }.
+// Resolves with the judged submission.
+export const watchSubmission = async (id, onEvent = () => {}, signal = undefined) => {
+  const token = localStorage.getItem('token');
+  const response = await fetch(`${api.defaults.baseURL}/submissions/${id}/events`, {
+    headers: token ? { Authorization: `Bearer ${token}` } : {},
+    signal
+  });
+
+  if (!response.ok) {
+    const data = await response.json().catch(() => ({}));
+    throw new Error(data.detail || 'Failed to follow submission');
   }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const event = JSON.parse(line);
+      if (event.type === 'ping') continue;
+      onEvent(event);
+      if (event.type === 'verdict') return event.submission;
+    }
+  }
+
+  throw new Error('Submission stream ended before a verdict');
 };
 
 export const getUserSubmissions = async () => {
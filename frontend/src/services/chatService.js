@@ -37,6 +37,26 @@ class ChatService {
     }
   }
 
+  // Get only what changed in a conversation since a previous response's watermark.
+  // Resolves to null when nothing changed (204), otherwise to
+  // { messages, read_receipts, watermark }.
+  async syncMessages(userId, since, limit = 50) {
+    if (!userId || userId === 'undefined') {
+      console.error('Invalid userId provided to syncMessages:', userId);
+      throw new Error('Invalid user ID');
+    }
+
+    try {
+      const response = await api.get(`/chat/messages/${userId}`, {
+        params: { since, limit }
+      });
+      return response.status === 204 ? null : response.data;
+    } catch (error) {
+      console.error('Error syncing messages:', error);
+      throw error;
+    }
+  }
+
   // Send a message to another user
   async sendMessage(receiverId, content) {
     if (!receiverId || receiverId === 'undefined') {
@@ -108,30 +128,74 @@ class ChatService {
     }
   }
 
-  // Start polling for new messages (fallback for real-time updates)
-  startPolling(userId, callback) {
+  // Long-poll the server until one of our conversations changes.
+  // Resolves to { changed, version }, or null if the wait timed out (204).
+  async waitForChanges(version = null, signal = undefined) {
+    const response = await api.get('/chat/wait', {
+      params: version === null ? {} : { version },
+      signal
+    });
+    return response.status === 204 ? null : response.data;
+  }
+
+  // Fetch what changed in a conversation since the last poll and hand it to the callback
+  async pollOnce(userId, callback) {
+    if (!this.pollingWatermark) {
+      const page = await this.getMessages(userId, 1, 20);
+      this.pollingWatermark = page.watermark;
+      callback(page);
+      return;
+    }
+
+    const delta = await this.syncMessages(userId, this.pollingWatermark);
+    if (delta) {
+      this.pollingWatermark = delta.watermark;
+      callback(delta);
+    }
+  }
+
+  // Watch a conversation for new messages and read receipts.
+  // The server holds each request open until something changes, so an idle chat
+  // costs one request per timeout instead of one every few seconds.
+  // The callback only receives deltas: { messages, read_receipts, watermark }.
+  startPolling(userId, callback, watermark = null) {
     this.stopPolling(); // Stop any existing polling
     
     if (!userId || !callback) return;
     
     this.onMessageReceived = callback;
-    
-    // Poll every 3 seconds for new messages
-    this.pollingInterval = setInterval(async () => {
-      try {
-        const messages = await this.getMessages(userId, 1, 20);
-        callback(messages);
-      } catch (error) {
-        console.error('Polling error:', error);
+    this.pollingWatermark = watermark;
+    const controller = new AbortController();
+    this.pollingController = controller;
+
+    const loop = async () => {
+      let version = null;
+      while (!controller.signal.aborted) {
+        try {
+          const result = await this.waitForChanges(version, controller.signal);
+          if (!result) continue; // Timed out with nothing new
+
+          // The first call returns immediately; sync once to cover anything
+          // that happened before we started waiting
+          version = result.version;
+          await this.pollOnce(userId, callback);
+        } catch (error) {
+          if (controller.signal.aborted) break;
+          console.error('Polling error:', error);
+          // Back off before retrying after network or server errors
+          await new Promise(resolve => setTimeout(resolve, 3000));
+        }
       }
-    }, 3000);
+    };
+
+    loop();
   }
 
   // Stop polling
   stopPolling() {
-    if (this.pollingInterval) {
-      clearInterval(this.pollingInterval);
-      this.pollingInterval = null;
+    if (this.pollingController) {
+      this.pollingController.abort();
+      this.pollingController = null;
     }
   }
 
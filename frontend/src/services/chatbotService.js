@@ -16,6 +16,57 @@ const chatbotService = {
     }
   },
 
+  // Stream a reply from the chatbot, calling onToken with each chunk as it arrives.
+  // Pass an AbortSignal to cancel generation when the user navigates away.
+  streamMessage: async (message, context = null, onToken = () => {}, signal = undefined) => {
+    const token = localStorage.getItem('token');
+    const response = await fetch(`${api.defaults.baseURL}/chatbot/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        ...(token ? { Authorization: `Bearer ${token}` } : {})
+      },
+      body: JSON.stringify({ message, context }),
+      signal
+    });
+
+    if (!response.ok) {
+      const data = await response.json().catch(() => ({}));
+      const error = new Error(data.detail || 'Chatbot request failed');
+      error.response = { status: response.status, data };
+      throw error;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let fullText = '';
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const event = JSON.parse(line);
+        if (event.type === 'token') {
+          fullText += event.text;
+          onToken(event.text, fullText);
+        } else if (event.type === 'error') {
+          const error = new Error(event.response || event.error);
+          error.streamed = fullText;
+          throw error;
+        }
+      }
+    }
+
+    return fullText;
+  },
+
   // Format message for display
   formatMessage: (text) => {
     // Basic text formatting
@@ -5,14 +5,34 @@ const EVENT_ENDPOINTS = {
   EVENTS: '/events',
   USER_EVENTS: '/user/events',
   ADMIN_EVENTS: '/admin/events',
-  PUBLIC_EVENTS: '/public/events'
+  PUBLIC_EVENTS: '/public/events',
+  CALENDAR_FEED: '/calendar/feed',
+  NOTIFICATIONS: '/notifications'
+};
+
+// Last calendar feed response per date range, revalidated with its ETag
+const calendarFeedCache = new Map();
+
+// Event listings come in pages; follow X-Next-Cursor until the last one
+const getAllPages = async (url, params = {}, firstPage = null) => {
+  const events = [];
+  let response = firstPage;
+  let cursor = null;
+  do {
+    if (!response) {
+      response = await api.get(url, { params: cursor ? { ...params, cursor } : params });
+    }
+    events.push(...response.data);
+    cursor = response.headers['x-next-cursor'];
+    response = null;
+  } while (cursor);
+  return events;
 };
 
 // Get all events for the current user
 export const getUserEvents = async () => {
   try {
-    const response = await api.get(EVENT_ENDPOINTS.USER_EVENTS);
-    return response.data;
+    return await getAllPages(EVENT_ENDPOINTS.USER_EVENTS);
   } catch (error) {
     console.error('Error fetching user events:', error);
     throw error;
@@ -22,13 +42,10 @@ export const getUserEvents = async () => {
 // Get events for a specific date range
 export const getEventsByDateRange = async (startDate, endDate) => {
   try {
-    const response = await api.get(`${EVENT_ENDPOINTS.USER_EVENTS}`, {
-      params: {
-        start_date: startDate,
-        end_date: endDate
-      }
+    return await getAllPages(EVENT_ENDPOINTS.USER_EVENTS, {
+      start_date: startDate,
+      end_date: endDate
     });
-    return response.data;
   } catch (error) {
     console.error('Error fetching events by date range:', error);
     throw error;
@@ -38,12 +55,7 @@ export const getEventsByDateRange = async (startDate, endDate) => {
 // Get events for a specific date
 export const getEventsByDate = async (date) => {
   try {
-    const response = await api.get(`${EVENT_ENDPOINTS.USER_EVENTS}`, {
-      params: {
-        date: date
-      }
-    });
-    return response.data;
+    return await getAllPages(EVENT_ENDPOINTS.USER_EVENTS, { date });
   } catch (error) {
     console.error('Error fetching events by date:', error);
     throw error;
@@ -83,6 +95,17 @@ export const deleteEvent = async (eventId) => {
   }
 };
 
+// Cancel or change a single occurrence of a recurring event
+export const addEventException = async (seriesId, exception) => {
+  try {
+    const response = await api.post(`${EVENT_ENDPOINTS.EVENTS}/${seriesId}/exceptions`, exception);
+    return response.data;
+  } catch (error) {
+    console.error('Error updating event occurrence:', error);
+    throw error;
+  }
+};
+
 // Get a specific event by ID
 export const getEventById = async (eventId) => {
   try {
@@ -127,8 +150,7 @@ export const parseDateFromAPI = (dateString) => {
 // Get all admin events (admin only)
 export const getAdminEvents = async () => {
   try {
-    const response = await api.get(EVENT_ENDPOINTS.ADMIN_EVENTS);
-    return response.data;
+    return await getAllPages(EVENT_ENDPOINTS.ADMIN_EVENTS);
   } catch (error) {
     console.error('Error fetching admin events:', error);
     throw error;
@@ -138,13 +160,10 @@ export const getAdminEvents = async () => {
 // Get admin events for a specific date range (admin only)
 export const getAdminEventsByDateRange = async (startDate, endDate) => {
   try {
-    const response = await api.get(EVENT_ENDPOINTS.ADMIN_EVENTS, {
-      params: {
-        start_date: startDate,
-        end_date: endDate
-      }
+    return await getAllPages(EVENT_ENDPOINTS.ADMIN_EVENTS, {
+      start_date: startDate,
+      end_date: endDate
     });
-    return response.data;
   } catch (error) {
     console.error('Error fetching admin events by date range:', error);
     throw error;
@@ -154,8 +173,7 @@ export const getAdminEventsByDateRange = async (startDate, endDate) => {
 // Get public events (available to all users)
 export const getPublicEvents = async () => {
   try {
-    const response = await api.get(EVENT_ENDPOINTS.PUBLIC_EVENTS);
-    return response.data;
+    return await getAllPages(EVENT_ENDPOINTS.PUBLIC_EVENTS);
   } catch (error) {
     console.error('Error fetching public events:', error);
     throw error;
@@ -165,13 +183,10 @@ export const getPublicEvents = async () => {
 // Get public events for a specific date range
 export const getPublicEventsByDateRange = async (startDate, endDate) => {
   try {
-    const response = await api.get(EVENT_ENDPOINTS.PUBLIC_EVENTS, {
-      params: {
-        start_date: startDate,
-        end_date: endDate
-      }
+    return await getAllPages(EVENT_ENDPOINTS.PUBLIC_EVENTS, {
+      start_date: startDate,
+      end_date: endDate
     });
-    return response.data;
   } catch (error) {
     console.error('Error fetching public events by date range:', error);
     throw error;
@@ -231,33 +246,41 @@ export const ADMIN_EVENT_TYPES = {
   OTHER: 'other'
 };
 
-// Get combined events (user + public events)
+// Get combined events (user + public events) from the merged calendar feed
 export const getAllEventsForUser = async (startDate, endDate) => {
+  const cacheKey = `${startDate}:${endDate}`;
+  const cached = calendarFeedCache.get(cacheKey);
+
   try {
-    console.log('Fetching events for date range:', startDate, 'to', endDate);
-    
-    const [userEvents, publicEvents] = await Promise.all([
-      getEventsByDateRange(startDate, endDate),
-      getPublicEventsByDateRange(startDate, endDate)
-    ]);
+    const params = { start: startDate, end: endDate };
+    const response = await api.get(EVENT_ENDPOINTS.CALENDAR_FEED, {
+      params,
+      headers: cached ? { 'If-None-Match': cached.etag } : {},
+      validateStatus: (status) => (status >= 200 && status < 300) || status === 304
+    });
 
-    console.log('User events:', userEvents);
-    console.log('Public events:', publicEvents);
+    // Unchanged month: reuse what we already have
+    if (response.status === 304 && cached) {
+      return cached.events;
+    }
 
     // Mark admin events as such for UI distinction
-    const markedPublicEvents = publicEvents.map(event => ({
-      ...event,
-      isAdminEvent: true,
-      isReadOnly: true
-    }));
-
-    const combinedEvents = [...userEvents, ...markedPublicEvents];
-    console.log('Combined events:', combinedEvents);
-    
-    return combinedEvents;
+    const feed = await getAllPages(EVENT_ENDPOINTS.CALENDAR_FEED, params, response);
+    const events = feed.map(event => (
+      event.is_admin_event
+        ? { ...event, isAdminEvent: true, isReadOnly: true }
+        : event
+    ));
+
+    // The ETag only vouches for the first page, so only single-page months are cached
+    if (response.headers.etag && !response.headers['x-next-cursor']) {
+      calendarFeedCache.set(cacheKey, { etag: response.headers.etag, events });
+    }
+
+    return events;
   } catch (error) {
-    console.error('Error fetching all events for user:', error);
-    // If public events fail, still return user events
+    console.error('Error fetching calendar feed:', error);
+    // If the feed fails, still return user events
     try {
       const fallbackEvents = await getEventsByDateRange(startDate, endDate);
       console.log('Fallback to user events only:', fallbackEvents);
@@ -267,4 +290,59 @@ export const getAllEventsForUser = async (startDate, endDate) => {
       throw error;
     }
   }
-};
\ No newline at end of file
+};
+
+// Watch for event reminders fired by the server.
+// Long-polls /notifications/wait and hands each new unread reminder to the callback.
+// Returns a function that stops watching.
+export const watchReminders = (onReminder) => {
+  const controller = new AbortController();
+  const seen = new Set();
+
+  const loop = async () => {
+    let version = null;
+    while (!controller.signal.aborted) {
+      try {
+        const response = await api.get(`${EVENT_ENDPOINTS.NOTIFICATIONS}/wait`, {
+          params: version === null ? {} : { version },
+          signal: controller.signal
+        });
+        if (response.status === 204) continue; // Timed out with nothing new
+
+        const firstCall = version === null;
+        version = response.data.version;
+        if (firstCall) continue; // Only announce reminders that arrive while watching
+
+        const { data } = await api.get(EVENT_ENDPOINTS.NOTIFICATIONS, {
+          params: { unread_only: true, limit: 10 },
+          signal: controller.signal
+        });
+        data
+          .filter(notification => notification.type === 'event_reminder' && !seen.has(notification._id))
+          .forEach(notification => {
+            seen.add(notification._id);
+            onReminder(notification);
+          });
+      } catch (error) {
+        if (controller.signal.aborted) break;
+        console.error('Reminder polling error:', error);
+        // Back off before retrying after network or server errors
+        await new Promise(resolve => setTimeout(resolve, 3000));
+      }
+    }
+  };
+
+  loop();
+  return () => controller.abort();
+};
+
+// Mark a notification as read
+export const markNotificationAsRead = async (notificationId) => {
+  try {
+    const response = await api.put(`${EVENT_ENDPOINTS.NOTIFICATIONS}/${notificationId}/read`);
+    return response.data;
+  } catch (error) {
+    console.error('Error marking notification as read:', error);
+    throw error;
+  }
+};